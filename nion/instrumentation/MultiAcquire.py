@@ -7,11 +7,12 @@ import os
 import queue
 import threading
 import time
+import typing
 
 # local libraries
 from nion.utils import Event, Geometry
 from nion.data import DataAndMetadata, Calibration
-from nion.instrumentation import camera_base, scan_base, stem_controller
+from nion.instrumentation import camera_base, reduction, scan_base, stem_controller, telemetry
 
 
 class MultiEELSSettings(dict):
@@ -76,6 +77,17 @@ class CameraDataChannel(scan_base.SynchronizedDataChannelInterface):
 
     def update(self, data_and_metadata: DataAndMetadata.DataAndMetadata, state: str, data_shape: Geometry.IntSize,
                dest_sub_area: Geometry.IntRect, sub_area: Geometry.IntRect, view_id):
+        # pass on only the valid rows (sub_area) of the section, which go to dest_sub_area.
+        if tuple(sub_area.size) != tuple(data_and_metadata.collection_dimension_shape):
+            data_and_metadata = DataAndMetadata.new_data_and_metadata(data_and_metadata.data[sub_area.slice],
+                                                                      intensity_calibration=data_and_metadata.intensity_calibration,
+                                                                      dimensional_calibrations=data_and_metadata.dimensional_calibrations,
+                                                                      metadata=data_and_metadata.metadata,
+                                                                      timestamp=data_and_metadata.timestamp,
+                                                                      data_descriptor=data_and_metadata.data_descriptor,
+                                                                      timezone=data_and_metadata.timezone,
+                                                                      timezone_offset=data_and_metadata.timezone_offset)
+            sub_area = Geometry.IntRect(Geometry.IntPoint(), sub_area.size)
         if callable(self.get_parameters_fn):
             parameters = self.get_parameters_fn()
         else:
@@ -226,7 +238,35 @@ class MultiAcquireController:
         time.sleep(self.__active_settings['x_shift_delay'])
 
     def adjust_focus(self, x_shift_ev):
-        pass
+        focus_values = self.get_focus_values(x_shift_ev)
+        if focus_values:
+            self.stem_controller.SetValsAndConfirm(focus_values, 1.0, 1000)
+
+    def get_focus_values(self, x_shift_ev) -> typing.Dict[str, float]:
+        """Return a dict of control name to value that keeps the spectrum in focus at x_shift_ev.
+
+        Subclasses can override this to adjust focus together with the energy offset.
+        """
+        return dict()
+
+    def shift_x_and_adjust_focus(self, eV):
+        # write the shifter and the focus controls with a single batched call so that the instrument only needs one
+        # round trip and one confirmation per spectrum. fall back to separate calls for a callable shifter or if a
+        # subclass implements its own shift or focus adjustment.
+        x_shifter = self.__active_settings['x_shifter']
+        if (callable(x_shifter) or type(self).shift_x is not MultiAcquireController.shift_x or
+                type(self).adjust_focus is not MultiAcquireController.adjust_focus):
+            self.shift_x(eV)
+            self.adjust_focus(eV)
+            return
+        values = dict(self.get_focus_values(eV))
+        if x_shifter:
+            values[x_shifter] = self.zeros['x'] + eV
+        if not values: # do not wait if nothing was done
+            return
+        self.stem_controller.SetValsAndConfirm(values, 1.0, 1000)
+        if x_shifter:
+            time.sleep(self.__active_settings['x_shift_delay'])
 
     def blank_beam(self):
         self.__set_beam_blanker(True)
@@ -285,24 +325,22 @@ class MultiAcquireController:
     def __acquire_multi_acquire_data(self, number_pixels, line_number=0, flyback_pixels=0):
         for parameters in self.__active_spectrum_parameters:
             logging.debug('start preparations')
-            starttime = time.time()
             if self.abort_event.is_set():
                 break
-            self.shift_x(parameters['offset_x'])
-            self.adjust_focus(parameters['offset_x'])
-            frame_parameters = self.camera.get_current_frame_parameters()
-            frame_parameters['exposure_ms'] =  parameters['exposure_ms']
-            frame_parameters['processing'] = 'sum_project' if self.__active_settings['bin_spectra'] else None
-            self.camera.set_current_frame_parameters(frame_parameters)
-            self.camera.acquire_sequence_prepare(parameters['frames']*number_pixels+flyback_pixels)
-            logging.debug('finished preparations in {:g} s'.format(time.time() - starttime))
-            starttime = 0
+            with telemetry.registry.span('multi_acquire.prepare') as span:
+                self.shift_x_and_adjust_focus(parameters['offset_x'])
+                frame_parameters = self.camera.get_current_frame_parameters()
+                frame_parameters['exposure_ms'] =  parameters['exposure_ms']
+                frame_parameters['processing'] = 'sum_project' if self.__active_settings['bin_spectra'] else None
+                self.camera.set_current_frame_parameters(frame_parameters)
+                self.camera.acquire_sequence_prepare(parameters['frames']*number_pixels+flyback_pixels)
+            logging.debug('finished preparations in {:g} s'.format(span.duration))
             logging.debug('start sequence')
-            starttime = time.time()
-            data_element = self.camera.acquire_sequence(parameters['frames']*number_pixels+flyback_pixels)
+            with telemetry.registry.span('multi_acquire.sequence') as span:
+                data_element = self.camera.acquire_sequence(parameters['frames']*number_pixels+flyback_pixels)
             if data_element:
                 data_element = data_element[0]
-            logging.debug('end sequence in {:g} s'.format(time.time() - starttime))
+            logging.debug('end sequence in {:g} s'.format(span.duration))
             if self.abort_event.is_set():
                 break
             start_ev = data_element.get('spatial_calibrations', [{}])[-1].get('offset', 0)
@@ -356,14 +394,16 @@ class MultiAcquireController:
         # make sure we are in a good state to start again
         self.__clean_up()
 
-    def acquire_multi_eels_spectrum(self):
+    def acquire_multi_eels_spectrum(self, settings=None, spectrum_parameters=None):
+        # settings and spectrum_parameters default to the ones of the controller. passing them allows scripted
+        # acquisitions without changing the (persistent) controller settings.
         start_frame_parameters = None
         try:
             if hasattr(self, 'scan_parameters'):
                 delattr(self, 'scan_parameters')
             self.reset_progress_counter()
-            self.__active_settings = copy.deepcopy(self.settings)
-            self.__active_spectrum_parameters = copy.deepcopy(self.spectrum_parameters)
+            self.__active_settings = copy.deepcopy(settings if settings is not None else self.settings)
+            self.__active_spectrum_parameters = copy.deepcopy(spectrum_parameters if spectrum_parameters is not None else self.spectrum_parameters)
             self.abort_event.clear()
             self.__acquisition_finished_event.clear()
             self.__process_and_send_data_thread = threading.Thread(target=self.process_and_send_data)
@@ -405,8 +445,7 @@ class MultiAcquireController:
             self.acquisition_state_changed_event.fire({'message': 'end', 'description': 'single spectrum'})
             if start_frame_parameters:
                 self.camera.set_current_frame_parameters(start_frame_parameters)
-            self.shift_x(0)
-            self.adjust_focus(0)
+            self.shift_x_and_adjust_focus(0)
         self.__queue.join()
         new_data_listener.close()
         del new_data_listener
@@ -508,9 +547,24 @@ class MultiAcquireController:
             except ValueError:
                 pass
 
-    def acquire_multi_eels_spectrum_image(self):
-        self.__active_settings = copy.deepcopy(self.settings)
-        self.__active_spectrum_parameters = copy.deepcopy(self.spectrum_parameters)
+    @staticmethod
+    def __sum_reduced_xdatas(reduced_xdata_list: typing.Optional[typing.List[DataAndMetadata.DataAndMetadata]],
+                             reduction_stage: reduction.ReductionStage) -> typing.List[DataAndMetadata.DataAndMetadata]:
+        # the reducers are prepared again for each frame, so add the maps of the previous frames to the new maps.
+        new_reduced_xdata_list = [xdata for reducer in reduction_stage.reducers for xdata in reducer.get_xdatas()]
+        if reduced_xdata_list:
+            for new_reduced_xdata, reduced_xdata in zip(new_reduced_xdata_list, reduced_xdata_list):
+                data = new_reduced_xdata.data
+                data += reduced_xdata.data
+        return new_reduced_xdata_list
+
+    def acquire_multi_eels_spectrum_image(self, settings=None, spectrum_parameters=None,
+                                          reducers_fn: typing.Callable[[float], typing.Sequence[reduction.SectionReducer]] = None):
+        # reducers_fn, if any, is called with the energy offset of each spectrum and returns the reducers which compute
+        # maps (for instance EELS edge maps) of its spectrum image while it is acquired. the maps are summed over the
+        # frames of the spectrum and sent with the new data ready event after each frame.
+        self.__active_settings = copy.deepcopy(settings if settings is not None else self.settings)
+        self.__active_spectrum_parameters = copy.deepcopy(spectrum_parameters if spectrum_parameters is not None else self.spectrum_parameters)
         self.abort_event.clear()
         self.reset_progress_counter()
         self.__acquisition_finished_event.clear()
@@ -533,16 +587,18 @@ class MultiAcquireController:
             current_time += dest_sub_area.bottom_right[0] * (complete_shape[1] + self.__flyback_pixels) * parameters['exposure_ms']
             self.set_progress_counter(current_time)
             self.new_data_ready_event.fire(data_dict)
+        reduction_stage = None
         try:
             self.acquisition_state_changed_event.fire({'message': 'start', 'description': 'spectrum image'})
             for parameters in self.__active_spectrum_parameters:
                 if self.abort_event.is_set():
                     break
-                self.shift_x(parameters['offset_x'])
-                self.adjust_focus(parameters['offset_x'])
+                self.shift_x_and_adjust_focus(parameters['offset_x'])
                 frame_parameters = self.camera.get_current_frame_parameters()
                 frame_parameters['exposure_ms'] = parameters['exposure_ms']
                 frame_parameters['processing'] = 'sum_project' if self.__active_settings['bin_spectra'] else None
+                reduction_stage = reduction.ReductionStage(reducers_fn(parameters['offset_x'])) if reducers_fn else None
+                reduced_xdata_list = None
                 for n in range(parameters['frames']):
                     if self.abort_event.is_set():
                         break
@@ -559,7 +615,8 @@ class MultiAcquireController:
                     parameters['complete_shape'] = tuple(self.scan_parameters.size)
                     result = self.superscan.grab_synchronized(camera=self.camera, camera_frame_parameters=frame_parameters,
                                                               camera_data_channel=camera_data_channel,
-                                                              scan_frame_parameters=self.scan_parameters)
+                                                              scan_frame_parameters=self.scan_parameters,
+                                                              reduction_stage=reduction_stage)
                     if result is not None:
                         scan_xdata_list, _ = result
                         scan_data_dict = dict()
@@ -568,8 +625,18 @@ class MultiAcquireController:
                         scan_data_dict['parameters'] = parameters.copy()
                         scan_data_dict['settings'] = self.__active_settings
                         self.new_data_ready_event.fire(scan_data_dict)
+                    if reduction_stage:
+                        reduced_xdata_list = self.__sum_reduced_xdatas(reduced_xdata_list, reduction_stage)
+                        reduced_data_dict = dict()
+                        reduced_data_dict['is_reduced_data'] = True
+                        reduced_data_dict['xdata_list'] = reduced_xdata_list
+                        reduced_data_dict['parameters'] = parameters.copy()
+                        reduced_data_dict['settings'] = self.__active_settings
+                        self.new_data_ready_event.fire(reduced_data_dict)
                     new_data_listener.close()
                     new_data_listener = None
+                if reduction_stage:
+                    reduction_stage.close()
         except Exception as e:
             self.acquisition_state_changed_event.fire({'message': 'exception', 'content': str(e)})
             import traceback
@@ -578,11 +645,12 @@ class MultiAcquireController:
             self.cancel()
             raise
         finally:
+            if reduction_stage:
+                reduction_stage.close()
             self.__acquisition_finished_event.set()
             self.acquisition_state_changed_event.fire({'message': 'end', 'description': 'spectrum image'})
             self.acquisition_state_changed_event.fire({'message': 'end processing'})
             # TODO: configure line repeat
-            self.shift_x(0)
-            self.adjust_focus(0)
+            self.shift_x_and_adjust_focus(0)
             if hasattr(self, 'scan_parameters'):
                 delattr(self, 'scan_parameters')
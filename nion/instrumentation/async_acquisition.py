@@ -0,0 +1,210 @@
+# standard libraries
+import asyncio
+import collections
+import contextlib
+import threading
+import typing
+
+# third party libraries
+import numpy
+
+# local libraries
+from nion.data import DataAndMetadata
+
+
+def _copy_xdatas(xdatas: typing.Sequence[DataAndMetadata.DataAndMetadata],
+                 buffer_xdatas: typing.Optional[typing.Sequence[DataAndMetadata.DataAndMetadata]] = None) -> typing.List[DataAndMetadata.DataAndMetadata]:
+    # the data of delivered frames may still be in use by the low level code; the copies outlive the delivery. the data
+    # of buffer_xdatas, which must no longer be in use, is reused for the copies where the shape and dtype match.
+    buffers = [xdata.data if xdata is not None else None for xdata in buffer_xdatas] if buffer_xdatas else list()
+    copied_xdatas = list()
+    for index, xdata in enumerate(xdatas):
+        if xdata is None or xdata.data is None:
+            copied_xdatas.append(xdata)
+            continue
+        buffer = buffers[index] if index < len(buffers) else None
+        if buffer is not None and buffer.shape == xdata.data.shape and buffer.dtype == xdata.data.dtype:
+            numpy.copyto(buffer, xdata.data)
+        else:
+            buffer = numpy.copy(xdata.data)
+        copied_xdatas.append(xdata.clone_with_data(buffer))
+    return copied_xdatas
+
+
+async def wait_for_playing(hardware_source, is_playing: bool = True, *, timeout: float = None) -> None:
+    """Wait until the hardware source is (or is no longer) playing.
+
+    Raises asyncio.TimeoutError if the state is not reached within timeout seconds.
+    """
+    event_loop = asyncio.get_running_loop()
+    state_changed = asyncio.Event()
+
+    def acquisition_state_changed(*args) -> None:
+        # called on the acquisition thread.
+        event_loop.call_soon_threadsafe(state_changed.set)
+
+    async def wait() -> None:
+        while hardware_source.is_playing != is_playing:
+            await state_changed.wait()
+            state_changed.clear()
+
+    with contextlib.closing(hardware_source.acquisition_state_changed_event.listen(acquisition_state_changed)):
+        await asyncio.wait_for(wait(), timeout)
+
+
+async def grab_next(hardware_source, *, to_start: bool = False, timeout: float = None) -> typing.List[DataAndMetadata.DataAndMetadata]:
+    """Start the hardware source playing if needed and return the next frame.
+
+    If to_start is True, the frame in progress is skipped and the first frame started after this call is returned (like
+    grab_next_to_start); otherwise the next frame to finish is returned (like grab_next_to_finish). An empty list is
+    returned if the acquisition is aborted. Raises asyncio.TimeoutError if no frame arrives within timeout seconds.
+
+    To process a series of frames, use frames instead of calling this repeatedly.
+    """
+    event_loop = asyncio.get_running_loop()
+    future = event_loop.create_future()
+    skip_count = [1 if to_start else 0]
+
+    def resolve(xdatas: typing.List[DataAndMetadata.DataAndMetadata]) -> None:
+        if not future.done():
+            future.set_result(xdatas)
+
+    def receive_new_xdatas(xdatas: typing.Sequence[DataAndMetadata.DataAndMetadata]) -> None:
+        # called on the acquisition thread. frames after the resolving frame are ignored.
+        if skip_count[0] < 0:
+            return
+        if skip_count[0] > 0:
+            skip_count[0] -= 1
+            return
+        skip_count[0] = -1
+        event_loop.call_soon_threadsafe(resolve, _copy_xdatas(xdatas))
+
+    def abort() -> None:
+        event_loop.call_soon_threadsafe(resolve, list())
+
+    with contextlib.closing(hardware_source.xdatas_available_event.listen(receive_new_xdatas)):
+        with contextlib.closing(hardware_source.abort_event.listen(abort)):
+            hardware_source.start_playing()
+            return await asyncio.wait_for(future, timeout)
+
+
+class FrameIterator:
+    """Asynchronously iterate over the frames of a hardware source.
+
+    Frames arrive on the acquisition thread and are copied into a queue for the consumer. If the consumer falls behind
+    by more than max_pending frames, the oldest queued frame is dropped and counted in dropped_count and its buffers are
+    reused for the new frame; received_count counts all frames, including dropped ones. If timeout is set, asyncio.TimeoutError is raised if no
+    frame arrives within timeout seconds. The iterator ends when it is closed; use it as an async context manager to
+    close it when done.
+
+    This is the recommended way to process a series of frames.
+    """
+
+    def __init__(self, hardware_source, *, max_pending: int = 1, timeout: typing.Optional[float] = None):
+        self.__hardware_source = hardware_source
+        self.__timeout = timeout
+        self.__frames: typing.Deque[typing.List[DataAndMetadata.DataAndMetadata]] = collections.deque()
+        self.__max_pending = max(1, max_pending)
+        self.__event_loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self.__frame_available: typing.Optional[asyncio.Event] = None
+        self.__frame_available_pending = False
+        self.__xdatas_available_listener = None
+        self.__lock = threading.RLock()
+        self.__closed = False
+        self.received_count = 0
+        self.dropped_count = 0
+
+    def close(self) -> None:
+        if self.__xdatas_available_listener:
+            self.__xdatas_available_listener.close()
+            self.__xdatas_available_listener = None
+        with self.__lock:
+            self.__closed = True
+        if self.__frame_available:
+            self.__frame_available.set()
+
+    async def __aenter__(self) -> "FrameIterator":
+        self.__start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __aiter__(self) -> "FrameIterator":
+        return self
+
+    async def __anext__(self) -> typing.List[DataAndMetadata.DataAndMetadata]:
+        self.__start()
+        while True:
+            with self.__lock:
+                if self.__frames:
+                    return self.__frames.popleft()
+            if self.__closed:
+                raise StopAsyncIteration
+            await asyncio.wait_for(self.__frame_available.wait(), self.__timeout)
+            self.__frame_available.clear()
+
+    def __start(self) -> None:
+        if self.__event_loop is None and not self.__closed:
+            self.__event_loop = asyncio.get_running_loop()
+            self.__frame_available = asyncio.Event()
+            self.__xdatas_available_listener = self.__hardware_source.xdatas_available_event.listen(self.__xdatas_available)
+
+    def __xdatas_available(self, xdatas: typing.Sequence[DataAndMetadata.DataAndMetadata]) -> None:
+        # called on the acquisition thread. the frame is copied into the queue here so that frames waiting for the
+        # event loop do not pile up; the consumer is woken at most once per pass of the event loop.
+        with self.__lock:
+            if self.__closed:
+                return
+            self.received_count += 1
+            dropped_xdatas = None
+            if len(self.__frames) >= self.__max_pending:
+                dropped_xdatas = self.__frames.popleft()
+                self.dropped_count += 1
+            self.__frames.append(_copy_xdatas(xdatas, dropped_xdatas))
+            notify = not self.__frame_available_pending
+            self.__frame_available_pending = True
+        if notify:
+            self.__event_loop.call_soon_threadsafe(self.__notify_frame_available)
+
+    def __notify_frame_available(self) -> None:
+        with self.__lock:
+            self.__frame_available_pending = False
+        self.__frame_available.set()
+
+
+def frames(hardware_source, *, max_pending: int = 1, timeout: typing.Optional[float] = None) -> FrameIterator:
+    """Return an async iterator over the frames of the hardware source. The hardware source must be started separately."""
+    return FrameIterator(hardware_source, max_pending=max_pending, timeout=timeout)
+
+
+async def run_blocking(fn: typing.Callable[[], typing.Any], abort_fn: typing.Callable[[], None]) -> typing.Any:
+    """Run a blocking acquisition function on the default executor, calling abort_fn if the awaiting task is cancelled.
+
+    On cancellation, the blocking function is given a chance to unwind after abort_fn before the cancellation is
+    propagated so that the hardware is not left in the middle of an acquisition.
+    """
+    event_loop = asyncio.get_running_loop()
+    future = event_loop.run_in_executor(None, fn)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        abort_fn()
+        with contextlib.suppress(Exception):
+            await future
+        raise
+
+
+async def grab_sequence(hardware_source, count: int, **kwargs) -> typing.Optional[typing.List[DataAndMetadata.DataAndMetadata]]:
+    """Grab a sequence of count frames; cancelling the awaiting task aborts the sequence."""
+    return await run_blocking(lambda: hardware_source.grab_sequence(count, **kwargs), hardware_source.grab_sequence_abort)
+
+
+async def grab_synchronized(scan_hardware_source, **kwargs) -> typing.Optional[typing.Tuple[typing.List[DataAndMetadata.DataAndMetadata], typing.List[DataAndMetadata.DataAndMetadata]]]:
+    """Grab a synchronized scan and camera acquisition; cancelling the awaiting task aborts the acquisition."""
+    return await run_blocking(lambda: scan_hardware_source.grab_synchronized(**kwargs), scan_hardware_source.grab_synchronized_abort)
+
+
+async def record_immediate(scan_hardware_source, frame_parameters, **kwargs) -> typing.List[DataAndMetadata.DataAndMetadata]:
+    """Record a scan frame; cancelling the awaiting task aborts the recording."""
+    return await run_blocking(lambda: scan_hardware_source.record_immediate(frame_parameters, **kwargs), scan_hardware_source.abort_recording)
@@ -22,6 +22,8 @@ import numpy
 from nion.data import Calibration
 from nion.data import Core
 from nion.data import DataAndMetadata
+from nion.instrumentation import async_acquisition
+from nion.instrumentation import telemetry
 from nion.swift.model import HardwareSource
 from nion.swift.model import ImportExportManager
 from nion.swift.model import Utility
@@ -370,6 +372,14 @@ class InstrumentController(abc.ABC):
     @abc.abstractmethod
     def TryGetVal(self, s: str) -> (bool, float): ...
 
+    def TryGetVals(self, names: typing.Sequence[str]) -> typing.Dict[str, float]:
+        values = dict()
+        for name in names:
+            valid, value = self.TryGetVal(name)
+            if valid:
+                values[name] = value
+        return values
+
     @abc.abstractmethod
     def get_value(self, value_id: str, default_value: float=None) -> typing.Optional[float]: ...
 
@@ -440,7 +450,8 @@ class CameraAcquisitionTask(HardwareSource.AcquisitionTask):
         data_element = None  # avoid use-before-set warning
         had_grace_frame = False  # whether grace frame has been used up (allows for extra frame during accumulation startup)
         while cumulative_frame_count < integration_count:
-            data_element = self.__camera.acquire_image()
+            with telemetry.registry.span("camera.acquire_image"):
+                data_element = self.__camera.acquire_image()
             frames_acquired = data_element["properties"].get("integration_count", 1)
             if cumulative_data is None:
                 cumulative_data = data_element["data"]
@@ -463,13 +474,15 @@ class CameraAcquisitionTask(HardwareSource.AcquisitionTask):
         data_element["version"] = 1
         data_element["state"] = "complete"
         data_element["timestamp"] = data_element.get("timestamp", datetime.datetime.utcnow())
-        update_spatial_calibrations(data_element, self.__instrument_controller, self.__camera, self.__camera_category, cumulative_data.shape, binning, binning)
-        update_intensity_calibration(data_element, self.__instrument_controller, self.__camera)
-        update_instrument_properties(data_element["properties"], self.__instrument_controller, self.__camera)
-        update_camera_properties(data_element["properties"], frame_parameters, self.hardware_source_id, self.__display_name, data_element.get("signal_type", self.__signal_type))
+        with telemetry.registry.span("camera.update_metadata"):
+            update_spatial_calibrations(data_element, self.__instrument_controller, self.__camera, self.__camera_category, cumulative_data.shape, binning, binning)
+            update_intensity_calibration(data_element, self.__instrument_controller, self.__camera)
+            update_instrument_properties(data_element["properties"], self.__instrument_controller, self.__camera)
+            update_camera_properties(data_element["properties"], frame_parameters, self.hardware_source_id, self.__display_name, data_element.get("signal_type", self.__signal_type))
         data_element["properties"]["valid_rows"] = cumulative_data.shape[0]
         data_element["properties"]["frame_index"] = data_element["properties"]["frame_number"]
         data_element["properties"]["integration_count"] = cumulative_frame_count
+        telemetry.registry.increment("camera.frames")
         return [data_element]
 
     def __activate_frame_parameters(self):
@@ -609,6 +622,112 @@ class CameraSettings:
         pass
 
 
+class SparseFrames:
+    """A sequence of counted frames stored as electron events.
+
+    The events of frame i are y[frame_offsets[i]:frame_offsets[i + 1]] and x[frame_offsets[i]:frame_offsets[i + 1]];
+    frame_offsets has frame_count + 1 entries. Events are stored in frame order. Use get_frame or to_dense for a dense
+    view when needed.
+    """
+
+    def __init__(self, frame_shape: typing.Tuple[int, int], frame_offsets: numpy.ndarray, y: numpy.ndarray, x: numpy.ndarray):
+        self.frame_shape = tuple(frame_shape)
+        self.frame_offsets = frame_offsets
+        self.y = y
+        self.x = x
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.frame_offsets) - 1
+
+    @property
+    def event_count(self) -> int:
+        return len(self.y)
+
+    @property
+    def nbytes(self) -> int:
+        return self.frame_offsets.nbytes + self.y.nbytes + self.x.nbytes
+
+    @property
+    def frame_indexes(self) -> numpy.ndarray:
+        """Return the frame index of each event."""
+        return numpy.repeat(numpy.arange(self.frame_count), numpy.diff(self.frame_offsets))
+
+    def get_frame_events(self, index: int) -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+        start, stop = self.frame_offsets[index], self.frame_offsets[index + 1]
+        return self.y[start:stop], self.x[start:stop]
+
+    def get_frame(self, index: int, dtype=numpy.uint16) -> numpy.ndarray:
+        frame = numpy.zeros(self.frame_shape, dtype)
+        y, x = self.get_frame_events(index)
+        numpy.add.at(frame, (y, x), 1)
+        return frame
+
+    def to_dense(self, start: int = 0, count: int = None, dtype=numpy.uint16) -> numpy.ndarray:
+        """Return count frames starting at start as a dense array with shape (count, height, width)."""
+        count = count if count is not None else self.frame_count - start
+        frames = numpy.zeros((count,) + self.frame_shape, dtype)
+        event_start, event_stop = self.frame_offsets[start], self.frame_offsets[start + count]
+        frame_indexes = self.frame_indexes[event_start:event_stop] - start
+        numpy.add.at(frames, (frame_indexes, self.y[event_start:event_stop], self.x[event_start:event_stop]), 1)
+        return frames
+
+    @classmethod
+    def from_events(cls, frame_count: int, frame_shape: typing.Tuple[int, int], frame_indexes: numpy.ndarray, y: numpy.ndarray, x: numpy.ndarray) -> "SparseFrames":
+        """Make sparse frames from events in any order."""
+        order = numpy.argsort(frame_indexes, kind="stable")
+        frame_offsets = numpy.zeros(frame_count + 1, numpy.int64)
+        numpy.cumsum(numpy.bincount(frame_indexes, minlength=frame_count), out=frame_offsets[1:])
+        coordinate_dtype = numpy.uint16 if max(frame_shape) <= 65536 else numpy.uint32
+        return cls(frame_shape, frame_offsets, y[order].astype(coordinate_dtype), x[order].astype(coordinate_dtype))
+
+
+def find_electron_events(frames: numpy.ndarray, threshold: float, *, find_maxima: bool = True) -> typing.Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """Return the frame indexes, y and x of the electron events in frames with shape (n, height, width).
+
+    An event is a pixel above threshold which, if find_maxima is True, is also a local maximum of its 3x3
+    neighborhood. Of equal neighboring maxima, only the first in raster order is kept.
+    """
+    frames = numpy.asarray(frames)
+    events = frames > threshold
+    if find_maxima and events.any():
+        height, width = frames.shape[1:]
+        padded = numpy.pad(frames.astype(numpy.float32, copy=False), ((0, 0), (1, 1), (1, 1)), mode="constant", constant_values=-numpy.inf)
+        center = padded[:, 1:height + 1, 1:width + 1]
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                if (dy, dx) != (0, 0):
+                    neighbor = padded[:, 1 + dy:height + 1 + dy, 1 + dx:width + 1 + dx]
+                    # pixels preceding in raster order must be strictly lower so that plateaus count once
+                    events &= (center > neighbor) if (dy, dx) < (0, 0) else (center >= neighbor)
+    return numpy.nonzero(events)
+
+
+def count_electrons(frames: numpy.ndarray, threshold: float, *, find_maxima: bool = True) -> SparseFrames:
+    """Count the electron events in frames with shape (n, height, width) and return them as sparse frames."""
+    frame_indexes, y, x = find_electron_events(frames, threshold, find_maxima=find_maxima)
+    return SparseFrames.from_events(frames.shape[0], frames.shape[1:], frame_indexes, y, x)
+
+
+def count_electrons_in_chunks(chunks: typing.Iterable[numpy.ndarray], threshold: float, *, find_maxima: bool = True) -> SparseFrames:
+    """Count the electron events in chunks of frames, each with shape (k, height, width), and return them as sparse frames.
+
+    Each chunk is counted as it arrives and only its events are kept, so the chunks may be acquired one at a time.
+    """
+    frame_count = 0
+    frame_shape = (0, 0)
+    chunk_events = list()
+    for chunk in chunks:
+        frame_indexes, y, x = find_electron_events(chunk, threshold, find_maxima=find_maxima)
+        chunk_events.append((frame_indexes + frame_count, y, x))
+        frame_count += chunk.shape[0]
+        frame_shape = chunk.shape[1:]
+    if not chunk_events:
+        chunk_events.append((numpy.zeros((0,), numpy.int64),) * 3)
+    frame_indexes, y, x = (numpy.concatenate(arrays) for arrays in zip(*chunk_events))
+    return SparseFrames.from_events(frame_count, frame_shape, frame_indexes, y, x)
+
+
 class CameraHardwareSource(HardwareSource.HardwareSource):
 
     def __init__(self, instrument_controller_id: str, camera: CameraDevice, camera_settings: CameraSettings, configuration_location: pathlib.Path, camera_panel_type: typing.Optional[str], camera_panel_delegate_type: typing.Optional[str] = None):
@@ -790,9 +909,49 @@ class CameraHardwareSource(HardwareSource.HardwareSource):
     def grab_sequence_get_progress(self) -> typing.Optional[float]:
         return None
 
+    def grab_sequence_counted(self, count: int, threshold: float, *, find_maxima: bool = True, chunk_size: int = 16, **kwargs) -> typing.Optional[SparseFrames]:
+        """Grab a sequence of count frames and return its electron events as sparse frames.
+
+        If the camera device implements acquire_sequence, it returns the dense sequence, which is then counted
+        chunk_size frames at a time to limit the temporary memory of the counting; only the result is compact in this
+        case. Otherwise each frame is counted as it is acquired and the dense sequence is never allocated.
+
+        Raises ValueError if the frames are not two dimensional, for instance with sum_project processing.
+        """
+        frame_parameters = self.get_current_frame_parameters()
+        if frame_parameters.processing == "sum_project":
+            raise ValueError("Electron counting requires two dimensional frames; sum_project processing is not supported.")
+        if callable(getattr(self.__camera, "acquire_sequence", None)):
+            xdatas = self.grab_sequence(count, **kwargs)
+            if not xdatas:
+                return None
+            data = xdatas[0].data
+            if len(data.shape) != 3:
+                raise ValueError(f"Electron counting requires two dimensional frames, not a sequence of shape {data.shape}.")
+            chunks = (data[i:i + chunk_size] for i in range(0, data.shape[0], chunk_size))
+            return count_electrons_in_chunks(chunks, threshold, find_maxima=find_maxima)
+
+        def frames() -> typing.Iterator[numpy.ndarray]:
+            for frame_data, properties in self.__acquire_sequence_frames(count, frame_parameters):
+                if len(frame_data.shape) != 2:
+                    raise ValueError(f"Electron counting requires two dimensional frames, not frames of shape {frame_data.shape}.")
+                yield frame_data[numpy.newaxis]
+
+        self.start_playing()
+        return count_electrons_in_chunks(frames(), threshold, find_maxima=find_maxima)
+
     def grab_buffer(self, count: int, *, start: int=None, **kwargs) -> typing.Optional[typing.List[typing.List[DataAndMetadata.DataAndMetadata]]]:
         return None
 
+    async def grab_next_async(self, *, to_start: bool = False, timeout: float = None) -> typing.List[DataAndMetadata.DataAndMetadata]:
+        return await async_acquisition.grab_next(self, to_start=to_start, timeout=timeout)
+
+    async def grab_sequence_async(self, count: int, **kwargs) -> typing.Optional[typing.List[DataAndMetadata.DataAndMetadata]]:
+        return await async_acquisition.grab_sequence(self, count, **kwargs)
+
+    def frames_async(self, *, max_pending: int = 1) -> async_acquisition.FrameIterator:
+        return async_acquisition.frames(self, max_pending=max_pending)
+
     def make_reference_key(self, **kwargs) -> str:
         reference_key = kwargs.get("reference_key")
         if reference_key:
@@ -885,34 +1044,35 @@ class CameraHardwareSource(HardwareSource.HardwareSource):
         if callable(getattr(self.__camera, "acquire_sequence_prepare", None)):
             self.__camera.acquire_sequence_prepare(n)
 
-    def __acquire_sequence_fallback(self, n: int, frame_parameters) -> dict:
-        # if the device does not implement acquire_sequence, fall back to looping acquisition.
+    def __acquire_sequence_frames(self, n: int, frame_parameters) -> typing.Iterator[typing.Tuple[numpy.ndarray, typing.Dict]]:
+        # acquire n frames one at a time, yielding the (processed) data and the properties of each frame.
         processing = frame_parameters.processing
         acquisition_task = CameraAcquisitionTask(self.__get_instrument_controller(), self.hardware_source_id, True, self.__camera, self.__camera_settings, self.__camera_category, self.__signal_type, frame_parameters, self.display_name)
         acquisition_task._start_acquisition()
         try:
-            properties = None
-            data = None
             for index in range(n):
                 frame_data_element = acquisition_task._acquire_data_elements()[0]
                 frame_data = frame_data_element["data"]
-                if data is None:
-                    if processing == "sum_project" and len(frame_data.shape) > 1:
-                        data = numpy.empty((n,) + frame_data.shape[1:], frame_data.dtype)
-                    else:
-                        data = numpy.empty((n,) + frame_data.shape, frame_data.dtype)
                 if processing == "sum_project" and len(frame_data.shape) > 1:
-                    data[index] = Core.function_sum(DataAndMetadata.new_data_and_metadata(frame_data), 0).data
-                else:
-                    data[index] = frame_data
+                    frame_data = Core.function_sum(DataAndMetadata.new_data_and_metadata(frame_data), 0).data
                 properties = copy.deepcopy(frame_data_element["properties"])
                 if processing == "sum_project":
                     properties["valid_rows"] = 1
                     spatial_properties = properties.get("spatial_calibrations")
                     if spatial_properties is not None:
                         properties["spatial_calibrations"] = spatial_properties[1:]
+                yield frame_data, properties
         finally:
             acquisition_task._stop_acquisition()
+
+    def __acquire_sequence_fallback(self, n: int, frame_parameters) -> dict:
+        # if the device does not implement acquire_sequence, fall back to looping acquisition.
+        properties = None
+        data = None
+        for index, (frame_data, properties) in enumerate(self.__acquire_sequence_frames(n, frame_parameters)):
+            if data is None:
+                data = numpy.empty((n,) + frame_data.shape, frame_data.dtype)
+            data[index] = frame_data
         data_element = dict()
         data_element["data"] = data
         data_element["properties"] = properties
@@ -1117,30 +1277,58 @@ class CameraFrameParameters(dict):
         }
 
 
-def get_instrument_calibration_value(instrument_controller: InstrumentController, calibration_controls, key) -> typing.Optional[float]:
-    if key + "_control" in calibration_controls:
-        valid, value = instrument_controller.TryGetVal(calibration_controls[key + "_control"])
+def try_get_instrument_values(instrument_controller: InstrumentController, names: typing.Sequence[str]) -> typing.Dict[str, float]:
+    # use the batched call when the instrument controller provides one so that a remote instrument needs one round trip.
+    # read through the value cache of the instrument controller if it has one (the cache is disabled by default).
+    if callable(getattr(instrument_controller, "TryGetValsCached", None)):
+        return dict(instrument_controller.TryGetValsCached(names)) if names else dict()
+    if callable(getattr(instrument_controller, "TryGetVals", None)):
+        return dict(instrument_controller.TryGetVals(names)) if names else dict()
+    values = dict()
+    for name in names:
+        valid, value = instrument_controller.TryGetVal(name)
         if valid:
-            return value
-    if key + "_value" in calibration_controls:
-        return calibration_controls.get(key + "_value")
-    return None
+            values[name] = value
+    return values
+
+
+def get_instrument_calibration_values(instrument_controller: InstrumentController, calibration_controls, keys: typing.Sequence[str]) -> typing.Dict[str, typing.Optional[float]]:
+    control_names = [calibration_controls[key + "_control"] for key in keys if key + "_control" in calibration_controls]
+    control_values = try_get_instrument_values(instrument_controller, control_names)
+    values = dict()
+    for key in keys:
+        if key + "_control" in calibration_controls and calibration_controls[key + "_control"] in control_values:
+            values[key] = control_values[calibration_controls[key + "_control"]]
+        else:
+            values[key] = calibration_controls.get(key + "_value")
+    return values
+
+
+def get_instrument_calibration_value(instrument_controller: InstrumentController, calibration_controls, key) -> typing.Optional[float]:
+    return get_instrument_calibration_values(instrument_controller, calibration_controls, [key])[key]
+
+
+def _calibration_keys(prefix: str) -> typing.List[str]:
+    return [prefix + "_" + "scale", prefix + "_" + "offset", prefix + "_" + "units"]
 
 
 def build_calibration(instrument_controller: InstrumentController, calibration_controls: typing.Mapping, prefix: str,
-                      relative_scale: float = 1, data_len: int = 0) -> Calibration.Calibration:
-    scale = get_instrument_calibration_value(instrument_controller, calibration_controls, prefix + "_" + "scale")
+                      relative_scale: float = 1, data_len: int = 0, *, values: typing.Optional[typing.Mapping] = None) -> Calibration.Calibration:
+    # values may be passed to avoid reading the calibration controls again, see get_instrument_calibration_values.
+    if values is None:
+        values = get_instrument_calibration_values(instrument_controller, calibration_controls, _calibration_keys(prefix))
+    scale = values.get(prefix + "_" + "scale")
     scale = scale * relative_scale if scale is not None else scale
-    offset = get_instrument_calibration_value(instrument_controller, calibration_controls, prefix + "_" + "offset")
-    units = get_instrument_calibration_value(instrument_controller, calibration_controls, prefix + "_" + "units")
+    offset = values.get(prefix + "_" + "offset")
+    units = values.get(prefix + "_" + "units")
     if calibration_controls.get(prefix + "_origin_override", None) == "center" and scale is not None and data_len:
         offset = -scale * data_len * 0.5
     return Calibration.Calibration(offset, scale, units)
 
 
 def build_calibration_dict(instrument_controller: InstrumentController, calibration_controls: typing.Mapping,
-                           prefix: str, relative_scale: float = 1, data_len: int = 0) -> typing.Dict:
-    return build_calibration(instrument_controller, calibration_controls, prefix, relative_scale, data_len).rpc_dict
+                           prefix: str, relative_scale: float = 1, data_len: int = 0, *, values: typing.Optional[typing.Mapping] = None) -> typing.Dict:
+    return build_calibration(instrument_controller, calibration_controls, prefix, relative_scale, data_len, values=values).rpc_dict
 
 
 def update_spatial_calibrations(data_element, instrument_controller: InstrumentController, camera, camera_category, data_shape, scaling_x, scaling_y):
@@ -1157,9 +1345,11 @@ def update_spatial_calibrations(data_element, instrument_controller: InstrumentC
             else:
                 calibration_controls = None
             if calibration_controls is not None:
-                x_calibration_dict = build_calibration_dict(instrument_controller, calibration_controls, "x", scaling_x, data_shape[0])
-                y_calibration_dict = build_calibration_dict(instrument_controller, calibration_controls, "y", scaling_y, data_shape[1] if len(data_shape) > 1 else 0)
-                z_calibration_dict = build_calibration_dict(instrument_controller, calibration_controls, "z", 1, data_shape[2] if len(data_shape) > 2 else 0)
+                # read the calibrations for all axes at once.
+                values = get_instrument_calibration_values(instrument_controller, calibration_controls, _calibration_keys("x") + _calibration_keys("y") + _calibration_keys("z"))
+                x_calibration_dict = build_calibration_dict(instrument_controller, calibration_controls, "x", scaling_x, data_shape[0], values=values)
+                y_calibration_dict = build_calibration_dict(instrument_controller, calibration_controls, "y", scaling_y, data_shape[1] if len(data_shape) > 1 else 0, values=values)
+                z_calibration_dict = build_calibration_dict(instrument_controller, calibration_controls, "z", 1, data_shape[2] if len(data_shape) > 2 else 0, values=values)
                 # leave this here for backwards compatibility until origin override is specified in NionCameraManager.py
                 if camera_category.lower() == "ronchigram" and len(data_shape) == 2:
                     y_calibration_dict["offset"] = -y_calibration_dict.get("scale", 1) * data_shape[0] * 0.5
@@ -1179,14 +1369,21 @@ def update_intensity_calibration(data_element, instrument_controller: Instrument
         calibration_controls = camera.calibration_controls
     else:
         calibration_controls = None
+    needs_intensity_calibration = "intensity_calibration" not in data_element and "intensity_calibration" not in data_element["properties"]
+    needs_counts_per_electron = "counts_per_electron" not in data_element
+    values = dict()
+    if calibration_controls is not None and (needs_intensity_calibration or needs_counts_per_electron):
+        # read the intensity calibration and counts per electron at once.
+        keys = (_calibration_keys("intensity") if needs_intensity_calibration else list()) + (["counts_per_electron"] if needs_counts_per_electron else list())
+        values = get_instrument_calibration_values(instrument_controller, calibration_controls, keys)
     if "intensity_calibration" not in data_element:
         if "intensity_calibration" in data_element["properties"]:
             data_element["intensity_calibration"] = data_element["properties"]["intensity_calibration"]
         elif calibration_controls is not None:
-            data_element["intensity_calibration"] = build_calibration_dict(instrument_controller, calibration_controls, "intensity")
+            data_element["intensity_calibration"] = build_calibration_dict(instrument_controller, calibration_controls, "intensity", values=values)
     if "counts_per_electron" not in data_element:
         if calibration_controls is not None:
-            counts_per_electron = get_instrument_calibration_value(instrument_controller, calibration_controls, "counts_per_electron")
+            counts_per_electron = values.get("counts_per_electron")
             if counts_per_electron:
                 data_element["properties"]["counts_per_electron"] = counts_per_electron
 
@@ -1274,5 +1471,9 @@ class CameraInterface:
     def grab_sequence(self, count: int) -> typing.Optional[typing.List[DataAndMetadata.DataAndMetadata]]: ...
     def grab_sequence_abort(self) -> None: ...
     def grab_sequence_get_progress(self) -> typing.Optional[float]: ...
+    def grab_sequence_counted(self, count: int, threshold: float, *, find_maxima: bool = True, chunk_size: int = 16) -> typing.Optional[SparseFrames]: ...
     def grab_buffer(self, count: int, *, start: int = None) -> typing.Optional[typing.List[typing.List[DataAndMetadata.DataAndMetadata]]]: ...
+    async def grab_next_async(self, *, to_start: bool = False, timeout: float = None) -> typing.List[DataAndMetadata.DataAndMetadata]: ...
+    async def grab_sequence_async(self, count: int, **kwargs) -> typing.Optional[typing.List[DataAndMetadata.DataAndMetadata]]: ...
+    def frames_async(self, *, max_pending: int = 1) -> typing.AsyncIterator[typing.List[DataAndMetadata.DataAndMetadata]]: ...
     def make_reference_key(self, **kwargs) -> str: ...
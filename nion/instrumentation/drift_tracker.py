@@ -0,0 +1,190 @@
+# standard libraries
+import threading
+import typing
+
+# third party libraries
+import numpy
+
+# local libraries
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.instrumentation import registration
+
+
+def downsample(data: numpy.ndarray, factor: int) -> numpy.ndarray:
+    """Return data averaged over blocks of factor x factor pixels; a remainder which does not fill a block is dropped."""
+    if factor <= 1:
+        return numpy.asarray(data, dtype=float)
+    height, width = data.shape[0] // factor, data.shape[1] // factor
+    return numpy.mean(data[:height * factor, :width * factor].reshape(height, factor, width, factor), axis=(1, 3), dtype=float)
+
+
+class DriftTracker:
+    """Measure and predict drift from frames of a drift region.
+
+    The reference frame is downsampled, windowed, and transformed once; each following frame is registered against the
+    cached reference transform by phase correlation with sub-pixel refinement (see registration.register_fft). Offsets
+    are in calibrated units using the scale passed with the reference and have the registration convention, i.e.
+    shifting the frame by the offset aligns it with the reference.
+
+    Measured offsets are fed to a constant velocity Kalman filter (independent for each axis) which predicts the offset
+    and its uncertainty at a later time. If skip_uncertainty is not None, needs_measurement returns False while the
+    predicted uncertainty (one standard deviation) is below it, so that drift frames can be skipped.
+
+    process_noise is the spectral density of the random acceleration of the drift (units^2 / s^3); measurement_noise is
+    the standard deviation of a measurement (units).
+    """
+
+    def __init__(self, *, downsample_factor: int = 1, upsample_factor: int = 20, process_noise: float = 1e-3,
+                 measurement_noise: float = 0.05, skip_uncertainty: typing.Optional[float] = None,
+                 max_skip_count: int = 4):
+        self.downsample_factor = max(1, downsample_factor)
+        self.upsample_factor = upsample_factor
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.skip_uncertainty = skip_uncertainty
+        self.max_skip_count = max_skip_count
+        self.measured_count = 0
+        self.skipped_count = 0
+        self.__lock = threading.RLock()
+        self.__reference_fft: typing.Optional[numpy.ndarray] = None
+        self.__window: typing.Optional[numpy.ndarray] = None
+        self.__scale = numpy.ones(2)
+        self.__state = numpy.zeros((2, 2))  # position and velocity (rows) for each axis (columns)
+        self.__covariance = numpy.zeros((2, 2, 2))  # covariance of position and velocity for each axis
+        self.__timestamp: typing.Optional[float] = None
+        self.__skip_count = 0
+
+    @property
+    def has_reference(self) -> bool:
+        return self.__reference_fft is not None
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__reference_fft = None
+            self.__window = None
+            self.__state = numpy.zeros((2, 2))
+            self.__covariance = numpy.zeros((2, 2, 2))
+            self.__timestamp = None
+            self.__skip_count = 0
+
+    def __transform(self, data: numpy.ndarray) -> numpy.ndarray:
+        data = downsample(data, self.downsample_factor)
+        if self.__window is None or self.__window.shape != data.shape:
+            self.__window = numpy.outer(numpy.hanning(data.shape[0]), numpy.hanning(data.shape[1]))
+        data_fft = numpy.fft.fft2((data - numpy.mean(data)) * self.__window)
+        # normalizing the magnitude gives phase correlation, which has a sharp peak independent of the image contrast.
+        return data_fft / numpy.maximum(numpy.abs(data_fft), numpy.finfo(float).tiny)
+
+    def set_reference(self, data: numpy.ndarray, timestamp: float, scale: typing.Sequence[float] = (1.0, 1.0)) -> None:
+        """Set the reference frame and restart tracking at zero offset and velocity."""
+        with self.__lock:
+            self.__reference_fft = self.__transform(data)
+            self.__scale = numpy.array(scale, dtype=float)
+            self.__state = numpy.zeros((2, 2))
+            # the reference defines the zero offset, so only the velocity is uncertain.
+            self.__covariance = numpy.zeros((2, 2, 2))
+            self.__covariance[:, 1, 1] = self.measurement_noise ** 2
+            self.__timestamp = timestamp
+            self.__skip_count = 0
+
+    def register(self, data: numpy.ndarray) -> numpy.ndarray:
+        """Return the offset (y, x) of data relative to the reference without updating the tracker."""
+        with self.__lock:
+            assert self.__reference_fft is not None
+            reference_fft = self.__reference_fft
+            data_fft = self.__transform(data)
+            scale = self.__scale
+        if data_fft.shape != reference_fft.shape:
+            raise ValueError("Drift frame shape does not match the reference.")
+        shift = registration.register_fft(reference_fft, data_fft, self.upsample_factor)
+        return shift * self.downsample_factor * scale
+
+    def __predicted(self, timestamp: float) -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+        dt = max(0.0, timestamp - self.__timestamp) if self.__timestamp is not None else 0.0
+        transition = numpy.array([[1.0, dt], [0.0, 1.0]])
+        process_covariance = self.process_noise * numpy.array([[dt ** 3 / 3, dt ** 2 / 2], [dt ** 2 / 2, dt]])
+        state = transition @ self.__state
+        covariance = transition @ self.__covariance @ transition.T + process_covariance
+        return state, covariance
+
+    def predict(self, timestamp: float) -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+        """Return the predicted offset (y, x) and its uncertainty (one standard deviation, y, x) at timestamp."""
+        with self.__lock:
+            state, covariance = self.__predicted(timestamp)
+            return state[0].copy(), numpy.sqrt(covariance[:, 0, 0])
+
+    def needs_measurement(self, timestamp: float) -> bool:
+        """Return whether a drift frame should be measured at timestamp, counting the skipped frames otherwise."""
+        with self.__lock:
+            if self.__reference_fft is None or self.skip_uncertainty is None or self.__skip_count >= self.max_skip_count:
+                return True
+            offset, uncertainty = self.predict(timestamp)
+            if numpy.amax(uncertainty) >= self.skip_uncertainty:
+                return True
+            self.__skip_count += 1
+            self.skipped_count += 1
+            return False
+
+    def update(self, offset: typing.Sequence[float], timestamp: float) -> numpy.ndarray:
+        """Update the tracker with a measured offset (y, x) at timestamp and return the filtered offset."""
+        with self.__lock:
+            state, covariance = self.__predicted(timestamp)
+            observation = numpy.array([1.0, 0.0])
+            innovation = numpy.array(offset, dtype=float) - state[0]
+            innovation_variance = covariance[:, 0, 0] + self.measurement_noise ** 2
+            gain = covariance[:, :, 0] / innovation_variance[:, numpy.newaxis]  # (axis, [position, velocity])
+            self.__state = state + gain.T * innovation
+            self.__covariance = covariance - gain[:, :, numpy.newaxis] * (observation @ covariance)[:, numpy.newaxis, :]
+            self.__timestamp = timestamp
+            self.__skip_count = 0
+            self.measured_count += 1
+            return self.__state[0].copy()
+
+    def measure(self, data: numpy.ndarray, timestamp: float) -> numpy.ndarray:
+        """Register data against the reference, update the tracker, and return the measured offset (y, x)."""
+        offset = self.register(data)
+        self.update(offset, timestamp)
+        return offset
+
+
+class DriftLog:
+    """Log drift offsets (y, x) and their magnitude in a fixed size ring.
+
+    Once capacity entries are logged, each new entry replaces the oldest one, so that logging during long (e.g.
+    continuous) acquisitions uses constant memory and time per entry.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.__lock = threading.RLock()
+        self.__data = numpy.zeros((3, max(1, capacity)), float)
+        self.__count = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.__data.shape[1]
+
+    @property
+    def count(self) -> int:
+        return min(self.__count, self.capacity)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__count = 0
+
+    def append(self, offset: typing.Sequence[float]) -> None:
+        with self.__lock:
+            offset_y, offset_x = offset
+            self.__data[:, self.__count % self.capacity] = offset_y, offset_x, numpy.hypot(offset_y, offset_x)
+            self.__count += 1
+
+    @property
+    def data(self) -> numpy.ndarray:
+        """Return a copy of the logged y, x, and magnitude rows, oldest entry first."""
+        with self.__lock:
+            if self.__count <= self.capacity:
+                return self.__data[:, :self.__count].copy()
+            return numpy.roll(self.__data, -(self.__count % self.capacity), axis=1)
+
+    def get_xdata(self, units: str = "nm") -> DataAndMetadata.DataAndMetadata:
+        return DataAndMetadata.new_data_and_metadata(self.data, intensity_calibration=Calibration.Calibration(units=units))
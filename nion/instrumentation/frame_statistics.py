@@ -0,0 +1,197 @@
+# standard libraries
+import math
+import threading
+import time
+import typing
+
+# third party libraries
+import numpy
+
+# local libraries
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.utils import Event
+
+
+class FrameStatistics:
+    """Statistics of a single frame.
+
+    If the frame was subsampled, sum is estimated from the subsampled data (scaled by the subsample factor) and
+    is_exact is False; the other statistics are those of the subsampled data. Saturation count is only calculated if
+    a saturation level is known and is scaled the same way as the sum.
+    """
+
+    def __init__(self, sum_value: float, mean: float, minimum: float, maximum: float,
+                 saturation_count: typing.Optional[int], histogram: numpy.ndarray, histogram_edges: numpy.ndarray,
+                 frame_shape: typing.Tuple[int, ...], subsample_step: int, is_exact: bool,
+                 intensity_calibration: typing.Optional[Calibration.Calibration] = None,
+                 metadata: typing.Optional[typing.Mapping] = None):
+        self.sum = sum_value
+        self.mean = mean
+        self.minimum = minimum
+        self.maximum = maximum
+        self.saturation_count = saturation_count
+        self.histogram = histogram
+        self.histogram_edges = histogram_edges
+        self.frame_shape = frame_shape
+        self.subsample_step = subsample_step
+        self.is_exact = is_exact
+        self.intensity_calibration = intensity_calibration
+        self.metadata = metadata if metadata is not None else dict()
+
+    @property
+    def detector_current(self) -> typing.Optional[float]:
+        """Return the detector current in amps if the frame is calibrated in counts with known counts per electron."""
+        return get_detector_current(self.sum, self.intensity_calibration, self.metadata)
+
+
+def get_detector_current(sum_value: float, intensity_calibration: typing.Optional[Calibration.Calibration],
+                         metadata: typing.Mapping) -> typing.Optional[float]:
+    """Return the detector current in amps for the sum of a frame, or None if the frame is not calibrated in counts
+    with known counts per electron and exposure."""
+    hardware_source_metadata = metadata.get("hardware_source", dict())
+    counts_per_electron = hardware_source_metadata.get("counts_per_electron")
+    exposure = hardware_source_metadata.get("exposure")
+    if intensity_calibration and intensity_calibration.units == "counts" and counts_per_electron and exposure:
+        sum_counts = intensity_calibration.convert_to_calibrated_value(sum_value)
+        return sum_counts / exposure / counts_per_electron / 6.242e18 if exposure > 0 and counts_per_electron > 0 else 0.0
+    return None
+
+
+def get_subsample_step(shape: typing.Sequence[int], max_samples: int) -> int:
+    """Return the step along each axis so that the subsampled data has at most max_samples elements."""
+    count = int(numpy.prod(shape, dtype=numpy.int64)) if len(shape) else 1
+    if count <= max_samples or not len(shape):
+        return 1
+    return int(math.ceil((count / max_samples) ** (1.0 / len(shape))))
+
+
+def subsample(data: numpy.ndarray, max_samples: int) -> typing.Tuple[numpy.ndarray, int]:
+    """Return a copy of the data subsampled to at most max_samples elements and the step used."""
+    step = get_subsample_step(data.shape, max_samples)
+    return numpy.array(data[(slice(None, None, step),) * len(data.shape)]), step
+
+
+def compute_frame_statistics(data: numpy.ndarray, *, subsample_step: int = 1, frame_shape: typing.Tuple[int, ...] = None,
+                             saturation_level: typing.Optional[float] = None, bins: int = 64,
+                             intensity_calibration: typing.Optional[Calibration.Calibration] = None,
+                             metadata: typing.Optional[typing.Mapping] = None) -> FrameStatistics:
+    """Compute the statistics of data, which may have been subsampled from a frame of frame_shape by subsample_step."""
+    frame_shape = tuple(frame_shape) if frame_shape is not None else tuple(data.shape)
+    is_exact = subsample_step == 1 and tuple(data.shape) == frame_shape
+    # scale the sum to the number of elements in the full frame
+    scale = numpy.prod(frame_shape, dtype=numpy.float64) / max(1, data.size)
+    if numpy.issubdtype(data.dtype, numpy.complexfloating):
+        data = numpy.abs(data)
+    if data.size == 0:
+        return FrameStatistics(0.0, 0.0, 0.0, 0.0, None, numpy.zeros((bins,), numpy.int64), numpy.zeros((bins + 1,)),
+                               frame_shape, subsample_step, is_exact, intensity_calibration, metadata)
+    sum_value = numpy.sum(data, dtype=numpy.float64)
+    minimum = float(numpy.amin(data))
+    maximum = float(numpy.amax(data))
+    histogram, histogram_edges = numpy.histogram(data, bins=bins, range=(minimum, maximum) if maximum > minimum else (minimum, minimum + 1))
+    saturation_count = None
+    if saturation_level is not None:
+        saturation_count = int(round(numpy.count_nonzero(data >= saturation_level) * scale))
+    return FrameStatistics(float(sum_value * scale), float(sum_value / data.size), minimum, maximum, saturation_count,
+                           histogram, histogram_edges, frame_shape, subsample_step, is_exact, intensity_calibration, metadata)
+
+
+class FrameStatisticsService:
+    """Compute statistics of the frames of a hardware source on a worker thread.
+
+    Frames are only sampled while statistics_changed_event has listeners, and at most once per interval (seconds).
+    The delivery thread then only takes a subsample of the frame (no more than max_samples elements, a copy since the
+    frame data may be reused after delivery); the statistics are computed on the worker. If the worker falls behind,
+    intermediate frames are skipped. The statistics_changed_event is fired on the worker thread with the
+    FrameStatistics of the first data channel.
+
+    Use acquire_frame_statistics_service to share a service between panels.
+    """
+
+    def __init__(self, hardware_source, *, max_samples: int = 1024 * 1024, bins: int = 64,
+                 saturation_level: typing.Optional[float] = None, interval: float = 0.5):
+        self.__hardware_source = hardware_source
+        self.max_samples = max_samples
+        self.interval = interval
+        self.bins = bins
+        self.saturation_level = saturation_level
+        self.statistics_changed_event = Event.Event()
+        self.latest_statistics: typing.Optional[FrameStatistics] = None
+        self.processed_count = 0
+        self.skipped_count = 0
+        self.__last_sample_time: typing.Optional[float] = None
+        self.__condition = threading.Condition()
+        self.__pending = None
+        self.__closed = False
+        self.__thread = threading.Thread(target=self.__process_loop, daemon=True)
+        self.__thread.start()
+        self.__xdatas_available_listener = hardware_source.xdatas_available_event.listen(self.__xdatas_available)
+
+    def close(self) -> None:
+        self.__xdatas_available_listener.close()
+        self.__xdatas_available_listener = None
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join(5.0)
+        self.__hardware_source = None
+
+    def __xdatas_available(self, xdatas: typing.Sequence[DataAndMetadata.DataAndMetadata]) -> None:
+        # called on the acquisition thread. keep this quick.
+        if not xdatas or xdatas[0] is None or xdatas[0].data is None:
+            return
+        if not self.statistics_changed_event.listener_count:
+            return
+        current_time = time.perf_counter()
+        if self.__last_sample_time is not None and current_time - self.__last_sample_time < self.interval:
+            return
+        self.__last_sample_time = current_time
+        xdata = xdatas[0]
+        data, step = subsample(xdata.data, self.max_samples)
+        with self.__condition:
+            if self.__pending is not None:
+                self.skipped_count += 1
+            self.__pending = (data, step, tuple(xdata.data_shape), xdata.intensity_calibration, xdata.metadata)
+            self.__condition.notify_all()
+
+    def __process_loop(self) -> None:
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__pending is not None or self.__closed)
+                if self.__closed:
+                    break
+                data, step, frame_shape, intensity_calibration, metadata = self.__pending
+                self.__pending = None
+            statistics = compute_frame_statistics(data, subsample_step=step, frame_shape=frame_shape,
+                                                  saturation_level=self.saturation_level, bins=self.bins,
+                                                  intensity_calibration=intensity_calibration, metadata=metadata)
+            self.latest_statistics = statistics
+            self.processed_count += 1
+            self.statistics_changed_event.fire(statistics)
+
+
+_services_lock = threading.RLock()
+_services: typing.Dict[typing.Any, typing.Tuple[FrameStatisticsService, int]] = dict()
+
+
+def acquire_frame_statistics_service(hardware_source) -> FrameStatisticsService:
+    """Return the shared statistics service for the hardware source. Release it with release_frame_statistics_service."""
+    with _services_lock:
+        service, reference_count = _services.get(id(hardware_source), (None, 0))
+        if service is None:
+            service = FrameStatisticsService(hardware_source)
+        _services[id(hardware_source)] = (service, reference_count + 1)
+        return service
+
+
+def release_frame_statistics_service(service: FrameStatisticsService) -> None:
+    with _services_lock:
+        for key, (shared_service, reference_count) in list(_services.items()):
+            if shared_service is service:
+                if reference_count > 1:
+                    _services[key] = (service, reference_count - 1)
+                else:
+                    _services.pop(key)
+                    service.close()
+                break
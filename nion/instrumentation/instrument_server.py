@@ -0,0 +1,261 @@
+# standard libraries
+import concurrent.futures
+import itertools
+import multiprocessing.connection
+import os
+import queue
+import random
+import socket
+import threading
+import time
+import typing
+
+# third party libraries
+# None
+
+# local libraries
+from nion.instrumentation import stem_controller as stem_controller_module
+
+
+# the STEM controller functions which may be called remotely.
+REMOTE_FUNCTIONS = {"TryGetVal", "TryGetVals", "GetVal", "SetVal", "SetVals", "SetValWait", "SetValAndConfirm",
+                    "SetValsAndConfirm", "SetValDelta", "SetValDeltaAndConfirm", "InformControl", "HasValError"}
+
+
+def _shutdown_connection(connection: multiprocessing.connection.Connection) -> None:
+    # closing the connection does not wake a thread blocked receiving on it; shutting down the socket does.
+    try:
+        with socket.socket(fileno=os.dup(connection.fileno())) as connection_socket:
+            connection_socket.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class InstrumentServer:
+    """Serve a STEM controller over a local socket with a simulated round trip latency.
+
+    This is a stand-in for a remote instrument server, useful for benchmarking acquisition under realistic call costs.
+    Each request is answered no earlier than latency seconds (plus a random jitter up to jitter seconds) after it was
+    received. Requests on a connection are handled in order, but a client can send several requests before reading
+    the responses (pipelining), in which case their latencies overlap.
+
+    Requests are (request_id, function_name, args) tuples; responses are (request_id, is_error, result) tuples.
+    """
+
+    def __init__(self, stem_controller: stem_controller_module.STEMController, address: typing.Tuple[str, int] = ("127.0.0.1", 0),
+                 latency: float = 0.0, jitter: float = 0.0, authkey: typing.Optional[bytes] = None):
+        self.__stem_controller = stem_controller
+        self.latency = latency
+        self.jitter = jitter
+        self.authkey = authkey if authkey is not None else os.urandom(16)
+        self.__listener = multiprocessing.connection.Listener(address, authkey=self.authkey)
+        self.__connections: typing.List[multiprocessing.connection.Connection] = list()
+        self.__threads: typing.List[threading.Thread] = list()
+        self.__lock = threading.RLock()
+        self.__closed = False
+        self.request_count = 0
+        self.call_counts: typing.Dict[str, int] = dict()
+        self.__accept_thread = threading.Thread(target=self.__accept_loop, daemon=True)
+        self.__accept_thread.start()
+
+    def close(self) -> None:
+        self.__closed = True
+        # wake the accept loop with a connection that fails the handshake.
+        try:
+            socket.create_connection(self.address, timeout=1.0).close()
+        except OSError:
+            pass
+        self.__accept_thread.join(5.0)
+        self.__listener.close()
+        with self.__lock:
+            connections = list(self.__connections)
+            threads = list(self.__threads)
+        for connection in connections:
+            _shutdown_connection(connection)
+        for thread in threads:
+            thread.join(5.0)
+
+    @property
+    def address(self) -> typing.Tuple[str, int]:
+        return self.__listener.address
+
+    def __accept_loop(self) -> None:
+        while not self.__closed:
+            try:
+                connection = self.__listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                if self.__closed:
+                    break
+                continue
+            response_queue = queue.Queue()
+            receive_thread = threading.Thread(target=self.__receive_loop, args=(connection, response_queue), daemon=True)
+            send_thread = threading.Thread(target=self.__send_loop, args=(connection, response_queue), daemon=True)
+            with self.__lock:
+                self.__connections.append(connection)
+                self.__threads.extend([receive_thread, send_thread])
+            receive_thread.start()
+            send_thread.start()
+
+    def __receive_loop(self, connection: multiprocessing.connection.Connection, response_queue: queue.Queue) -> None:
+        try:
+            while True:
+                request_id, function_name, args = connection.recv()
+                receive_time = time.perf_counter()
+                with self.__lock:
+                    self.request_count += 1
+                    self.call_counts[function_name] = self.call_counts.get(function_name, 0) + 1
+                try:
+                    if function_name not in REMOTE_FUNCTIONS:
+                        raise AttributeError(f"'{function_name}' cannot be called remotely.")
+                    response = (request_id, False, getattr(self.__stem_controller, function_name)(*args))
+                except Exception as e:
+                    response = (request_id, True, e)
+                due_time = receive_time + self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+                response_queue.put((due_time, response))
+        except (OSError, EOFError):
+            pass
+        finally:
+            response_queue.put(None)
+
+    def __send_loop(self, connection: multiprocessing.connection.Connection, response_queue: queue.Queue) -> None:
+        try:
+            while True:
+                item = response_queue.get()
+                if item is None:
+                    break
+                due_time, response = item
+                delay = due_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                connection.send(response)
+        except (OSError, EOFError):
+            pass
+        finally:
+            connection.close()
+
+
+class _ClientConnection:
+    """A connection to the instrument server which matches responses to pending requests."""
+
+    def __init__(self, address: typing.Tuple[str, int], authkey: bytes):
+        self.__connection = multiprocessing.connection.Client(address, authkey=authkey)
+        self.__send_lock = threading.RLock()
+        self.__pending: typing.Dict[int, concurrent.futures.Future] = dict()
+        self.__pending_lock = threading.RLock()
+        self.__request_ids = itertools.count()
+        self.__receive_thread = threading.Thread(target=self.__receive_loop, daemon=True)
+        self.__receive_thread.start()
+
+    def close(self) -> None:
+        _shutdown_connection(self.__connection)
+        self.__receive_thread.join(5.0)
+        self.__connection.close()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self.__pending)
+
+    def call(self, function_name: str, args: typing.Sequence) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        request_id = next(self.__request_ids)
+        with self.__pending_lock:
+            self.__pending[request_id] = future
+        try:
+            with self.__send_lock:
+                self.__connection.send((request_id, function_name, tuple(args)))
+        except Exception as e:
+            with self.__pending_lock:
+                self.__pending.pop(request_id, None)
+            future.set_exception(e)
+        return future
+
+    def __receive_loop(self) -> None:
+        try:
+            while True:
+                request_id, is_error, result = self.__connection.recv()
+                with self.__pending_lock:
+                    future = self.__pending.pop(request_id, None)
+                if future:
+                    if is_error:
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        except (OSError, EOFError):
+            pass
+        finally:
+            with self.__pending_lock:
+                pending = list(self.__pending.values())
+                self.__pending.clear()
+            for future in pending:
+                future.set_exception(ConnectionError("Instrument server connection closed."))
+
+
+class ProxySTEMController(stem_controller_module.STEMController):
+    """A STEM controller which forwards the instrument functions to an instrument server.
+
+    Calls are distributed over a pool of connections to the least busy one. Several calls can be in flight on a single
+    connection; use call_async to issue calls without waiting for the results.
+    """
+
+    def __init__(self, address: typing.Tuple[str, int], authkey: bytes, pool_size: int = 2, timeout: float = 30.0):
+        super().__init__()
+        self.timeout = timeout
+        self.__connections = [_ClientConnection(address, authkey) for i in range(max(1, pool_size))]
+
+    def close(self):
+        for connection in self.__connections:
+            connection.close()
+        self.__connections = list()
+        super().close()
+
+    def call_async(self, function_name: str, *args) -> concurrent.futures.Future:
+        """Call the function on the instrument server and return a future for the result."""
+        connection = min(self.__connections, key=lambda c: c.pending_count)
+        return connection.call(function_name, args)
+
+    def __call(self, function_name: str, *args) -> typing.Any:
+        return self.call_async(function_name, *args).result(self.timeout)
+
+    def TryGetVal(self, s: str) -> typing.Tuple[bool, typing.Optional[float]]:
+        return self.__call("TryGetVal", s)
+
+    def TryGetVals(self, names: typing.Sequence[str]) -> typing.Dict[str, typing.Optional[float]]:
+        return self.__call("TryGetVals", list(names))
+
+    def GetVal(self, s: str, default_value: float=None) -> float:
+        return self.__call("GetVal", s, default_value)
+
+    @stem_controller_module.invalidates_value_cache()
+    def SetVal(self, s: str, val: float) -> bool:
+        return self.__call("SetVal", s, val)
+
+    @stem_controller_module.invalidates_value_cache("batched")
+    def SetVals(self, values: typing.Mapping[str, float]) -> bool:
+        return self.__call("SetVals", dict(values))
+
+    @stem_controller_module.invalidates_value_cache()
+    def SetValWait(self, s: str, val: float, timeout_ms: int) -> bool:
+        return self.__call("SetValWait", s, val, timeout_ms)
+
+    @stem_controller_module.invalidates_value_cache()
+    def SetValAndConfirm(self, s: str, val: float, tolfactor: float, timeout_ms: int) -> bool:
+        return self.__call("SetValAndConfirm", s, val, tolfactor, timeout_ms)
+
+    @stem_controller_module.invalidates_value_cache("batched")
+    def SetValsAndConfirm(self, values: typing.Mapping[str, float], tolfactor: float, timeout_ms: int) -> bool:
+        return self.__call("SetValsAndConfirm", dict(values), tolfactor, timeout_ms)
+
+    @stem_controller_module.invalidates_value_cache()
+    def SetValDelta(self, s: str, delta: float) -> bool:
+        return self.__call("SetValDelta", s, delta)
+
+    @stem_controller_module.invalidates_value_cache()
+    def SetValDeltaAndConfirm(self, s: str, delta: float, tolfactor: float, timeout_ms: int) -> bool:
+        return self.__call("SetValDeltaAndConfirm", s, delta, tolfactor, timeout_ms)
+
+    @stem_controller_module.invalidates_value_cache()
+    def InformControl(self, s: str, val: float) -> bool:
+        return self.__call("InformControl", s, val)
+
+    def HasValError(self, s: str) -> bool:
+        return self.__call("HasValError", s)
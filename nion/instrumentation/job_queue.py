@@ -0,0 +1,436 @@
+# standard libraries
+import copy
+import json
+import logging
+import pathlib
+import threading
+import time
+import typing
+import uuid
+
+# third party libraries
+import numpy
+
+# local libraries
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.swift.model import ImportExportManager
+from nion.utils import Event
+
+
+class JobState:
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETE = "complete"
+    FAILED = "failed"
+    CANCELED = "canceled"
+
+
+class AcquisitionJobRunnerInterface:
+    """An interface for objects that run one kind of acquisition job."""
+
+    def run(self, spec: typing.Mapping) -> typing.Optional[typing.Sequence[DataAndMetadata.DataAndMetadata]]:
+        """Run the acquisition described by spec and return the acquired data. Called on the worker thread."""
+        ...
+
+    def cancel(self) -> None:
+        """Cancel the acquisition in progress. Called from a thread other than the worker thread."""
+        ...
+
+
+class AcquisitionJob:
+    """A single job in the queue. The spec is a json compatible dict with a 'kind' key."""
+
+    def __init__(self, spec: typing.Mapping, job_id: str = None):
+        self.spec = copy.deepcopy(dict(spec))
+        self.job_id = job_id or str(uuid.uuid4())
+        self.state = JobState.PENDING
+        self.error = None
+        self.queued_time = time.time()
+        self.start_time = None
+        self.end_time = None
+        self.result_count = 0
+
+    @property
+    def kind(self) -> str:
+        return self.spec.get("kind")
+
+    @property
+    def duration(self) -> typing.Optional[float]:
+        if self.start_time is not None and self.end_time is not None:
+            return self.end_time - self.start_time
+        return None
+
+    def write_dict(self) -> dict:
+        return {"job_id": self.job_id, "spec": self.spec, "state": self.state, "error": self.error,
+                "queued_time": self.queued_time, "start_time": self.start_time, "end_time": self.end_time,
+                "duration": self.duration, "result_count": self.result_count}
+
+    @classmethod
+    def from_dict(cls, d: typing.Mapping) -> "AcquisitionJob":
+        job = cls(d.get("spec", dict()), d.get("job_id"))
+        job.state = d.get("state", JobState.PENDING)
+        job.error = d.get("error")
+        job.queued_time = d.get("queued_time", job.queued_time)
+        job.start_time = d.get("start_time")
+        job.end_time = d.get("end_time")
+        job.result_count = d.get("result_count", 0)
+        return job
+
+
+def write_xdata(file_path: pathlib.Path, xdata: DataAndMetadata.DataAndMetadata) -> None:
+    """Write the data to a .npy file and the calibrations and metadata to a .json file next to it."""
+    numpy.save(file_path.with_suffix(".npy"), xdata.data)
+    properties = {
+        "intensity_calibration": xdata.intensity_calibration.rpc_dict if xdata.intensity_calibration else None,
+        "dimensional_calibrations": [c.rpc_dict for c in xdata.dimensional_calibrations] if xdata.dimensional_calibrations else None,
+        "metadata": xdata.metadata,
+        "timestamp": xdata.timestamp.isoformat() if xdata.timestamp else None,
+        "is_sequence": xdata.is_sequence,
+        "collection_dimension_count": xdata.collection_dimension_count,
+        "datum_dimension_count": xdata.datum_dimension_count,
+    }
+    with open(file_path.with_suffix(".json"), "w") as fp:
+        json.dump(properties, fp, skipkeys=True, indent=4, default=str)
+
+
+def read_xdata(file_path: pathlib.Path) -> DataAndMetadata.DataAndMetadata:
+    """Read data written with write_xdata. The data is memory mapped."""
+    data = numpy.load(file_path.with_suffix(".npy"), mmap_mode="r")
+    with open(file_path.with_suffix(".json")) as fp:
+        properties = json.load(fp)
+    intensity_calibration = Calibration.Calibration.from_rpc_dict(properties.get("intensity_calibration"))
+    dimensional_calibrations = properties.get("dimensional_calibrations")
+    if dimensional_calibrations is not None:
+        dimensional_calibrations = [Calibration.Calibration.from_rpc_dict(c) for c in dimensional_calibrations]
+    data_descriptor = DataAndMetadata.DataDescriptor(properties.get("is_sequence", False),
+                                                     properties.get("collection_dimension_count", 0),
+                                                     properties.get("datum_dimension_count", len(data.shape)))
+    return DataAndMetadata.new_data_and_metadata(data, intensity_calibration=intensity_calibration,
+                                                 dimensional_calibrations=dimensional_calibrations,
+                                                 metadata=properties.get("metadata"),
+                                                 data_descriptor=data_descriptor)
+
+
+class AcquisitionJobQueue:
+    """Run acquisition jobs back-to-back on a worker thread, persisting queue state and results to save_path.
+
+    Jobs left running when the queue was last saved (for instance because the application quit) are loaded as pending
+    so that they get run again when the queue is resumed.
+    """
+
+    def __init__(self, save_path: pathlib.Path, runners: typing.Optional[typing.Mapping[str, AcquisitionJobRunnerInterface]] = None):
+        self.__save_path = pathlib.Path(save_path)
+        self.__runners = dict(runners or dict())
+        self.__jobs = list()
+        self.__lock = threading.RLock()
+        self.__thread = None
+        self.__cancel_event = threading.Event()
+        self.__current_job = None
+        self.job_state_changed_event = Event.Event()
+        self.queue_finished_event = Event.Event()
+        self.__load()
+
+    def close(self) -> None:
+        self.cancel()
+        self.join()
+
+    @property
+    def jobs(self) -> typing.List[AcquisitionJob]:
+        with self.__lock:
+            return list(self.__jobs)
+
+    @property
+    def current_job(self) -> typing.Optional[AcquisitionJob]:
+        return self.__current_job
+
+    @property
+    def is_running(self) -> bool:
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def register_runner(self, kind: str, runner: AcquisitionJobRunnerInterface) -> None:
+        self.__runners[kind] = runner
+
+    def add_job(self, spec: typing.Mapping) -> AcquisitionJob:
+        assert "kind" in spec, "Acquisition job spec must specify a kind."
+        job = AcquisitionJob(spec)
+        with self.__lock:
+            self.__jobs.append(job)
+            self.__save()
+        return job
+
+    def add_jobs(self, specs: typing.Sequence[typing.Mapping]) -> typing.List[AcquisitionJob]:
+        return [self.add_job(spec) for spec in specs]
+
+    def remove_finished_jobs(self) -> None:
+        with self.__lock:
+            self.__jobs = [job for job in self.__jobs if job.state in (JobState.PENDING, JobState.RUNNING)]
+            self.__save()
+
+    def start(self) -> None:
+        """Start running pending jobs. Does nothing if the queue is already running."""
+        with self.__lock:
+            if self.is_running:
+                return
+            self.__cancel_event.clear()
+            self.__thread = threading.Thread(target=self.__run_jobs, daemon=True)
+            self.__thread.start()
+
+    def cancel(self) -> None:
+        """Cancel the running job and stop the queue. Pending jobs stay pending."""
+        self.__cancel_event.set()
+        job = self.__current_job
+        runner = self.__runners.get(job.kind) if job else None
+        if runner:
+            runner.cancel()
+
+    def resume(self) -> None:
+        """Mark canceled and failed jobs as pending again and start the queue."""
+        self.join()
+        with self.__lock:
+            for job in self.__jobs:
+                if job.state in (JobState.CANCELED, JobState.FAILED):
+                    self.__set_job_state(job, JobState.PENDING)
+            self.__save()
+        self.start()
+
+    def join(self, timeout: float = None) -> bool:
+        """Wait for the worker thread to finish. Return True if it finished."""
+        thread = self.__thread
+        if thread:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def get_results(self, job: AcquisitionJob) -> typing.List[DataAndMetadata.DataAndMetadata]:
+        job_path = self.__job_path(job)
+        return [read_xdata(job_path / str(i)) for i in range(job.result_count)]
+
+    def __job_path(self, job: AcquisitionJob) -> pathlib.Path:
+        return self.__save_path / job.job_id
+
+    def __set_job_state(self, job: AcquisitionJob, state: str) -> None:
+        job.state = state
+        self.job_state_changed_event.fire(job)
+
+    def __next_pending_job(self) -> typing.Optional[AcquisitionJob]:
+        with self.__lock:
+            return next(iter(job for job in self.__jobs if job.state == JobState.PENDING), None)
+
+    def __run_jobs(self) -> None:
+        while not self.__cancel_event.is_set():
+            job = self.__next_pending_job()
+            if not job:
+                break
+            self.__run_job(job)
+        self.queue_finished_event.fire()
+
+    def __run_job(self, job: AcquisitionJob) -> None:
+        runner = self.__runners.get(job.kind)
+        job.error = None
+        job.start_time = time.time()
+        job.end_time = None
+        self.__current_job = job
+        self.__set_job_state(job, JobState.RUNNING)
+        with self.__lock:
+            self.__save()
+        try:
+            if not runner:
+                raise ValueError(f"No runner registered for acquisition job kind '{job.kind}'.")
+            xdata_list = runner.run(job.spec)
+            if self.__cancel_event.is_set():
+                state = JobState.CANCELED
+            else:
+                job_path = self.__job_path(job)
+                job_path.mkdir(parents=True, exist_ok=True)
+                xdata_list = [xdata for xdata in (xdata_list or list()) if xdata is not None]
+                for i, xdata in enumerate(xdata_list):
+                    write_xdata(job_path / str(i), xdata)
+                job.result_count = len(xdata_list)
+                state = JobState.COMPLETE
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            job.error = str(e)
+            state = JobState.CANCELED if self.__cancel_event.is_set() else JobState.FAILED
+        job.end_time = time.time()
+        self.__current_job = None
+        logging.debug(f"acquisition job {job.job_id} ({job.kind}) {state} in {job.duration:g} s")
+        self.__set_job_state(job, state)
+        with self.__lock:
+            self.__save()
+
+    def __save(self) -> None:
+        self.__save_path.mkdir(parents=True, exist_ok=True)
+        queue_path = self.__save_path / "queue.json"
+        # atomically overwrite
+        temp_path = queue_path.with_suffix(".temp")
+        with open(temp_path, "w") as fp:
+            json.dump([job.write_dict() for job in self.__jobs], fp, skipkeys=True, indent=4, default=str)
+        temp_path.replace(queue_path)
+
+    def __load(self) -> None:
+        queue_path = self.__save_path / "queue.json"
+        if queue_path.is_file():
+            with open(queue_path) as fp:
+                job_dicts = json.load(fp)
+            for job_dict in job_dicts:
+                job = AcquisitionJob.from_dict(job_dict)
+                if job.state == JobState.RUNNING:
+                    job.state = JobState.PENDING
+                self.__jobs.append(job)
+
+
+class MultiAcquireRunner(AcquisitionJobRunnerInterface):
+    """Run multi-EELS spectrum (is_spectrum_image False) or spectrum image jobs using a MultiAcquireController.
+
+    The spec may contain 'settings' and 'spectrum_parameters'; they are merged into/replace the values of the
+    controller for this job only.
+    """
+
+    def __init__(self, multi_acquire_controller, is_spectrum_image: bool):
+        self.__controller = multi_acquire_controller
+        self.__is_spectrum_image = is_spectrum_image
+
+    def run(self, spec: typing.Mapping) -> typing.List[DataAndMetadata.DataAndMetadata]:
+        settings = copy.deepcopy(self.__controller.settings)
+        settings.update(spec.get("settings", dict()))
+        spectrum_parameters = copy.deepcopy(spec.get("spectrum_parameters", self.__controller.spectrum_parameters))
+        if self.__is_spectrum_image:
+            return self.__run_spectrum_image(settings, spectrum_parameters)
+        multi_eels_data = self.__controller.acquire_multi_eels_spectrum(settings=settings, spectrum_parameters=spectrum_parameters)
+        xdata_list = list()
+        for data_element, parameters, settings_ in zip(multi_eels_data['data_element_list'], multi_eels_data['parameter_list'], multi_eels_data['settings_list']):
+            xdata = ImportExportManager.convert_data_element_to_data_and_metadata(data_element)
+            metadata = dict(xdata.metadata)
+            metadata['MultiAcquire.parameters'] = dict(parameters)
+            metadata['MultiAcquire.settings'] = dict(settings_)
+            xdata._set_metadata(metadata)
+            xdata_list.append(xdata)
+        return xdata_list
+
+    def __run_spectrum_image(self, settings, spectrum_parameters) -> typing.List[DataAndMetadata.DataAndMetadata]:
+        # assemble the sections sent by the controller the same way the multi-acquire panel does, but in memory.
+        spectra = dict()  # index -> [data, frame_data, frame, xdata, parameters]
+        scan_xdatas = dict()  # (index, channel_id) -> list of xdata
+
+        def add_frame(entry):
+            if entry[1] is not None:
+                entry[0] += entry[1]
+                entry[1][...] = 0
+
+        def new_data_ready(data_dict):
+            parameters = data_dict['parameters']
+            index = parameters['index']
+            if data_dict.get('is_scan_data'):
+                for scan_xdata in data_dict['xdata_list']:
+                    channel_id = scan_xdata.metadata.get('hardware_source', dict()).get('channel_id')
+                    scan_xdatas.setdefault((index, channel_id), list()).append(scan_xdata)
+                return
+            xdata = data_dict['xdata']
+            dest_sub_area = data_dict['dest_sub_area']
+            current_frame = parameters['current_frame']
+            number_frames = parameters['frames']
+            sum_frames = data_dict['settings']['sum_frames']
+            entry = spectra.get(index)
+            if entry is None:
+                shape = tuple(parameters['complete_shape'])
+                if number_frames > 1 and not sum_frames:
+                    shape = (number_frames,) + shape
+                shape += tuple(xdata.datum_dimension_shape)
+                # partial updates repeat the section so far; so sums are done once per frame from a frame buffer.
+                frame_data = numpy.zeros(shape, numpy.float32) if sum_frames and number_frames > 1 else None
+                entry = [numpy.zeros(shape, numpy.float32), frame_data, current_frame, xdata, dict(parameters)]
+                spectra[index] = entry
+            if entry[2] != current_frame:
+                add_frame(entry)
+                entry[2] = current_frame
+            entry[3] = xdata
+            if entry[1] is not None:
+                entry[1][dest_sub_area.slice] = xdata.data
+            elif number_frames > 1 and not sum_frames:
+                entry[0][(current_frame,) + dest_sub_area.slice] = xdata.data
+            else:
+                entry[0][dest_sub_area.slice] = xdata.data
+
+        with self.__controller.new_data_ready_event.listen(new_data_ready):
+            self.__controller.acquire_multi_eels_spectrum_image(settings=settings, spectrum_parameters=spectrum_parameters)
+
+        xdata_list = list()
+        for index in sorted(spectra.keys()):
+            data, frame_data, current_frame, xdata, parameters = spectra[index]
+            add_frame(spectra[index])
+            metadata = dict(xdata.metadata)
+            metadata['MultiAcquire.parameters'] = parameters
+            metadata['MultiAcquire.settings'] = dict(settings)
+            xdata_list.append(DataAndMetadata.new_data_and_metadata(data,
+                                                                    intensity_calibration=xdata.intensity_calibration,
+                                                                    dimensional_calibrations=xdata.dimensional_calibrations,
+                                                                    metadata=metadata,
+                                                                    data_descriptor=xdata.data_descriptor))
+        for key in sorted(scan_xdatas.keys(), key=str):
+            scan_xdata_list = scan_xdatas[key]
+            if len(scan_xdata_list) == 1:
+                xdata_list.append(scan_xdata_list[0])
+            elif settings['sum_frames']:
+                scan_xdata = scan_xdata_list[0]
+                xdata_list.append(DataAndMetadata.new_data_and_metadata(numpy.sum([x.data for x in scan_xdata_list], axis=0),
+                                                                        intensity_calibration=scan_xdata.intensity_calibration,
+                                                                        dimensional_calibrations=scan_xdata.dimensional_calibrations,
+                                                                        metadata=scan_xdata.metadata,
+                                                                        data_descriptor=scan_xdata.data_descriptor))
+            else:
+                scan_xdata = scan_xdata_list[0]
+                data_descriptor = DataAndMetadata.DataDescriptor(True, scan_xdata.collection_dimension_count, scan_xdata.datum_dimension_count)
+                xdata_list.append(DataAndMetadata.new_data_and_metadata(numpy.stack([x.data for x in scan_xdata_list]),
+                                                                        intensity_calibration=scan_xdata.intensity_calibration,
+                                                                        dimensional_calibrations=[Calibration.Calibration()] + list(scan_xdata.dimensional_calibrations),
+                                                                        metadata=scan_xdata.metadata,
+                                                                        data_descriptor=data_descriptor))
+        return xdata_list
+
+    def cancel(self) -> None:
+        self.__controller.cancel()
+
+
+class SynchronizedAcquisitionRunner(AcquisitionJobRunnerInterface):
+    """Run synchronized (4D/SI) acquisition jobs.
+
+    The spec may contain 'scan_frame_parameters' and 'camera_frame_parameters' (merged into the current frame
+    parameters), 'sum_frames', 'section_height' and 'drift_interval_lines'. If 'drift_interval_lines' is positive,
+    scan_behavior_fn is called with the scan frame parameters to make the scan behavior (e.g. drift correction) and
+    the acquisition is done in sections of that many lines.
+    """
+
+    def __init__(self, scan_hardware_source, camera_hardware_source, scan_behavior_fn: typing.Optional[typing.Callable] = None):
+        self.__scan_hardware_source = scan_hardware_source
+        self.__camera_hardware_source = camera_hardware_source
+        self.__scan_behavior_fn = scan_behavior_fn
+
+    def run(self, spec: typing.Mapping) -> typing.List[DataAndMetadata.DataAndMetadata]:
+        scan_frame_parameters = self.__scan_hardware_source.get_frame_parameters(2)
+        scan_frame_parameters.update(copy.deepcopy(spec.get("scan_frame_parameters", dict())))
+        scan_frame_parameters = self.__scan_hardware_source.get_frame_parameters_from_dict(scan_frame_parameters)
+        scan_frame_parameters["scan_id"] = str(uuid.uuid4())
+        camera_frame_parameters = self.__camera_hardware_source.get_frame_parameters(0)
+        camera_frame_parameters.update(copy.deepcopy(spec.get("camera_frame_parameters", dict())))
+        if spec.get("sum_frames"):
+            camera_frame_parameters["processing"] = "sum_project"
+        section_height = spec.get("section_height")
+        scan_behavior = None
+        drift_interval_lines = spec.get("drift_interval_lines", 0)
+        if drift_interval_lines > 0 and callable(self.__scan_behavior_fn):
+            scan_behavior = self.__scan_behavior_fn(scan_frame_parameters)
+            section_height = drift_interval_lines
+        combined_data = self.__scan_hardware_source.grab_synchronized(scan_frame_parameters=scan_frame_parameters,
+                                                                      camera=self.__camera_hardware_source,
+                                                                      camera_frame_parameters=camera_frame_parameters,
+                                                                      section_height=section_height,
+                                                                      scan_behavior=scan_behavior)
+        if combined_data is None:
+            return list()
+        scan_data_list, camera_data_list = combined_data
+        return list(scan_data_list) + list(camera_data_list)
+
+    def cancel(self) -> None:
+        self.__scan_hardware_source.grab_synchronized_abort()
@@ -0,0 +1,448 @@
+# standard libraries
+import abc
+import concurrent.futures
+import threading
+import typing
+
+# third party libraries
+import numpy
+
+# local libraries
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.instrumentation import camera_base
+from nion.utils import Event
+from nion.utils import Geometry
+
+
+class SectionReducer(abc.ABC):
+    """Reduce the camera data of a synchronized acquisition to scan shaped maps while the scan is running.
+
+    Subclasses provide the output names and implement reduce, which maps a block of detector frames with shape
+    (n, *datum_shape) to an array with shape (n, output_count). Anything depending only on the datum shape (masks,
+    coordinate grids, fit matrices) should be precomputed in _prepare, which is called once per acquisition.
+
+    The data_changed_event is fired with the updated rectangle (in scan coordinates) after each update. It is fired on
+    the acquisition thread; use get_xdatas to read the current maps.
+    """
+
+    def __init__(self):
+        self.data_changed_event = Event.Event()
+        self.__outputs: typing.Optional[numpy.ndarray] = None
+        self.__scan_size = Geometry.IntSize()
+        self.__scan_calibrations: typing.Tuple[Calibration.Calibration, ...] = tuple()
+        self.__metadata: typing.Dict = dict()
+
+    @property
+    @abc.abstractmethod
+    def output_names(self) -> typing.Sequence[str]:
+        """Return the names of the output maps."""
+        ...
+
+    def get_output_intensity_calibration(self, index: int) -> typing.Optional[Calibration.Calibration]:
+        return None
+
+    @property
+    def scan_size(self) -> Geometry.IntSize:
+        return self.__scan_size
+
+    def prepare(self, scan_size: Geometry.IntSize, datum_shape: typing.Tuple[int, ...],
+                scan_calibrations: typing.Sequence[Calibration.Calibration] = None,
+                data_calibrations: typing.Sequence[Calibration.Calibration] = None, metadata: typing.Mapping = None) -> None:
+        """Allocate the output maps and precompute anything depending on the datum shape."""
+        self.__outputs = numpy.zeros((len(self.output_names),) + tuple(scan_size), numpy.float32)
+        self.__scan_size = Geometry.IntSize.make(scan_size)
+        self.__scan_calibrations = tuple(scan_calibrations) if scan_calibrations else tuple()
+        self.__metadata = dict(metadata) if metadata else dict()
+        self._prepare(tuple(datum_shape), tuple(data_calibrations) if data_calibrations else tuple())
+
+    def _prepare(self, datum_shape: typing.Tuple[int, ...], data_calibrations: typing.Tuple[Calibration.Calibration, ...]) -> None:
+        pass
+
+    @abc.abstractmethod
+    def reduce(self, data: numpy.ndarray) -> numpy.ndarray:
+        """Reduce a block of frames with shape (n, *datum_shape) to an array with shape (n, output_count)."""
+        ...
+
+    def update(self, data: numpy.ndarray, dest_rect: Geometry.IntRect) -> None:
+        """Reduce data with shape (height, width, *datum_shape) into dest_rect of the output maps."""
+        height, width = data.shape[0], data.shape[1]
+        if height * width == 0:
+            return
+        reduced = self._reduce_block(data, dest_rect)
+        self.__outputs[(slice(None),) + dest_rect.slice] = reduced.T.reshape(-1, height, width)
+
+    def _reduce_block(self, data: numpy.ndarray, dest_rect: Geometry.IntRect) -> numpy.ndarray:
+        # subclasses which need the scan position of each frame can override this instead of reduce.
+        return self.reduce(data.reshape((data.shape[0] * data.shape[1],) + data.shape[2:]))
+
+    def get_xdata(self, index: int, rect: Geometry.IntRect = None) -> DataAndMetadata.DataAndMetadata:
+        """Return the output map at index, or the rect part of it. The data is a copy."""
+        metadata = dict(self.__metadata)
+        metadata["reduction"] = {"name": self.output_names[index]}
+        data = self.__outputs[index][rect.slice] if rect is not None else self.__outputs[index]
+        return DataAndMetadata.new_data_and_metadata(numpy.copy(data),
+                                                     intensity_calibration=self.get_output_intensity_calibration(index),
+                                                     dimensional_calibrations=self.__scan_calibrations or None,
+                                                     metadata=metadata)
+
+    def get_xdatas(self) -> typing.List[DataAndMetadata.DataAndMetadata]:
+        """Return the output maps. The data is a copy."""
+        if self.__outputs is None:
+            return list()
+        return [self.get_xdata(index) for index in range(len(self.output_names))]
+
+
+def make_disk_mask(shape: typing.Tuple[int, int], center: typing.Tuple[float, float], radius: float) -> numpy.ndarray:
+    return make_annular_mask(shape, center, 0, radius)
+
+
+def make_annular_mask(shape: typing.Tuple[int, int], center: typing.Tuple[float, float], inner_radius: float, outer_radius: float) -> numpy.ndarray:
+    """Return a boolean mask which is True where inner_radius <= distance from center (in pixels) < outer_radius."""
+    yy, xx = numpy.ogrid[0:shape[0], 0:shape[1]]
+    distance_squared = (yy - center[0]) ** 2 + (xx - center[1]) ** 2
+    return (distance_squared >= inner_radius ** 2) & (distance_squared < outer_radius ** 2)
+
+
+class VirtualDetectorReducer(SectionReducer):
+    """Compute virtual detector images (bright field, annular dark field, etc.) from detector masks.
+
+    Masks have the datum shape. Binary masks covering at most sparse_fraction of the detector are applied by summing
+    the pixels at precomputed indexes; all other masks are used as weights and applied together as one matrix
+    product.
+    """
+
+    def __init__(self, masks: typing.Mapping[str, numpy.ndarray], *, sparse_fraction: float = 0.25):
+        super().__init__()
+        self.__names = list(masks.keys())
+        self.__masks = [numpy.asarray(mask) for mask in masks.values()]
+        self.__sparse_fraction = sparse_fraction
+        self.__sparse_indexes: typing.List[typing.Tuple[int, numpy.ndarray]] = list()
+        self.__weighted_outputs: typing.List[int] = list()
+        self.__weights: typing.Optional[numpy.ndarray] = None
+
+    @property
+    def output_names(self) -> typing.Sequence[str]:
+        return self.__names
+
+    def _prepare(self, datum_shape: typing.Tuple[int, ...], data_calibrations: typing.Tuple[Calibration.Calibration, ...]) -> None:
+        self.__sparse_indexes = list()
+        self.__weighted_outputs = list()
+        weights_list = list()
+        for index, mask in enumerate(self.__masks):
+            if mask.shape != datum_shape:
+                raise ValueError(f"Mask '{self.__names[index]}' shape {mask.shape} does not match the detector shape {datum_shape}.")
+            flat_mask = mask.reshape(-1)
+            is_binary = mask.dtype == bool or numpy.all((flat_mask == 0) | (flat_mask == 1))
+            mask_indexes = numpy.flatnonzero(flat_mask)
+            if is_binary and len(mask_indexes) <= self.__sparse_fraction * flat_mask.size:
+                self.__sparse_indexes.append((index, mask_indexes))
+            else:
+                self.__weighted_outputs.append(index)
+                weights_list.append(flat_mask.astype(numpy.float32))
+        self.__weights = numpy.stack(weights_list, axis=1) if weights_list else None
+
+    def reduce(self, data: numpy.ndarray) -> numpy.ndarray:
+        flat_data = data.reshape(data.shape[0], -1)
+        result = numpy.empty((flat_data.shape[0], len(self.__names)), numpy.float32)
+        for index, mask_indexes in self.__sparse_indexes:
+            result[:, index] = numpy.sum(flat_data[:, mask_indexes], axis=1, dtype=numpy.float64)
+        if self.__weights is not None:
+            result[:, self.__weighted_outputs] = flat_data.astype(numpy.float32, copy=False) @ self.__weights
+        return result
+
+
+class CenterOfMassReducer(SectionReducer):
+    """Compute center of mass (for differential phase contrast) and integrated intensity maps from 2D detector frames.
+
+    The center of mass is measured from the detector center, in pixels or, if calibrated is True, in the calibrated
+    units of the detector. Pixels outside of mask are ignored; if threshold is not None, so are pixels below it. The
+    intensity and both first moments are computed as a single matrix product with precomputed coordinate weights.
+    """
+
+    def __init__(self, *, mask: numpy.ndarray = None, threshold: float = None, calibrated: bool = False):
+        super().__init__()
+        self.__mask = numpy.asarray(mask) if mask is not None else None
+        self.threshold = threshold
+        self.__calibrated = calibrated
+        self.__weights: typing.Optional[numpy.ndarray] = None
+        self.__units = str()
+
+    @property
+    def output_names(self) -> typing.Sequence[str]:
+        return "com_x", "com_y", "intensity"
+
+    def get_output_intensity_calibration(self, index: int) -> typing.Optional[Calibration.Calibration]:
+        return Calibration.Calibration(units=self.__units) if index < 2 and self.__units else None
+
+    def _prepare(self, datum_shape: typing.Tuple[int, ...], data_calibrations: typing.Tuple[Calibration.Calibration, ...]) -> None:
+        if len(datum_shape) != 2:
+            raise ValueError(f"Center of mass requires 2D detector frames, not {datum_shape}.")
+        if self.__mask is not None and self.__mask.shape != datum_shape:
+            raise ValueError(f"Mask shape {self.__mask.shape} does not match the detector shape {datum_shape}.")
+        y_coordinates = numpy.arange(datum_shape[0], dtype=numpy.float32) - (datum_shape[0] - 1) / 2
+        x_coordinates = numpy.arange(datum_shape[1], dtype=numpy.float32) - (datum_shape[1] - 1) / 2
+        self.__units = str()
+        if self.__calibrated and len(data_calibrations) == 2:
+            y_coordinates *= data_calibrations[0].scale
+            x_coordinates *= data_calibrations[1].scale
+            self.__units = data_calibrations[1].units or str()
+        yy, xx = numpy.meshgrid(y_coordinates, x_coordinates, indexing="ij")
+        mask = self.__mask.astype(numpy.float32) if self.__mask is not None else numpy.ones(datum_shape, numpy.float32)
+        self.__weights = numpy.stack([(mask * xx).reshape(-1), (mask * yy).reshape(-1), mask.reshape(-1)], axis=1)
+
+    def reduce(self, data: numpy.ndarray) -> numpy.ndarray:
+        flat_data = data.reshape(data.shape[0], -1).astype(numpy.float32, copy=False)
+        if self.threshold is not None:
+            flat_data = numpy.where(flat_data >= self.threshold, flat_data, 0).astype(numpy.float32, copy=False)
+        moments = flat_data @ self.__weights
+        intensity = moments[:, 2]
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            moments[:, 0:2] = numpy.where(intensity[:, numpy.newaxis] > 0, moments[:, 0:2] / intensity[:, numpy.newaxis], 0)
+        return moments
+
+
+class EELSEdgeMapReducer(SectionReducer):
+    """Compute background subtracted EELS edge integral maps from spectra.
+
+    Each edge is given as a pair of (start, end) energy windows in eV: the pre-edge window used to fit a power law
+    background A * E^-r and the signal window over which the background subtracted intensity is integrated. The fit
+    and background matrices are precomputed once from the energy calibration; each block of spectra is then fitted and
+    integrated with a few matrix products. Two dimensional detector frames are summed vertically first.
+
+    The energy_offset (eV) is added to the energy calibration of the spectra, for instance the energy offset of a
+    shifted spectrum in MultiAcquire.
+    """
+
+    def __init__(self, edges: typing.Mapping[str, typing.Tuple[typing.Tuple[float, float], typing.Tuple[float, float]]], *,
+                 energy_offset: float = 0.0):
+        super().__init__()
+        self.__names = list(edges.keys())
+        self.__windows = list(edges.values())
+        self.energy_offset = energy_offset
+        self.__edges: typing.List[typing.Tuple[slice, numpy.ndarray, slice, numpy.ndarray]] = list()
+
+    @property
+    def output_names(self) -> typing.Sequence[str]:
+        return self.__names
+
+    def _prepare(self, datum_shape: typing.Tuple[int, ...], data_calibrations: typing.Tuple[Calibration.Calibration, ...]) -> None:
+        energy_calibration = data_calibrations[-1] if data_calibrations else Calibration.Calibration()
+        channel_count = datum_shape[-1]
+        # the energy at the center of each channel
+        energies = numpy.array([energy_calibration.convert_to_calibrated_value(i + 0.5) + self.energy_offset for i in range(channel_count)])
+        self.__edges = list()
+        for name, (pre_edge_window, signal_window) in zip(self.__names, self.__windows):
+            pre_edge_slice = self.__get_window_slice(energies, pre_edge_window)
+            signal_slice = self.__get_window_slice(energies, signal_window)
+            if pre_edge_slice.stop - pre_edge_slice.start < 2 or signal_slice.stop - signal_slice.start < 1:
+                raise ValueError(f"Edge '{name}' windows must cover at least two pre-edge and one signal channel.")
+            if energies[pre_edge_slice.start] <= 0 or energies[signal_slice.start] <= 0:
+                raise ValueError(f"Edge '{name}' windows must be at positive energies for the power law background.")
+            # log(I) = log(A) - r log(E) is linear in (1, log(E)); the least squares solution is a fixed linear map.
+            pre_edge_design = numpy.stack([numpy.ones(pre_edge_slice.stop - pre_edge_slice.start), numpy.log(energies[pre_edge_slice])], axis=1)
+            fit_matrix = numpy.linalg.pinv(pre_edge_design).T.astype(numpy.float32)
+            signal_design = numpy.stack([numpy.ones(signal_slice.stop - signal_slice.start), numpy.log(energies[signal_slice])], axis=0).astype(numpy.float32)
+            self.__edges.append((pre_edge_slice, fit_matrix, signal_slice, signal_design))
+
+    @staticmethod
+    def __get_window_slice(energies: numpy.ndarray, window: typing.Tuple[float, float]) -> slice:
+        start, stop = numpy.searchsorted(energies, sorted(window))
+        return slice(int(start), int(stop))
+
+    def reduce(self, data: numpy.ndarray) -> numpy.ndarray:
+        spectra = data.reshape(data.shape[0], -1, data.shape[-1]).sum(axis=1, dtype=numpy.float32) if len(data.shape) > 2 else data.astype(numpy.float32, copy=False)
+        result = numpy.empty((spectra.shape[0], len(self.__edges)), numpy.float32)
+        for index, (pre_edge_slice, fit_matrix, signal_slice, signal_design) in enumerate(self.__edges):
+            coefficients = numpy.log(numpy.maximum(spectra[:, pre_edge_slice], 1e-6)) @ fit_matrix
+            background = numpy.sum(numpy.exp(coefficients @ signal_design), axis=1)
+            result[:, index] = numpy.sum(spectra[:, signal_slice], axis=1) - background
+        return result
+
+
+class ElectronCountingReducer(SectionReducer):
+    """Count the electron events in each frame of a synchronized acquisition.
+
+    The output is a map of the event count at each scan position. The events themselves are kept as a compact list
+    (see camera_base.count_electrons) and are available as one sparse frame per scan position from get_sparse_frames;
+    combine with keep_camera_data=False in grab_synchronized to avoid keeping the dense camera data.
+    """
+
+    def __init__(self, threshold: float, *, find_maxima: bool = True):
+        super().__init__()
+        self.threshold = threshold
+        self.find_maxima = find_maxima
+        self.__frame_shape: typing.Tuple[int, ...] = tuple()
+        self.__lock = threading.RLock()
+        self.__event_chunks: typing.List[typing.Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]] = list()
+
+    @property
+    def output_names(self) -> typing.Sequence[str]:
+        return ("counts",)
+
+    def get_output_intensity_calibration(self, index: int) -> typing.Optional[Calibration.Calibration]:
+        return Calibration.Calibration(units="e")
+
+    def _prepare(self, datum_shape: typing.Tuple[int, ...], data_calibrations: typing.Tuple[Calibration.Calibration, ...]) -> None:
+        if len(datum_shape) != 2:
+            raise ValueError("Electron counting requires two dimensional camera data.")
+        self.__frame_shape = datum_shape
+        with self.__lock:
+            self.__event_chunks = list()
+
+    def reduce(self, data: numpy.ndarray) -> numpy.ndarray:
+        frame_indexes, y, x = camera_base.find_electron_events(data, self.threshold, find_maxima=self.find_maxima)
+        return numpy.bincount(frame_indexes, minlength=data.shape[0]).reshape(-1, 1)
+
+    def _reduce_block(self, data: numpy.ndarray, dest_rect: Geometry.IntRect) -> numpy.ndarray:
+        height, width = data.shape[0], data.shape[1]
+        frame_indexes, y, x = camera_base.find_electron_events(data.reshape((height * width,) + data.shape[2:]), self.threshold, find_maxima=self.find_maxima)
+        scan_indexes = (dest_rect.top + frame_indexes // width) * self.scan_size.width + dest_rect.left + frame_indexes % width
+        with self.__lock:
+            self.__event_chunks.append((scan_indexes, y, x))
+        return numpy.bincount(frame_indexes, minlength=height * width).reshape(-1, 1)
+
+    def get_sparse_frames(self) -> camera_base.SparseFrames:
+        """Return the events counted so far as one sparse frame per scan position, in scan order."""
+        with self.__lock:
+            event_chunks = list(self.__event_chunks)
+        frame_count = self.scan_size.height * self.scan_size.width
+        if event_chunks:
+            scan_indexes, y, x = [numpy.concatenate(arrays) for arrays in zip(*event_chunks)]
+        else:
+            scan_indexes, y, x = numpy.zeros((0,), numpy.int64), numpy.zeros((0,), numpy.int64), numpy.zeros((0,), numpy.int64)
+        return camera_base.SparseFrames.from_events(frame_count, self.__frame_shape, scan_indexes, y, x)
+
+
+class StorageFormat:
+    """Convert the camera data of a synchronized acquisition to the form in which it is stored.
+
+    Each datum is cropped to crop (a (start, stop) pair per datum dimension, None for the full extent), summed over
+    bins of binning pixels per datum dimension (a remainder which does not fill a bin is dropped), and converted to
+    dtype. Values outside of the range of dtype are clipped to it and counted in clipped_count; non-integer values are
+    rounded when converting to an integer dtype.
+    """
+
+    dtypes = (numpy.uint16, numpy.uint32, numpy.float16, numpy.float32)
+
+    def __init__(self, *, dtype=numpy.float32, binning: typing.Sequence[int] = None,
+                 crop: typing.Sequence[typing.Optional[typing.Tuple[int, int]]] = None):
+        self.dtype = numpy.dtype(dtype)
+        if self.dtype.type not in StorageFormat.dtypes:
+            raise ValueError(f"Unsupported storage dtype {self.dtype}.")
+        self.binning = tuple(int(b) for b in binning) if binning else tuple()
+        if any(b < 1 for b in self.binning):
+            raise ValueError("Binning factors must be positive.")
+        self.crop = tuple(crop) if crop else tuple()
+        self.clipped_count = 0
+        self.__value_range = (numpy.iinfo(self.dtype).min, numpy.iinfo(self.dtype).max) if self.dtype.kind == "u" else (-numpy.finfo(self.dtype).max, numpy.finfo(self.dtype).max)
+
+    def __get_crop_slices(self, datum_shape: typing.Tuple[int, ...]) -> typing.Tuple[slice, ...]:
+        crop = self.crop + (None,) * (len(datum_shape) - len(self.crop))
+        slices = list()
+        for length, crop_range in zip(datum_shape, crop):
+            start, stop = (max(0, crop_range[0]), min(length, crop_range[1])) if crop_range else (0, length)
+            if stop <= start:
+                raise ValueError(f"Crop {crop_range} is outside of the detector.")
+            slices.append(slice(start, stop))
+        return tuple(slices)
+
+    def __get_binning(self, datum_shape: typing.Tuple[int, ...]) -> typing.Tuple[int, ...]:
+        return self.binning + (1,) * (len(datum_shape) - len(self.binning))
+
+    def get_datum_shape(self, datum_shape: typing.Sequence[int]) -> typing.Tuple[int, ...]:
+        """Return the stored datum shape for camera data with datum_shape."""
+        datum_shape = tuple(datum_shape)
+        if len(self.crop) > len(datum_shape) or len(self.binning) > len(datum_shape):
+            raise ValueError("Crop and binning must not have more dimensions than the camera data.")
+        stored_shape = tuple((s.stop - s.start) // b for s, b in zip(self.__get_crop_slices(datum_shape), self.__get_binning(datum_shape)))
+        if 0 in stored_shape:
+            raise ValueError("Binning is larger than the cropped detector.")
+        return stored_shape
+
+    def get_data_calibrations(self, datum_shape: typing.Sequence[int], data_calibrations: typing.Sequence[Calibration.Calibration]) -> typing.Tuple[Calibration.Calibration, ...]:
+        """Return the calibrations of the stored datum, keeping the calibrated position of the first stored pixel."""
+        calibrations = list()
+        for crop_slice, bin_factor, calibration in zip(self.__get_crop_slices(tuple(datum_shape)), self.__get_binning(tuple(datum_shape)), data_calibrations):
+            calibrations.append(Calibration.Calibration(offset=calibration.offset + crop_slice.start * calibration.scale,
+                                                        scale=calibration.scale * bin_factor, units=calibration.units))
+        return tuple(calibrations)
+
+    def convert(self, data: numpy.ndarray, datum_rank: int) -> numpy.ndarray:
+        """Convert data with shape (..., *datum_shape) where the datum has datum_rank dimensions."""
+        collection_shape, datum_shape = data.shape[:data.ndim - datum_rank], data.shape[data.ndim - datum_rank:]
+        stored_shape = self.get_datum_shape(datum_shape)
+        data = data[(Ellipsis,) + self.__get_crop_slices(datum_shape)]
+        binning = self.__get_binning(datum_shape)
+        if any(b > 1 for b in binning):
+            data = data[(Ellipsis,) + tuple(slice(0, n * b) for n, b in zip(stored_shape, binning))]
+            binned_shape = collection_shape + tuple(d for n, b in zip(stored_shape, binning) for d in (n, b))
+            bin_axes = tuple(len(collection_shape) + 2 * i + 1 for i in range(len(binning)))
+            accumulator_dtype = numpy.float64 if data.dtype.kind in "fc" else numpy.int64
+            data = numpy.sum(data.reshape(binned_shape), axis=bin_axes, dtype=accumulator_dtype)
+        if data.dtype != self.dtype:
+            minimum, maximum = self.__value_range
+            if data.size and (numpy.amin(data) < minimum or numpy.amax(data) > maximum):
+                self.clipped_count += int(numpy.count_nonzero((data < minimum) | (data > maximum)))
+                data = numpy.clip(data, minimum, maximum)
+            if self.dtype.kind == "u" and data.dtype.kind in "fc":
+                data = numpy.rint(data)
+        return data.astype(self.dtype, copy=False)
+
+
+class ReductionStage:
+    """Apply section reducers to the camera data of a synchronized acquisition as it arrives.
+
+    Pass a reduction stage to ScanHardwareSource.grab_synchronized. Each update reduces only the rows which became
+    valid since the previous update of the section. If thread_count is greater than one, the rows are split into
+    chunks which are reduced on a thread pool; the update still returns only when all chunks are reduced.
+    """
+
+    def __init__(self, reducers: typing.Sequence[SectionReducer], *, thread_count: int = 1):
+        self.reducers = list(reducers)
+        self.__thread_count = max(1, thread_count)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(self.__thread_count) if self.__thread_count > 1 else None
+        self.__section_rect: typing.Optional[Geometry.IntRect] = None
+        self.__reduced_rows = 0
+
+    def close(self) -> None:
+        if self.__executor:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    def prepare(self, grab_sync_info) -> None:
+        """Prepare the reducers for an acquisition described by a GrabSynchronizedInfo."""
+        metadata = {"hardware_source": grab_sync_info.camera_metadata, "scan_detector": grab_sync_info.scan_metadata}
+        for reducer in self.reducers:
+            reducer.prepare(grab_sync_info.scan_size, tuple(grab_sync_info.camera_readout_size_squeezed),
+                            grab_sync_info.scan_calibrations, grab_sync_info.data_calibrations, metadata)
+        self.__section_rect = None
+        self.__reduced_rows = 0
+
+    def update(self, section_xdata: DataAndMetadata.DataAndMetadata, section_rect: Geometry.IntRect, valid_rows: int) -> None:
+        """Reduce the newly valid rows of the section. The section data has the collection shape of section_rect."""
+        if section_rect != self.__section_rect:
+            self.__section_rect = section_rect
+            self.__reduced_rows = 0
+        row_start = self.__reduced_rows
+        row_stop = min(valid_rows, section_rect.height)
+        if row_stop <= row_start:
+            return
+        self.__reduced_rows = row_stop
+        data = section_xdata.data
+        dest_rect = Geometry.IntRect.from_tlhw(section_rect.top + row_start, section_rect.left, row_stop - row_start, section_rect.width)
+        if self.__executor and row_stop - row_start > 1:
+            chunk_rows = (row_stop - row_start + self.__thread_count - 1) // self.__thread_count
+            futures = list()
+            for chunk_start in range(row_start, row_stop, chunk_rows):
+                chunk_stop = min(chunk_start + chunk_rows, row_stop)
+                chunk_rect = Geometry.IntRect.from_tlhw(section_rect.top + chunk_start, section_rect.left, chunk_stop - chunk_start, section_rect.width)
+                for reducer in self.reducers:
+                    futures.append(self.__executor.submit(reducer.update, data[chunk_start:chunk_stop], chunk_rect))
+            for future in futures:
+                future.result()
+        else:
+            for reducer in self.reducers:
+                reducer.update(data[row_start:row_stop], dest_rect)
+        for reducer in self.reducers:
+            reducer.data_changed_event.fire(dest_rect)
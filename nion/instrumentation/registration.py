@@ -0,0 +1,150 @@
+# standard libraries
+import concurrent.futures
+import math
+import typing
+
+# third party libraries
+import numpy
+
+# local libraries
+# None
+
+
+def _upsampled_dft(data: numpy.ndarray, upsampled_region_size: typing.Sequence[int], upsample_factor: int,
+                   axis_offsets: typing.Sequence[float]) -> numpy.ndarray:
+    # evaluate the inverse DFT of data on a small upsampled region using matrix multiplies. this is much faster than
+    # zero padding the full spectrum when only the region around the peak is needed (Guizar-Sicairos et al., 2008).
+    for n_items, upsampled_size, axis_offset in zip(data.shape[::-1], upsampled_region_size[::-1], axis_offsets[::-1]):
+        kernel = (numpy.arange(upsampled_size) - axis_offset)[:, numpy.newaxis] * numpy.fft.fftfreq(n_items, upsample_factor)
+        kernel = numpy.exp(-2j * numpy.pi * kernel)
+        data = numpy.tensordot(kernel, data, axes=(1, -1))
+    return data
+
+
+def _wrapped_peak(cross_correlation: numpy.ndarray) -> numpy.ndarray:
+    shape = numpy.array(cross_correlation.shape)
+    peak = numpy.array(numpy.unravel_index(numpy.argmax(cross_correlation), cross_correlation.shape), dtype=float)
+    peak[peak > shape // 2] -= shape[peak > shape // 2]
+    return peak
+
+
+def register_fft(reference_fft: numpy.ndarray, data_fft: numpy.ndarray, upsample_factor: int = 1) -> numpy.ndarray:
+    """Return the shift that aligns the data with the reference, given the Fourier transforms of both.
+
+    The shift has the same convention as xd.shift, i.e. shifting the data by the result aligns it with the reference.
+    The integer peak of the cross correlation is refined to 1 / upsample_factor pixels using an upsampled DFT around
+    the peak only. The means of the data and the reference are ignored.
+    """
+    image_product = reference_fft * data_fft.conj()
+    # removing the zero frequency of the product is the same as subtracting the means before correlating.
+    image_product[(0,) * image_product.ndim] = 0
+    shift = _wrapped_peak(numpy.fft.ifftn(image_product).real)
+    if upsample_factor > 1:
+        shift = numpy.round(shift * upsample_factor) / upsample_factor
+        upsampled_region_size = math.ceil(upsample_factor * 1.5)
+        dft_shift = numpy.fix(upsampled_region_size / 2.0)
+        sample_region_offset = dft_shift - shift * upsample_factor
+        cross_correlation = _upsampled_dft(image_product.conj(), (upsampled_region_size,) * image_product.ndim,
+                                           upsample_factor, sample_region_offset).conj()
+        peak = numpy.array(numpy.unravel_index(numpy.argmax(numpy.abs(cross_correlation)), cross_correlation.shape), dtype=float)
+        shift = shift + (peak - dft_shift) / upsample_factor
+    return shift
+
+
+def phase_ramp(shape: typing.Sequence[int], shift: typing.Sequence[float]) -> numpy.ndarray:
+    """Return the Fourier space factor that shifts data of shape by shift when multiplied with its transform."""
+    ramp = numpy.zeros(tuple(shape), dtype=float)
+    for axis, (n, s) in enumerate(zip(shape, shift)):
+        frequencies_shape = [1] * len(shape)
+        frequencies_shape[axis] = n
+        ramp = ramp + numpy.fft.fftfreq(n).reshape(frequencies_shape) * s
+    return numpy.exp(-2j * numpy.pi * ramp)
+
+
+class StackRegistration:
+    """Register and sum a stack of frames.
+
+    Each frame is transformed once for registration; its transform is used both as the data for its own registration
+    and as the reference for the next frame. Frames are processed in batches on a thread pool (numpy releases the GIL
+    during the transforms) and the shifted frames are summed in Fourier space using phase ramps, so only a single
+    inverse transform is needed for the sum.
+
+    If relative_to_previous is True, each frame is registered to the previous one and the shifts accumulate (useful
+    when the frames change gradually through the stack); otherwise each frame is registered to the first frame.
+    """
+
+    def __init__(self, upsample_factor: int = 100, relative_to_previous: bool = True, batch_size: int = 16,
+                 max_workers: typing.Optional[int] = None):
+        self.upsample_factor = upsample_factor
+        self.relative_to_previous = relative_to_previous
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max_workers
+
+    def register(self, stack: numpy.ndarray, progress_fn: typing.Optional[typing.Callable[[int, int], None]] = None) -> numpy.ndarray:
+        """Return the shifts (number of frames x frame rank) that align each frame of the stack with the first frame.
+
+        progress_fn, if given, is called with the number of frames done and the number of frames.
+        """
+        number_frames = stack.shape[0]
+        frame_rank = len(stack.shape) - 1
+        shifts = numpy.zeros((number_frames, frame_rank))
+        first_fft = None
+        previous_fft = None
+
+        def register(ffts):
+            reference_fft, frame_fft = ffts
+            if reference_fft is frame_fft:
+                return numpy.zeros(frame_rank)
+            return register_fft(reference_fft, frame_fft, self.upsample_factor)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for start in range(0, number_frames, self.batch_size):
+                stop = min(start + self.batch_size, number_frames)
+                frame_ffts = list(executor.map(numpy.fft.fftn, stack[start:stop]))
+                if first_fft is None:
+                    first_fft = previous_fft = frame_ffts[0]
+                if self.relative_to_previous:
+                    reference_ffts = [previous_fft] + frame_ffts[:-1]
+                else:
+                    reference_ffts = [first_fft] * len(frame_ffts)
+                batch_shifts = numpy.array(list(executor.map(register, zip(reference_ffts, frame_ffts))))
+                if self.relative_to_previous:
+                    batch_shifts = numpy.cumsum(batch_shifts, axis=0) + (shifts[start - 1] if start > 0 else 0)
+                shifts[start:stop] = batch_shifts
+                previous_fft = frame_ffts[-1]
+                if callable(progress_fn):
+                    progress_fn(stop, number_frames)
+        return shifts
+
+    def sum_shifted(self, stack: numpy.ndarray, shifts: numpy.ndarray, progress_fn: typing.Optional[typing.Callable[[int, int], None]] = None) -> numpy.ndarray:
+        """Return the sum of the frames of the stack shifted by shifts.
+
+        Frames are padded with their mean by the largest shift before transforming so that data shifted out of the
+        frame does not wrap around to the other side, matching xd.shift.
+        """
+        number_frames = stack.shape[0]
+        frame_shape = stack.shape[1:]
+        pad = [int(math.ceil(numpy.amax(numpy.abs(shifts[:, axis])))) + 1 if number_frames else 0 for axis in range(len(frame_shape))]
+        padded_shape = tuple(n + 2 * p for n, p in zip(frame_shape, pad))
+        sum_fft = numpy.zeros(padded_shape, dtype=complex)
+
+        def shifted_fft(frame_and_shift):
+            frame, shift = frame_and_shift
+            padded_frame = numpy.pad(frame, [(p, p) for p in pad], mode="constant", constant_values=numpy.mean(frame))
+            return numpy.fft.fftn(padded_frame) * phase_ramp(padded_shape, shift)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for start in range(0, number_frames, self.batch_size):
+                stop = min(start + self.batch_size, number_frames)
+                # the transform is linear, so the shifted frames can be summed in Fourier space.
+                for frame_fft in executor.map(shifted_fft, zip(stack[start:stop], shifts[start:stop])):
+                    sum_fft += frame_fft
+                if callable(progress_fn):
+                    progress_fn(stop, number_frames)
+        sum_data = numpy.fft.ifftn(sum_fft).real
+        return sum_data[tuple(slice(p, p + n) for n, p in zip(frame_shape, pad))]
+
+    def register_and_sum(self, stack: numpy.ndarray, progress_fn: typing.Optional[typing.Callable[[int, int], None]] = None) -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+        """Return the sum of the aligned frames and the shifts of the stack."""
+        shifts = self.register(stack, progress_fn)
+        return self.sum_shifted(stack, shifts, progress_fn), shifts
@@ -1,6 +1,7 @@
 # standard libraries
 import abc
 import collections
+import concurrent.futures
 import contextlib
 import copy
 import gettext
@@ -14,13 +15,17 @@ import uuid
 import weakref
 
 # third party libraries
-# None
+import numpy
 
 # local libraries
 from nion.data import Calibration
 from nion.data import DataAndMetadata
 from nion.data import Core
+from nion.instrumentation import async_acquisition
+from nion.instrumentation import drift_tracker
+from nion.instrumentation import reduction
 from nion.instrumentation import stem_controller
+from nion.instrumentation import telemetry
 from nion.swift.model import HardwareSource
 from nion.swift.model import ImportExportManager
 from nion.swift.model import Utility
@@ -203,8 +208,30 @@ class SynchronizedScanBehaviorInterface:
     def prepare_section(self) -> SynchronizedScanBehaviorAdjustments: ...
 
 
+class _SynchronizedSectionAborted(Exception):
+    """Raised on the thread of a camera when its section of a synchronized acquisition was canceled or aborted."""
+    pass
+
+
+class SynchronizedCamera:
+    """A camera taking part in a synchronized acquisition.
+
+    Each camera has its own frame parameters and, optionally, its own data channel and reduction stage.
+    """
+
+    def __init__(self, camera, camera_frame_parameters: dict, camera_data_channel: SynchronizedDataChannelInterface = None,
+                 reduction_stage: reduction.ReductionStage = None):
+        self.camera = camera
+        self.camera_frame_parameters = camera_frame_parameters
+        self.camera_data_channel = camera_data_channel
+        self.reduction_stage = reduction_stage
+
+
 class ScanAcquisitionTask(HardwareSource.AcquisitionTask):
 
+    # the smallest drift correction (in pixels) that is applied; smaller corrections are not worth a settle frame.
+    minimum_drift_correction = 0.25
+
     def __init__(self, stem_controller_: stem_controller.STEMController, scan_hardware_source, device,
                  hardware_source_id: str, is_continuous: bool, frame_parameters: ScanFrameParameters,
                  channel_ids: typing.List[str], display_name: str):
@@ -228,9 +255,17 @@ class ScanAcquisitionTask(HardwareSource.AcquisitionTask):
         self.__channel_ids = channel_ids
         self.__last_read_time = 0
         self.__subscan_enabled = False
+        # drift tracking state. the correction is added to the center of the frame parameters on the device.
+        self.__drift_tracker = drift_tracker.DriftTracker()
+        self.__drift_correction_nm = Geometry.FloatSize()
+        self.__drift_reference_correction_nm = Geometry.FloatSize()
+        self.__last_drift_offset_nm = Geometry.FloatSize()
+        self.__drift_settle_frame = False
 
     def set_frame_parameters(self, frame_parameters):
         self.__frame_parameters = ScanFrameParameters(frame_parameters)
+        # the drift reference is only valid for the frame parameters it was acquired with.
+        self.__drift_tracker.reset()
         self.__activate_frame_parameters()
 
     @property
@@ -299,7 +334,8 @@ class ScanAcquisitionTask(HardwareSource.AcquisitionTask):
             data_element["section_state"] = "complete" if complete else "partial"
             data_element["properties"]["valid_rows"] = sub_area[0][0] + sub_area[1][0]
 
-        _data_elements, complete, bad_frame, sub_area, self.__frame_number, self.__pixels_to_skip = self.__device.read_partial(self.__frame_number, self.__pixels_to_skip)
+        with telemetry.registry.span("scan.read_partial"):
+            _data_elements, complete, bad_frame, sub_area, self.__frame_number, self.__pixels_to_skip = self.__device.read_partial(self.__frame_number, self.__pixels_to_skip)
 
         min_period = 0.05
         current_time = time.time()
@@ -324,11 +360,18 @@ class ScanAcquisitionTask(HardwareSource.AcquisitionTask):
             channel_override = self.__frame_parameters.channel_override
             channel_modifier = self.__frame_parameters.channel_modifier
             channel_id = channel_override or (self.__channel_ids[channel_index] + (("_" + channel_modifier) if channel_modifier else ""))
-            update_instrument_properties(data_element["properties"], self.__stem_controller, self.__device)
-            update_scan_data_element(data_element, self.__frame_parameters, _data.shape, self.__scan_id, self.__frame_number, channel_name, channel_id, _scan_properties)
+            with telemetry.registry.span("scan.update_metadata"):
+                update_instrument_properties(data_element["properties"], self.__stem_controller, self.__device)
+                update_scan_data_element(data_element, self.__frame_parameters, _data.shape, self.__scan_id, self.__frame_number, channel_name, channel_id, _scan_properties)
             update_data_element(data_element, complete, sub_area, _data)
             data_elements.append(data_element)
 
+        if complete and not bad_frame:
+            telemetry.registry.increment("scan.frames")
+
+        if complete and not bad_frame and self.__is_continuous:
+            self.__track_drift(data_elements)
+
         if complete or bad_frame:
             # proceed to next frame
             self.__frame_number = None
@@ -337,13 +380,90 @@ class ScanAcquisitionTask(HardwareSource.AcquisitionTask):
 
         return data_elements
 
+    def __track_drift(self, data_elements: typing.Sequence[typing.Mapping]) -> None:
+        # register the drift region of a completed frame against the reference and correct center_nm for the next
+        # frame. the drift region is in context coordinates, so subscan frames are not tracked.
+        scan_hardware_source = self.__weak_scan_hardware_source()
+        if not scan_hardware_source or not scan_hardware_source.drift_tracking_enabled or self.__frame_parameters.subscan_pixel_size:
+            return
+        drift_channel_id = scan_hardware_source.drift_channel_id
+        drift_region = scan_hardware_source.drift_region
+        data_element = next(iter(data_element for data_element in data_elements if data_element["channel_id"] == drift_channel_id), None)
+        if data_element is None or drift_region is None:
+            return
+        if self.__drift_settle_frame:
+            # the frame may have started before the last correction was applied.
+            self.__drift_settle_frame = False
+            return
+        data = data_element["data"]
+        drift_rect = Geometry.IntRect.from_tlbr(int(drift_region.top * data.shape[0]), int(drift_region.left * data.shape[1]),
+                                                int(drift_region.bottom * data.shape[0]), int(drift_region.right * data.shape[1]))
+        if drift_rect.height < 8 or drift_rect.width < 8:
+            return
+        drift_data = numpy.array(data[drift_rect.slice], dtype=float)
+        pixel_size_nm = self.__frame_parameters.fov_nm / self.__frame_parameters.size[1]
+        timestamp = time.time()
+        if not self.__drift_tracker.has_reference:
+            self.__drift_tracker.set_reference(drift_data, timestamp, (pixel_size_nm, pixel_size_nm))
+            self.__drift_reference_correction_nm = self.__drift_correction_nm
+            self.__last_drift_offset_nm = Geometry.FloatSize()
+            return
+        # the offset follows the register_translation convention: if data shifts down/right, offset will be negative.
+        # remove the correction applied since the reference to get the drift of the sample.
+        offset_nm = Geometry.FloatSize.make(tuple(self.__drift_tracker.register(drift_data)))
+        offset_nm -= self.__drift_correction_nm - self.__drift_reference_correction_nm
+        self.__drift_tracker.update(tuple(offset_nm), timestamp)
+        delta_nm = offset_nm - self.__last_drift_offset_nm
+        # skip corrections below the threshold; they accumulate in delta until they are large enough to apply.
+        minimum_correction_nm = self.minimum_drift_correction * pixel_size_nm
+        if abs(delta_nm.height) >= minimum_correction_nm or abs(delta_nm.width) >= minimum_correction_nm:
+            self.__last_drift_offset_nm = offset_nm
+            # a positive center_nm shifts the data up/left, so correct by the negative of the drift.
+            self.__drift_correction_nm -= delta_nm
+            self.__activate_frame_parameters()
+            self.__drift_settle_frame = True
+        scan_hardware_source._append_drift_offset(-self.__drift_correction_nm)
+
     def __activate_frame_parameters(self):
         device_frame_parameters = ScanFrameParameters(self.__frame_parameters)
+        device_frame_parameters.center_nm = tuple(Geometry.FloatPoint.make(device_frame_parameters.center_nm) + self.__drift_correction_nm)
         context_size = Geometry.FloatSize.make(device_frame_parameters.size)
         device_frame_parameters.fov_size_nm = device_frame_parameters.fov_nm * context_size.aspect_ratio, device_frame_parameters.fov_nm
         self.__device.set_frame_parameters(device_frame_parameters)
 
 
+class ScanSubscansAcquisitionTask(ScanAcquisitionTask):
+    """Acquire one frame for each of a list of frame parameters, in sequence, without stopping the device.
+
+    The frames are published through the data channels given by data_channel_ids (a mapping from the channel id of
+    the data element to the channel id of the data channel). The data of each frame is also kept in xdatas_list.
+    """
+
+    def __init__(self, stem_controller_: stem_controller.STEMController, scan_hardware_source, device,
+                 hardware_source_id: str, frame_parameters_list: typing.Sequence[ScanFrameParameters],
+                 channel_ids: typing.List[str], data_channel_ids: typing.Mapping[str, str], display_name: str):
+        # the task is continuous so that the device keeps scanning between frames; it stops after the last frame.
+        super().__init__(stem_controller_, scan_hardware_source, device, hardware_source_id, True, frame_parameters_list[0], channel_ids, display_name)
+        self.__frame_parameters_list = list(frame_parameters_list)
+        self.__data_channel_ids = dict(data_channel_ids)
+        self.__frame_index = 0
+        self.xdatas_list: typing.List[typing.List[DataAndMetadata.DataAndMetadata]] = list()
+
+    def _acquire_data_elements(self):
+        data_elements = super()._acquire_data_elements()
+        if self.__frame_index < len(self.__frame_parameters_list) and all(data_element["section_state"] == "complete" for data_element in data_elements):
+            # the data may point to low level memory which is reused by the next frame; copy here.
+            self.xdatas_list.append([copy.deepcopy(ImportExportManager.convert_data_element_to_data_and_metadata(data_element)) for data_element in data_elements])
+            self.__frame_index += 1
+            if self.__frame_index < len(self.__frame_parameters_list):
+                self.set_frame_parameters(self.__frame_parameters_list[self.__frame_index])
+            else:
+                self.stop()
+        for data_element in data_elements:
+            data_element["channel_id"] = self.__data_channel_ids.get(data_element["channel_id"], data_element["channel_id"])
+        return data_elements
+
+
 class RecordTask:
 
     def __init__(self, hardware_source, frame_parameters):
@@ -390,6 +510,31 @@ class RecordTask:
         self.__hardware_source.abort_recording()
 
 
+class SubscanRegion:
+    """A rotated rectangle, in fractional coordinates of the scan context, to be scanned as a subscan.
+
+    If pixel_size is None, the region is scanned with the pixel spacing of the context; otherwise it is scanned with
+    pixel_size pixels.
+    """
+
+    def __init__(self, region: Geometry.FloatRect, rotation: float = 0.0, pixel_size: Geometry.IntSize = None):
+        self.region = Geometry.FloatRect.make(region)
+        self.rotation = rotation
+        self.pixel_size = Geometry.IntSize.make(pixel_size) if pixel_size is not None else None
+
+    def apply(self, frame_parameters: ScanFrameParameters) -> None:
+        """Set the subscan parameters of frame_parameters to scan this region."""
+        context_size = Geometry.FloatSize.make(frame_parameters["size"])
+        if self.pixel_size is not None:
+            frame_parameters.subscan_pixel_size = tuple(self.pixel_size)
+            frame_parameters.subscan_fractional_size = self.region.height, self.region.width
+        else:
+            frame_parameters.subscan_pixel_size = max(int(context_size.height * self.region.height), 1), max(int(context_size.width * self.region.width), 1)
+            frame_parameters.subscan_fractional_size = frame_parameters.subscan_pixel_size[0] / context_size.height, frame_parameters.subscan_pixel_size[1] / context_size.width
+        frame_parameters.subscan_fractional_center = self.region.center.y, self.region.center.x
+        frame_parameters.subscan_rotation = self.rotation
+
+
 def apply_section_rect(scan_frame_parameters: typing.MutableMapping, section_rect: Geometry.IntRect, scan_size: Geometry.IntSize, fractional_area: Geometry.FloatRect, channel_modifier: str) -> typing.MutableMapping:
     section_rect = Geometry.IntRect.make(section_rect)
     section_rect_f = section_rect.to_float_rect()
@@ -477,11 +622,17 @@ class ScanHardwareSource(HardwareSource.HardwareSource):
         self.record_index = 1  # use to give unique name to recorded images
 
         # synchronized acquisition
-        self.__camera_hardware_source = None
+        self.__camera_hardware_sources = list()
         self.__grab_synchronized_is_scanning = False
         self.__grab_synchronized_aborted = False  # set this flag when abort requested in case low level doesn't follow rules
+        self.__record_subscans_aborted = False
         self.acquisition_state_changed_event = Event.Event()
 
+        # drift tracking during live scanning
+        self.__drift_tracking_enabled = False
+        self.drift_log = drift_tracker.DriftLog()
+        self.drift_log_changed_event = Event.Event()
+
     def close(self):
         # thread needs to close before closing the stem controller. so use this method to
         # do it slightly out of order for this class.
@@ -656,104 +807,111 @@ class ScanHardwareSource(HardwareSource.HardwareSource):
                           camera_frame_parameters: dict = None,
                           camera_data_channel: SynchronizedDataChannelInterface = None,
                           section_height: int = None,
-                          scan_behavior: SynchronizedScanBehaviorInterface = None) -> typing.Optional[typing.Tuple[
+                          scan_behavior: SynchronizedScanBehaviorInterface = None,
+                          reduction_stage: reduction.ReductionStage = None,
+                          keep_camera_data: bool = True,
+                          cameras: typing.Sequence[SynchronizedCamera] = None) -> typing.Optional[typing.Tuple[
         typing.List[DataAndMetadata.DataAndMetadata], typing.List[DataAndMetadata.DataAndMetadata]]]:
-        self.__camera_hardware_source = camera
+        # the reduction stage, if any, reduces the camera data to scan shaped maps as it arrives. if keep_camera_data
+        # is False, the camera data is not accumulated and only the scan data is returned.
+        # cameras, if passed, replaces camera, camera_frame_parameters, camera_data_channel, and reduction_stage. all
+        # cameras are armed for each section and acquire concurrently during the same scan. the returned camera data
+        # has one item for each camera without a data channel, in camera order.
+        if not cameras:
+            cameras = [SynchronizedCamera(camera, camera_frame_parameters, camera_data_channel, reduction_stage)]
+        cameras = list(cameras)
+        self.__camera_hardware_sources = [synchronized_camera.camera for synchronized_camera in cameras]
+        executor = concurrent.futures.ThreadPoolExecutor(len(cameras)) if len(cameras) > 1 else None
         try:
-            self.__stem_controller._enter_synchronized_state(self, camera=camera)
+            for synchronized_camera in cameras:
+                self.__stem_controller._enter_synchronized_state(self, camera=synchronized_camera.camera)
             self.__grab_synchronized_is_scanning = True
             self.acquisition_state_changed_event.fire(self.__grab_synchronized_is_scanning)
             scan_frame_parameters = ScanFrameParameters(scan_frame_parameters)
             scan_frame_parameters.setdefault("scan_id", str(uuid.uuid4()))
             try:
-                scan_info = self.grab_synchronized_get_info(scan_frame_parameters=scan_frame_parameters, camera=camera, camera_frame_parameters=camera_frame_parameters)
+                scan_infos = [self.grab_synchronized_get_info(scan_frame_parameters=scan_frame_parameters, camera=synchronized_camera.camera,
+                                                              camera_frame_parameters=synchronized_camera.camera_frame_parameters)
+                              for synchronized_camera in cameras]
+                scan_info = scan_infos[0]
                 if scan_info.is_subscan:
                     scan_frame_parameters["subscan_pixel_size"] = tuple(scan_info.scan_size)
                 else:
                     scan_frame_parameters["size"] = tuple(scan_info.scan_size)
-                self.__device.prepare_synchronized_scan(scan_frame_parameters, camera_exposure_ms=camera_frame_parameters["exposure_ms"])
+                # the pixel time must allow for the longest camera exposure.
+                camera_exposure_ms = max(synchronized_camera.camera_frame_parameters["exposure_ms"] for synchronized_camera in cameras)
+                self.__device.prepare_synchronized_scan(scan_frame_parameters, camera_exposure_ms=camera_exposure_ms)
                 flyback_pixels = self.__device.flyback_pixels
                 scan_size = scan_info.scan_size
                 scan_param_height, scan_param_width = tuple(scan_size)
                 scan_height = scan_param_height
                 scan_width = scan_param_width + flyback_pixels
                 scan_calibrations = scan_info.scan_calibrations
-                data_calibrations = scan_info.data_calibrations
-                data_intensity_calibration = scan_info.data_intensity_calibration
 
                 # abort the scan to not interfere with setup; and clear the aborted flag
                 self.abort_playing()
                 self.__grab_synchronized_aborted = False
 
+                for synchronized_camera, camera_scan_info in zip(cameras, scan_infos):
+                    if synchronized_camera.reduction_stage:
+                        synchronized_camera.reduction_stage.prepare(camera_scan_info)
+
                 aborted = False
-                data_and_metadata_list = list()  # only used (for return value) if camera_data_channel is None
+                data_and_metadata_lists = [list() for synchronized_camera in cameras]  # only used (for return value) if camera_data_channel is None
                 scan_data_list_list = list()
                 section_height = section_height or scan_height
                 section_count = (scan_height + section_height - 1) // section_height
                 for section in range(section_count):
-                    # print(f"************ {section}/{section_count}")
                     section_rect = Geometry.IntRect.from_tlhw(section * section_height, 0, min(section_height, scan_height - section * section_height), scan_param_width)
-                    if scan_behavior:
-                        adjustments = scan_behavior.prepare_section()
-                        if adjustments.offset_nm:
-                            scan_frame_parameters.center_nm = tuple(Geometry.FloatPoint.make(scan_frame_parameters.center_nm) + adjustments.offset_nm)
-                    scan_shape = (section_rect.height, scan_width)  # includes flyback pixels
-                    self.__camera_hardware_source.set_current_frame_parameters(camera_frame_parameters)
-                    self.__camera_hardware_source.acquire_synchronized_prepare(scan_shape)
+                    with telemetry.registry.span("synchronized.prepare_section"):
+                        if scan_behavior:
+                            adjustments = scan_behavior.prepare_section()
+                            if adjustments.offset_nm:
+                                scan_frame_parameters.center_nm = tuple(Geometry.FloatPoint.make(scan_frame_parameters.center_nm) + adjustments.offset_nm)
+                        scan_shape = (section_rect.height, scan_width)  # includes flyback pixels
+                        for synchronized_camera in cameras:
+                            synchronized_camera.camera.set_current_frame_parameters(synchronized_camera.camera_frame_parameters)
+                            synchronized_camera.camera.acquire_synchronized_prepare(scan_shape)
 
                     section_frame_parameters = apply_section_rect(scan_frame_parameters, section_rect, scan_size, scan_info.fractional_area, scan_info.channel_modifier)
-                    # print(section_rect)
-                    # import pprint
-                    # print(pprint.pformat(section_frame_parameters))
 
                     with contextlib.closing(RecordTask(self, section_frame_parameters)) as scan_task:
                         is_last_section = section_rect.bottom == scan_size[0] and section_rect.right == scan_size[1]
-                        partial_data_info = self.__camera_hardware_source.acquire_synchronized_begin(camera_frame_parameters, scan_shape)
-                        try:
-                            uncropped_xdata = partial_data_info.xdata
-                            is_complete = partial_data_info.is_complete
-                            is_canceled = partial_data_info.is_canceled
-                            # this loop is awkward because to make it easy to implement synchronized begin in a backwards
-                            # compatible manner, it must return all of its data on the first call. this means that we need
-                            # to handle the data by sending it to the channel. and this leads to the awkward implementation
-                            # below.
-                            while uncropped_xdata and not is_canceled and not self.__grab_synchronized_aborted:
-                                # xdata is the full data and includes flyback pixels. crop the flyback pixels in the
-                                # next line, but retain other metadata.
-                                metadata = copy.deepcopy(uncropped_xdata.metadata)
-                                metadata["scan_detector"] = copy.deepcopy(scan_info.scan_metadata)
-                                partial_xdata = crop_and_calibrate(uncropped_xdata, flyback_pixels, scan_calibrations, data_calibrations, data_intensity_calibration, metadata)
-                                if camera_data_channel:
-                                    data_channel_state = "complete" if is_complete and is_last_section else "partial"
-                                    data_channel_data_and_metadata = partial_xdata
-                                    data_channel_sub_area = Geometry.IntRect(Geometry.IntPoint(), Geometry.IntSize.make(data_channel_data_and_metadata.collection_dimension_shape))
-                                    data_channel_view_id = None
-                                    camera_data_channel.update(data_channel_data_and_metadata, data_channel_state,
-                                                               Geometry.IntSize(h=scan_param_height, w=scan_param_width),
-                                                               section_rect, data_channel_sub_area, data_channel_view_id)
-                                # break out if we're complete
-                                if is_complete:
-                                    break
-                                # otherwise, acquire the next section and continue
-                                update_period = camera_data_channel._update_period if hasattr(camera_data_channel, "_update_period") else 1.0
-                                partial_data_info = self.__camera_hardware_source.acquire_synchronized_continue(update_period=update_period)
-                                is_complete = partial_data_info.is_complete
-                                is_canceled = partial_data_info.is_canceled
-                                # unless it's cancelled or aborted, of course.
-                                if is_canceled or self.__grab_synchronized_aborted:
-                                    break
-                        finally:
-                            self.__camera_hardware_source.acquire_synchronized_end()
-                        if uncropped_xdata and not is_canceled and not self.__grab_synchronized_aborted:
+                        section_args = [(synchronized_camera, camera_scan_info, scan_shape, section_rect, is_last_section, flyback_pixels)
+                                        for synchronized_camera, camera_scan_info in zip(cameras, scan_infos)]
+                        if executor:
+                            # each camera blocks while acquiring; drive them concurrently so they follow the same scan.
+                            futures = [executor.submit(self.__acquire_synchronized_section_or_raise, *args) for args in section_args]
+                            done, not_done = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+                            if not_done:
+                                # one camera failed or was aborted; the others would wait for the rest of the scan.
+                                self.__grab_synchronized_aborted = True
+                                for synchronized_camera, future in zip(cameras, futures):
+                                    if future in not_done:
+                                        synchronized_camera.camera.acquire_sequence_cancel()
+                                concurrent.futures.wait(not_done)
+                            uncropped_xdatas = list()
+                            for future in futures:
+                                try:
+                                    uncropped_xdatas.append(future.result())
+                                except _SynchronizedSectionAborted:
+                                    uncropped_xdatas.append(None)
+                        else:
+                            uncropped_xdatas = [self.__acquire_synchronized_section(*args) for args in section_args]
+                        if all(uncropped_xdatas) and not self.__grab_synchronized_aborted:
                             # not aborted
                             # the data_element['data'] ndarray may point to low level memory; we need to get it to disk
                             # quickly. see note below.
                             scan_data_list = scan_task.grab()
-                            metadata = copy.deepcopy(uncropped_xdata.metadata)
-                            metadata["scan_detector"] = copy.deepcopy(scan_info.scan_metadata)
-                            section_xdata = crop_and_calibrate(uncropped_xdata, flyback_pixels, scan_calibrations, data_calibrations, data_intensity_calibration, metadata)
-                            data_and_metadata_list.append(section_xdata)
+                            if keep_camera_data:
+                                for uncropped_xdata, camera_scan_info, data_and_metadata_list in zip(uncropped_xdatas, scan_infos, data_and_metadata_lists):
+                                    metadata = copy.deepcopy(uncropped_xdata.metadata)
+                                    metadata["scan_detector"] = copy.deepcopy(camera_scan_info.scan_metadata)
+                                    with telemetry.registry.span("synchronized.crop_and_calibrate"):
+                                        section_xdata = crop_and_calibrate(uncropped_xdata, flyback_pixels, scan_calibrations, camera_scan_info.data_calibrations, camera_scan_info.data_intensity_calibration, metadata)
+                                    data_and_metadata_list.append(section_xdata)
                             scan_data_list_list.append([scan_data[section_rect.slice] for scan_data in scan_data_list])
+                            telemetry.registry.increment("synchronized.sections")
                         else:
                             # aborted
                             scan_task.cancel()
@@ -775,16 +933,18 @@ class ScanHardwareSource(HardwareSource.HardwareSource):
                     [s1a, s2a, s3a], etc.
                     """
                     # only return the camera data if camera data channel was not passed in
-                    if not camera_data_channel:
-                        camera_data_and_metadata = Core.function_vstack(data_and_metadata_list) if len(data_and_metadata_list) > 1 else data_and_metadata_list[0]
-                        camera_metadata = data_and_metadata_list[0].metadata
-                        camera_data_and_metadata._set_metadata(camera_metadata)
-                        return new_scan_data_list, [camera_data_and_metadata]
-                    else:
-                        return new_scan_data_list, []
+                    camera_data_and_metadata_list = list()
+                    for synchronized_camera, data_and_metadata_list in zip(cameras, data_and_metadata_lists):
+                        if not synchronized_camera.camera_data_channel and data_and_metadata_list:
+                            camera_data_and_metadata = Core.function_vstack(data_and_metadata_list) if len(data_and_metadata_list) > 1 else data_and_metadata_list[0]
+                            camera_metadata = data_and_metadata_list[0].metadata
+                            camera_data_and_metadata._set_metadata(camera_metadata)
+                            camera_data_and_metadata_list.append(camera_data_and_metadata)
+                    return new_scan_data_list, camera_data_and_metadata_list
                 return None
             finally:
-                self.__stem_controller._exit_synchronized_state(self, camera=camera)
+                for synchronized_camera in reversed(cameras):
+                    self.__stem_controller._exit_synchronized_state(self, camera=synchronized_camera.camera)
                 self.__grab_synchronized_is_scanning = False
                 self.acquisition_state_changed_event.fire(self.__grab_synchronized_is_scanning)
                 logging.debug("end sequence acquisition")
@@ -792,12 +952,85 @@ class ScanHardwareSource(HardwareSource.HardwareSource):
             import traceback
             traceback.print_exc()
             raise
+        finally:
+            if executor:
+                executor.shutdown()
+
+    def __acquire_synchronized_section(self, synchronized_camera: SynchronizedCamera, scan_info: GrabSynchronizedInfo,
+                                       scan_shape: typing.Tuple[int, int], section_rect: Geometry.IntRect,
+                                       is_last_section: bool, flyback_pixels: int) -> typing.Optional[DataAndMetadata.DataAndMetadata]:
+        # acquire the section from one camera, passing partial data to its reduction stage and data channel. returns
+        # the uncropped section data or None if the acquisition was canceled or aborted.
+        camera = synchronized_camera.camera
+        camera_frame_parameters = synchronized_camera.camera_frame_parameters
+        camera_data_channel = synchronized_camera.camera_data_channel
+        reduction_stage = synchronized_camera.reduction_stage
+        scan_param_height, scan_param_width = tuple(scan_info.scan_size)
+        partial_data_info = camera.acquire_synchronized_begin(camera_frame_parameters, scan_shape)
+        try:
+            uncropped_xdata = partial_data_info.xdata
+            is_complete = partial_data_info.is_complete
+            is_canceled = partial_data_info.is_canceled
+            # this loop is awkward because to make it easy to implement synchronized begin in a backwards
+            # compatible manner, it must return all of its data on the first call. this means that we need
+            # to handle the data by sending it to the channel. and this leads to the awkward implementation
+            # below.
+            while uncropped_xdata and not is_canceled and not self.__grab_synchronized_aborted:
+                # xdata is the full data and includes flyback pixels. crop the flyback pixels in the
+                # next line, but retain other metadata.
+                metadata = copy.deepcopy(uncropped_xdata.metadata)
+                metadata["scan_detector"] = copy.deepcopy(scan_info.scan_metadata)
+                with telemetry.registry.span("synchronized.crop_and_calibrate"):
+                    partial_xdata = crop_and_calibrate(uncropped_xdata, flyback_pixels, scan_info.scan_calibrations, scan_info.data_calibrations, scan_info.data_intensity_calibration, metadata)
+                if reduction_stage:
+                    valid_rows = section_rect.height if is_complete else (partial_data_info.valid_rows or 0)
+                    reduction_stage.update(partial_xdata, section_rect, valid_rows)
+                if camera_data_channel:
+                    data_channel_state = "complete" if is_complete and is_last_section else "partial"
+                    data_channel_data_and_metadata = partial_xdata
+                    # the sub area is the valid rows of the section; all rows if the camera does not report them.
+                    data_channel_size = Geometry.IntSize.make(data_channel_data_and_metadata.collection_dimension_shape)
+                    if not is_complete and partial_data_info.valid_rows is not None:
+                        data_channel_size = Geometry.IntSize(h=min(partial_data_info.valid_rows, data_channel_size.height), w=data_channel_size.width)
+                    data_channel_sub_area = Geometry.IntRect(Geometry.IntPoint(), data_channel_size)
+                    data_channel_dest_sub_area = Geometry.IntRect(section_rect.top_left, data_channel_size)
+                    data_channel_view_id = None
+                    if data_channel_size.height > 0 or data_channel_state == "complete":
+                        with telemetry.registry.span("synchronized.data_channel_update"):
+                            camera_data_channel.update(data_channel_data_and_metadata, data_channel_state,
+                                                       Geometry.IntSize(h=scan_param_height, w=scan_param_width),
+                                                       data_channel_dest_sub_area, data_channel_sub_area, data_channel_view_id)
+                # break out if we're complete
+                if is_complete:
+                    break
+                # otherwise, acquire the next section and continue
+                update_period = camera_data_channel._update_period if hasattr(camera_data_channel, "_update_period") else 1.0
+                with telemetry.registry.span("synchronized.acquire_continue"):
+                    partial_data_info = camera.acquire_synchronized_continue(update_period=update_period)
+                is_complete = partial_data_info.is_complete
+                is_canceled = partial_data_info.is_canceled
+                # unless it's cancelled or aborted, of course.
+                if is_canceled or self.__grab_synchronized_aborted:
+                    break
+        finally:
+            camera.acquire_synchronized_end()
+        if uncropped_xdata and not is_canceled and not self.__grab_synchronized_aborted:
+            return uncropped_xdata
+        return None
+
+    def __acquire_synchronized_section_or_raise(self, *args) -> DataAndMetadata.DataAndMetadata:
+        # raise instead of returning None so that waiting for the first exception also stops on an aborted camera.
+        uncropped_xdata = self.__acquire_synchronized_section(*args)
+        if uncropped_xdata is None:
+            raise _SynchronizedSectionAborted()
+        return uncropped_xdata
 
     def grab_synchronized_abort(self) -> None:
         if self.__grab_synchronized_is_scanning:
             # if the state is scanning, the thread could be stuck on acquire sequence or
             # stuck on scan.grab. cancel both here.
-            self.__camera_hardware_source.acquire_sequence_cancel()
+            for camera_hardware_source in self.__camera_hardware_sources:
+                camera_hardware_source.acquire_sequence_cancel()
             self.abort_recording()
         # and set the flag for misbehaving acquire_sequence return values.
         self.__grab_synchronized_aborted = True
@@ -805,6 +1038,21 @@ class ScanHardwareSource(HardwareSource.HardwareSource):
     def grab_synchronized_get_progress(self) -> typing.Optional[float]:
         return None
 
+    async def grab_next_async(self, *, to_start: bool = False, timeout: float = None) -> typing.List[DataAndMetadata.DataAndMetadata]:
+        return await async_acquisition.grab_next(self, to_start=to_start, timeout=timeout)
+
+    async def grab_sequence_async(self, count: int, **kwargs) -> typing.Optional[typing.List[DataAndMetadata.DataAndMetadata]]:
+        return await async_acquisition.grab_sequence(self, count, **kwargs)
+
+    async def grab_synchronized_async(self, **kwargs) -> typing.Optional[typing.Tuple[typing.List[DataAndMetadata.DataAndMetadata], typing.List[DataAndMetadata.DataAndMetadata]]]:
+        return await async_acquisition.grab_synchronized(self, **kwargs)
+
+    async def record_immediate_async(self, frame_parameters: ScanFrameParameters, **kwargs) -> typing.List[DataAndMetadata.DataAndMetadata]:
+        return await async_acquisition.record_immediate(self, frame_parameters, **kwargs)
+
+    def frames_async(self, *, max_pending: int = 1) -> async_acquisition.FrameIterator:
+        return async_acquisition.frames(self, max_pending=max_pending)
+
     def grab_buffer(self, count: int, *, start: int=None, **kwargs) -> typing.Optional[typing.List[typing.List[DataAndMetadata.DataAndMetadata]]]:
         if start is None and count is not None:
             assert count > 0
@@ -866,11 +1114,7 @@ class ScanHardwareSource(HardwareSource.HardwareSource):
         if frame_parameters.get("subscan_fractional_size") and frame_parameters.get("subscan_fractional_center"):
             pass  # let the parameters speak for themselves
         elif self.subscan_enabled and self.subscan_region:
-            subscan_region = self.subscan_region
-            frame_parameters.subscan_pixel_size = max(int(context_size.height * subscan_region.height), 1), max(int(context_size.width * subscan_region.width), 1)
-            frame_parameters.subscan_fractional_size = frame_parameters.subscan_pixel_size[0] / context_size.height, frame_parameters.subscan_pixel_size[1] / context_size.width
-            frame_parameters.subscan_fractional_center = subscan_region.center.y, subscan_region.center.x
-            frame_parameters.subscan_rotation = self.subscan_rotation
+            SubscanRegion(self.subscan_region, self.subscan_rotation).apply(frame_parameters)
 
     def __subscan_state_changed(self, name: str) -> None:
         if name == "subscan_state":
@@ -941,6 +1185,23 @@ class ScanHardwareSource(HardwareSource.HardwareSource):
     def drift_valid(self) -> bool:
         return self.drift_enabled and self.drift_settings.interval > 0
 
+    @property
+    def drift_tracking_enabled(self) -> bool:
+        return self.__drift_tracking_enabled
+
+    @drift_tracking_enabled.setter
+    def drift_tracking_enabled(self, enabled: bool) -> None:
+        # when enabled, view frames are registered in the drift region and center_nm is corrected between frames.
+        if enabled and not self.__drift_tracking_enabled:
+            self.drift_log.clear()
+        self.__drift_tracking_enabled = enabled
+
+    def _append_drift_offset(self, offset_nm: Geometry.FloatSize) -> None:
+        # called from the acquisition thread.
+        # listeners receive only the new offset; the whole log is available from drift_log.
+        self.drift_log.append((offset_nm.height, offset_nm.width))
+        self.drift_log_changed_event.fire(offset_nm)
+
     def calculate_drift_lines(self, width: int, frame_time: float) -> int:
         if self.drift_valid:
             assert isinstance(self.drift_settings.interval_units, stem_controller.DriftIntervalUnit)
@@ -1008,6 +1269,53 @@ class ScanHardwareSource(HardwareSource.HardwareSource):
             assert time.time() - start < float(sync_timeout)
         return xdatas
 
+    def record_subscans(self, frame_parameters: ScanFrameParameters, subscan_regions: typing.Sequence[SubscanRegion],
+                        enabled_channels: typing.Sequence[int] = None) -> typing.List[typing.List[DataAndMetadata.DataAndMetadata]]:
+        """Record each subscan region once, in sequence, during one scan.
+
+        The regions are recorded as a record task; the device is started once and, after each region is complete, the
+        frame parameters of the next region are activated and the next frame is read without stopping the device. Each
+        region is published through the subscan data channels as it completes. Returns the data (one item for each
+        enabled channel) for each region. The channel ids of region n have the modifier "roi<n>" and the calibrations
+        are those of the region. Returns an empty list if aborted with record_subscans_abort.
+        """
+        assert not self.is_recording
+        self.abort_playing(sync_timeout=3.0)
+        self.__record_subscans_aborted = False
+        if not subscan_regions:
+            return list()
+        old_enabled_channels = self.get_enabled_channels()
+        if enabled_channels is not None:
+            self.set_enabled_channels(enabled_channels)
+        channel_states = [self.get_channel_state(i) for i in range(self.__device.channel_count)]
+        channel_ids = [channel_state.channel_id for channel_state in channel_states]
+        region_frame_parameters_list = list()
+        data_channel_ids = dict()
+        for index, subscan_region in enumerate(subscan_regions):
+            region_frame_parameters = ScanFrameParameters(copy.deepcopy(frame_parameters))
+            subscan_region.apply(region_frame_parameters)
+            region_frame_parameters["channel_modifier"] = f"roi{index}"
+            region_frame_parameters_list.append(region_frame_parameters)
+            for channel_index, channel_state in enumerate(channel_states):
+                data_channel_ids[channel_state.channel_id + "_" + region_frame_parameters["channel_modifier"]] = self.get_subscan_channel_info(channel_index, channel_state.channel_id, channel_state.name)[1]
+        record_task = ScanSubscansAcquisitionTask(self.__stem_controller, self, self.__device, self.hardware_source_id, region_frame_parameters_list, channel_ids, data_channel_ids, self.display_name)
+        self._record_task_updated(record_task)
+        self.start_task('record', record_task)
+        try:
+            # the task finishes after the last region or when aborted.
+            while self.is_recording:
+                time.sleep(0.01)  # 10 msec
+        finally:
+            self._record_task_updated(None)
+            self.set_enabled_channels(old_enabled_channels)
+        if self.__record_subscans_aborted or len(record_task.xdatas_list) != len(region_frame_parameters_list):
+            return list()
+        return record_task.xdatas_list
+
+    def record_subscans_abort(self) -> None:
+        self.__record_subscans_aborted = True
+        self.abort_recording()
+
     def set_frame_parameters(self, profile_index, frame_parameters):
         frame_parameters = ScanFrameParameters(frame_parameters)
         self.__profiles[profile_index] = frame_parameters
@@ -1239,6 +1547,14 @@ class ScanHardwareSource(HardwareSource.HardwareSource):
                 elif graphic_id == "drift":
                     display_item.remove_graphic(graphic)
 
+    @property
+    def buffer_size(self) -> typing.Optional[int]:
+        """Return the number of frames buffered by the device.
+
+        Returns None if the device does not report its buffer size.
+        """
+        return getattr(self.__device, "buffer_size", None)
+
     def get_buffer_data(self, start: int, count: int) -> typing.Optional[typing.List[typing.List[typing.Dict]]]:
         """Get recently acquired (buffered) data.
 
@@ -1457,10 +1773,18 @@ class ScanInterface:
     def grab_sequence(self, count: int) -> typing.Optional[typing.List[DataAndMetadata.DataAndMetadata]]: ...
     def grab_sequence_abort(self) -> None: ...
     def grab_sequence_get_progress(self) -> typing.Optional[float]: ...
-    def grab_synchronized(self, *, scan_frame_parameters: dict=None, camera=None, camera_frame_parameters: dict=None) -> typing.Tuple[typing.List[DataAndMetadata.DataAndMetadata], typing.List[DataAndMetadata.DataAndMetadata]]: ...
+    def grab_synchronized(self, *, scan_frame_parameters: dict=None, camera=None, camera_frame_parameters: dict=None, cameras: typing.Sequence[SynchronizedCamera]=None) -> typing.Tuple[typing.List[DataAndMetadata.DataAndMetadata], typing.List[DataAndMetadata.DataAndMetadata]]: ...
     def grab_synchronized_abort(self) -> None: ...
+    def record_subscans(self, frame_parameters: dict, subscan_regions: typing.Sequence[SubscanRegion], enabled_channels: typing.Sequence[int] = None) -> typing.List[typing.List[DataAndMetadata.DataAndMetadata]]: ...
+    def record_subscans_abort(self) -> None: ...
     def grab_synchronized_get_progress(self) -> typing.Optional[float]: ...
     def grab_buffer(self, count: int, *, start: int = None) -> typing.Optional[typing.List[typing.List[DataAndMetadata.DataAndMetadata]]]: ...
+    @property
+    def buffer_size(self) -> typing.Optional[int]: ...
+    async def grab_next_async(self, *, to_start: bool = False, timeout: float = None) -> typing.List[DataAndMetadata.DataAndMetadata]: ...
+    async def grab_sequence_async(self, count: int, **kwargs) -> typing.Optional[typing.List[DataAndMetadata.DataAndMetadata]]: ...
+    async def grab_synchronized_async(self, *, scan_frame_parameters: dict=None, camera=None, camera_frame_parameters: dict=None) -> typing.Optional[typing.Tuple[typing.List[DataAndMetadata.DataAndMetadata], typing.List[DataAndMetadata.DataAndMetadata]]]: ...
+    def frames_async(self, *, max_pending: int = 1) -> typing.AsyncIterator[typing.List[DataAndMetadata.DataAndMetadata]]: ...
     def calculate_frame_time(self, frame_parameters: dict) -> float: ...
     def calculate_line_scan_frame_parameters(self, frame_parameters: dict, start: typing.Tuple[float, float], end: typing.Tuple[float, float], length: int) -> dict: ...
     def make_reference_key(self, **kwargs) -> str: ...
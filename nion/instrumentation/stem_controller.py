@@ -6,6 +6,7 @@ import functools
 import gettext
 import math
 import threading
+import time
 import typing
 
 # third party libraries
@@ -90,6 +91,102 @@ class ScanContext:
         self.rotation_rad = rotation_rad
 
 
+class ControlValueCache:
+    """Memoize control values read from an instrument.
+
+    Values (including the information that a control does not exist) are kept for a time-to-live in seconds, which can
+    be set per control. A time-to-live of None keeps the value until it is invalidated; a time-to-live of zero disables
+    caching for the control. Misses are read with a single call to try_get_vals_fn.
+    """
+
+    def __init__(self, try_get_vals_fn: typing.Callable[[typing.Sequence[str]], typing.Mapping[str, typing.Optional[float]]],
+                 default_ttl: typing.Optional[float] = 1.0, ttls: typing.Optional[typing.Mapping[str, typing.Optional[float]]] = None):
+        self.__try_get_vals_fn = try_get_vals_fn
+        self.default_ttl = default_ttl
+        self.__ttls = dict(ttls) if ttls else dict()
+        self.__entries: typing.Dict[str, typing.Tuple[float, bool, typing.Optional[float]]] = dict()
+        # invalidations bump the generation of the control (or of all controls), so that a value read concurrently
+        # with an invalidation is not stored.
+        self.__generation = 0
+        self.__generations: typing.Dict[str, int] = dict()
+        self.__lock = threading.RLock()
+        self.hit_count = 0
+        self.miss_count = 0
+        self.invalidation_count = 0
+
+    def set_ttl(self, name: str, ttl: typing.Optional[float]) -> None:
+        with self.__lock:
+            self.__ttls[name] = ttl
+            self.__entries.pop(name, None)
+
+    def get_ttl(self, name: str) -> typing.Optional[float]:
+        return self.__ttls.get(name, self.default_ttl)
+
+    def get_values(self, names: typing.Sequence[str]) -> typing.Dict[str, typing.Optional[float]]:
+        """Return a dict of name to value for each of the names that exists, reading expired values in one batch."""
+        now = time.perf_counter()
+        values = dict()
+        missing = list()
+        with self.__lock:
+            for name in names:
+                entry = self.__entries.get(name)
+                ttl = self.get_ttl(name)
+                if entry is not None and (ttl is None or now - entry[0] < ttl):
+                    self.hit_count += 1
+                    if entry[1]:
+                        values[name] = entry[2]
+                else:
+                    self.miss_count += 1
+                    missing.append(name)
+            generations = {name: (self.__generation, self.__generations.get(name, 0)) for name in missing}
+        if missing:
+            read_values = self.__try_get_vals_fn(missing)
+            with self.__lock:
+                for name in missing:
+                    if self.get_ttl(name) != 0 and generations[name] == (self.__generation, self.__generations.get(name, 0)):
+                        self.__entries[name] = (now, name in read_values, read_values.get(name))
+            values.update(read_values)
+        return values
+
+    def invalidate(self, name: typing.Optional[str] = None) -> None:
+        """Invalidate the value of the control or all values if name is None."""
+        with self.__lock:
+            if name is None:
+                self.__entries.clear()
+                self.__generation += 1
+            else:
+                self.__entries.pop(name, None)
+                self.__generations[name] = self.__generations.get(name, 0) + 1
+            self.invalidation_count += 1
+
+    @property
+    def statistics(self) -> typing.Dict[str, int]:
+        with self.__lock:
+            return {"hits": self.hit_count, "misses": self.miss_count, "invalidations": self.invalidation_count, "size": len(self.__entries)}
+
+
+def invalidates_value_cache(kind: str = "single") -> typing.Callable[[typing.Callable], typing.Callable]:
+    """Return a decorator for instrument setters which invalidates the cached values of the controls they set.
+
+    The kind is "single" for setters taking a control name, "batched" for setters taking a mapping of control names to
+    values and "2d" for setters of 2d controls, which invalidate all cached values since their components are read
+    under other names. Subclasses overriding a SetVal* or InformControl function should decorate the override.
+    """
+    def decorator(fn: typing.Callable) -> typing.Callable:
+        @functools.wraps(fn)
+        def setter(self: "STEMController", *args, **kwargs):
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                if kind == "2d":
+                    self._invalidate_cached_values(None)
+                else:
+                    arg = args[0] if args else kwargs.get("values" if kind == "batched" else "s")
+                    self._invalidate_cached_values(list(arg) if kind == "batched" else [arg])
+        return setter
+    return decorator
+
+
 class STEMController(Observable.Observable):
     """An interface to a STEM microscope.
 
@@ -106,10 +203,22 @@ class STEMController(Observable.Observable):
     validate_probe_position()
 
     probe_state_changed_event (probe_state, probe_position)
+
+    Value cache
+    -----------
+    enable_value_cache(default_ttl, ttls) (opt-in; TryGetValsCached then reads through the cache)
+    disable_value_cache()
+    value_cache (the ControlValueCache or None)
+
+    Cached values are invalidated when they are set through any of the SetVal* functions or InformControl, or when
+    property_changed_event is fired with the control name. Subclasses overriding these functions should decorate the
+    overrides with invalidates_value_cache.
     """
 
     def __init__(self):
         super().__init__()
+        self.__value_cache: typing.Optional[ControlValueCache] = None
+        self.__value_cache_property_changed_listener = None
         self.__probe_position = None
         self.__probe_state_stack = list()  # parked, or scanning
         self.__probe_state_stack.append("parked")
@@ -130,6 +239,7 @@ class STEMController(Observable.Observable):
         self.__scan_controller = None
 
     def close(self):
+        self.disable_value_cache()
         self.__scan_context_data_items = None
         self.__scan_context_channel_map = None
 
@@ -379,8 +489,67 @@ class STEMController(Observable.Observable):
         Metadata groups is a tuple with two elements. The first is a list of strings representing a dict-path in which
         to add the controls. The second is a control group from which to read a list of controls to be added as name
         value pairs to the dict-path.
+
+        The default implementation reads the controls listed by _get_metadata_group_controls for all groups in a
+        single TryGetValsCached call. Subclasses without control groups can override this method instead.
         """
-        pass
+        group_controls = [(path, list(self._get_metadata_group_controls(group_name))) for path, group_name in metatdata_groups]
+        group_controls = [(path, controls) for path, controls in group_controls if controls]
+        if not group_controls:
+            return
+        values = self.TryGetValsCached([control for path, controls in group_controls for control in controls])
+        for path, controls in group_controls:
+            group_properties = properties
+            for key in path:
+                group_properties = group_properties.setdefault(key, dict())
+            for control in controls:
+                if control in values:
+                    group_properties[control] = values[control]
+
+    def _get_metadata_group_controls(self, group_name: str) -> typing.Sequence[str]:
+        """Return the names of the controls in the control group. Subclasses should override."""
+        return list()
+
+    # value cache
+
+    @property
+    def value_cache(self) -> typing.Optional[ControlValueCache]:
+        return self.__value_cache
+
+    def _invalidate_cached_values(self, names: typing.Optional[typing.Sequence[str]]) -> None:
+        """Invalidate the cached values of the controls or all cached values if names is None."""
+        value_cache = self.__value_cache
+        if value_cache:
+            if names is None:
+                value_cache.invalidate()
+            else:
+                for name in names:
+                    value_cache.invalidate(name)
+
+    def enable_value_cache(self, default_ttl: typing.Optional[float] = 1.0, ttls: typing.Optional[typing.Mapping[str, typing.Optional[float]]] = None) -> ControlValueCache:
+        """Enable caching of values read with TryGetValsCached. Return the cache.
+
+        Use ttls to give controls which rarely change, such as calibrations, a longer time-to-live.
+        """
+        self.disable_value_cache()
+        self.__value_cache = ControlValueCache(self.TryGetVals, default_ttl, ttls)
+        self.__value_cache_property_changed_listener = self.property_changed_event.listen(self.__value_cache.invalidate)
+        return self.__value_cache
+
+    def disable_value_cache(self) -> None:
+        if self.__value_cache_property_changed_listener:
+            self.__value_cache_property_changed_listener.close()
+        self.__value_cache_property_changed_listener = None
+        self.__value_cache = None
+
+    def TryGetValsCached(self, names: typing.Sequence[str]) -> typing.Dict[str, typing.Optional[float]]:
+        """Return a dict of name to value for each of the names that exists, using the value cache if enabled."""
+        value_cache = self.value_cache
+        return value_cache.get_values(names) if value_cache else self.TryGetVals(names)
+
+    def TryGetValCached(self, s: str) -> typing.Tuple[bool, typing.Optional[float]]:
+        values = self.TryGetValsCached([s])
+        return (True, values[s]) if s in values else (False, None)
 
     # end instrument API
 
@@ -392,39 +561,81 @@ class STEMController(Observable.Observable):
     def GetVal(self, s: str, default_value: float=None) -> float:
         raise Exception(f"No element named '{s}' exists! Cannot get value.")
 
+    @invalidates_value_cache()
     def SetVal(self, s: str, val: float) -> bool:
         return False
 
+    @invalidates_value_cache()
     def SetValWait(self, s: str, val: float, timeout_ms: int) -> bool:
         return False
 
+    @invalidates_value_cache()
     def SetValAndConfirm(self, s: str, val: float, tolfactor: float, timeout_ms: int) -> bool:
         return False
 
+    @invalidates_value_cache()
     def SetValDelta(self, s: str, delta: float) -> bool:
         return False
 
+    @invalidates_value_cache()
     def SetValDeltaAndConfirm(self, s: str, delta: float, tolfactor: float, timeout_ms: int) -> bool:
         return False
 
+    @invalidates_value_cache()
     def InformControl(self, s: str, val: float) -> bool:
         return False
 
+    # batched functions. subclasses talking to a remote instrument should override these to use a single request;
+    # the defaults fall back to the single value functions.
+
+    def TryGetVals(self, names: typing.Sequence[str]) -> typing.Dict[str, typing.Optional[float]]:
+        """Return a dict of name to value for each of the names that exists."""
+        values = dict()
+        for name in names:
+            value_exists, value = self.TryGetVal(name)
+            if value_exists:
+                values[name] = value
+        return values
+
+    @invalidates_value_cache("batched")
+    def SetVals(self, values: typing.Mapping[str, float]) -> bool:
+        """Set each of the values. Return whether all values were set."""
+        success = True
+        for name, value in values.items():
+            success = self.SetVal(name, value) and success
+        return success
+
+    @invalidates_value_cache("batched")
+    def SetValsAndConfirm(self, values: typing.Mapping[str, float], tolfactor: float, timeout_ms: int) -> bool:
+        """Set each of the values and wait for all of them to be confirmed. Return whether all values were confirmed.
+
+        The default implementation confirms the values one at a time, so the timeout applies to each value.
+        """
+        success = True
+        for name, value in values.items():
+            success = self.SetValAndConfirm(name, value, tolfactor, timeout_ms) and success
+        return success
+
     def GetVal2D(self, s:str, default_value: Geometry.FloatPoint=None, *, axis: AxisType) -> Geometry.FloatPoint:
         raise Exception(f"No 2D element named '{s}' exists! Cannot get value.")
 
+    @invalidates_value_cache("2d")
     def SetVal2D(self, s:str, value: Geometry.FloatPoint, *, axis: AxisType) -> bool:
         return False
 
+    @invalidates_value_cache("2d")
     def SetVal2DAndConfirm(self, s: str, val: Geometry.FloatPoint, tolfactor: float, timeout_ms: int, *, axis: AxisType) -> bool:
         return False
 
+    @invalidates_value_cache("2d")
     def SetVal2DDelta(self, s: str, delta: Geometry.FloatPoint, *, axis: AxisType) -> bool:
         return False
 
+    @invalidates_value_cache("2d")
     def SetVal2DDeltaAndConfirm(self, s: str, delta: Geometry.FloatPoint, tolfactor: float, timeout_ms: int, *, axis: AxisType) -> bool:
         return False
 
+    @invalidates_value_cache("2d")
     def InformControl2D(self, s: str, val: Geometry.FloatPoint, *, axis: AxisType) -> bool:
         return False
 
@@ -535,16 +746,26 @@ class GraphicSetController:
 
 
 class DisplayItemListModel(Observable.Observable):
-    """Make an observable list model from the item source with a list as the item."""
+    """Make an observable list model from the item source with a list as the item.
+
+    The items are indexed by a position map so that membership tests do not scan the list. Items are appended when they
+    start to match the predicate, so the list is in the order the items entered it rather than in document order; a
+    removal still re-indexes the items after the removed item (linear in their number). When the change event fires,
+    the predicate is re-evaluated for all display items; if changed_items_fn is passed, it is called instead to return
+    the display items that may have changed and only those and the items already in the list are re-evaluated.
+    """
 
     def __init__(self, document_model: DocumentModel.DocumentModel, item_key: str,
                  predicate: typing.Callable[["DisplayItem.DisplayItem"], bool],
-                 change_event: typing.Optional[Event.Event] = None):
+                 change_event: typing.Optional[Event.Event] = None,
+                 changed_items_fn: typing.Optional[typing.Callable[[], typing.Iterable["DisplayItem.DisplayItem"]]] = None):
         super().__init__()
         self.__document_model = document_model
         self.__item_key = item_key
         self.__predicate = predicate
+        self.__changed_items_fn = changed_items_fn
         self.__items : typing.List["DisplayItem.DisplayItem"] = list()
+        self.__item_positions : typing.Dict["DisplayItem.DisplayItem", int] = dict()
 
         self.__item_inserted_listener = document_model.item_inserted_event.listen(self.__item_inserted)
         self.__item_removed_listener = document_model.item_removed_event.listen(self.__item_removed)
@@ -552,7 +773,7 @@ class DisplayItemListModel(Observable.Observable):
         for index, display_item in enumerate(document_model.display_items):
             self.__item_inserted("display_items", display_item, index)
 
-        self.__change_event_listener = change_event.listen(self.refilter) if change_event else None
+        self.__change_event_listener = change_event.listen(self.__change_event_fired) if change_event else None
 
         # special handling when document closes
         def unlisten():
@@ -574,17 +795,30 @@ class DisplayItemListModel(Observable.Observable):
         self.__document_close_listener = None
         self.__document_model = None
 
+    def __change_event_fired(self) -> None:
+        self.refilter(self.__changed_items_fn() if callable(self.__changed_items_fn) else None)
+
+    def __append(self, display_item: "DisplayItem.DisplayItem") -> None:
+        index = len(self.__items)
+        self.__items.append(display_item)
+        self.__item_positions[display_item] = index
+        self.notify_insert_item(self.__item_key, display_item, index)
+
+    def __remove(self, display_item: "DisplayItem.DisplayItem") -> None:
+        index = self.__item_positions.pop(display_item)
+        self.__items.pop(index)
+        # only the items after the removed item change position.
+        for position in range(index, len(self.__items)):
+            self.__item_positions[self.__items[position]] = position
+        self.notify_remove_item(self.__item_key, display_item, index)
+
     def __item_inserted(self, key: str, display_item: "DisplayItem.DisplayItem", index: int) -> None:
-        if key == "display_items" and not display_item in self.__items and self.__predicate(display_item):
-            index = len(self.__items)
-            self.__items.append(display_item)
-            self.notify_insert_item(self.__item_key, display_item, index)
+        if key == "display_items" and not display_item in self.__item_positions and self.__predicate(display_item):
+            self.__append(display_item)
 
     def __item_removed(self, key: str, display_item: "DisplayItem.DisplayItem", index: int) -> None:
-        if key == "display_items" and display_item in self.__items:
-            index = self.__items.index(display_item)
-            self.__items.pop(index)
-            self.notify_remove_item(self.__item_key, display_item, index)
+        if key == "display_items" and display_item in self.__item_positions:
+            self.__remove(display_item)
 
     @property
     def items(self) -> typing.Sequence["DisplayItem.DisplayItem"]:
@@ -595,28 +829,49 @@ class DisplayItemListModel(Observable.Observable):
             return self.items
         raise AttributeError()
 
-    def refilter(self) -> None:
-        self.item_set = set(self.__items)
-        for display_item in self.__document_model.display_items:
+    def refilter(self, changed_display_items: typing.Optional[typing.Iterable["DisplayItem.DisplayItem"]] = None) -> None:
+        """Re-evaluate the predicate.
+
+        If changed_display_items is passed, only those and the items already in the list are re-evaluated; otherwise
+        all display items in the document are re-evaluated.
+        """
+        if changed_display_items is None:
+            display_items = self.__document_model.display_items
+        else:
+            new_display_items = [display_item for display_item in set(changed_display_items) if display_item not in self.__item_positions]
+            # append the new items in document order, the same as a full refilter. there are usually only a few.
+            if len(new_display_items) > 1:
+                new_display_items.sort(key=self.__document_model.display_items.index)
+            display_items = list(self.__items) + new_display_items
+        for display_item in display_items:
             if self.__predicate(display_item):
                 # insert item if not already inserted
-                if not display_item in self.__items:
-                    index = len(self.__items)
-                    self.__items.append(display_item)
-                    self.notify_insert_item(self.__item_key, display_item, index)
+                if not display_item in self.__item_positions:
+                    self.__append(display_item)
             else:
                 # remove item if in list
-                if display_item in self.__items:
-                    index = self.__items.index(display_item)
-                    self.__items.pop(index)
-                    self.notify_remove_item(self.__item_key, display_item, index)
+                if display_item in self.__item_positions:
+                    self.__remove(display_item)
 
 
 def ScanContextDisplayItemListModel(document_model: DocumentModel.DocumentModel, stem_controller: STEMController) -> DisplayItemListModel:
+    # keep the scan context data items in a set so the predicate does not scan the list for each display item.
+    scan_context_data_items = set(stem_controller.scan_context_data_items)
+
     def is_scan_context_display_item(display_item: "DisplayItem.DisplayItem") -> bool:
-        return display_item.data_item in stem_controller.scan_context_data_items
+        return display_item.data_item in scan_context_data_items
 
-    return DisplayItemListModel(document_model, "display_items", is_scan_context_display_item, stem_controller.scan_context_data_items_changed_event)
+    def get_changed_display_items() -> typing.Set["DisplayItem.DisplayItem"]:
+        # only the display items of the new scan context data items can enter the model.
+        scan_context_data_items.clear()
+        scan_context_data_items.update(stem_controller.scan_context_data_items)
+        changed_display_items = set()
+        for data_item in scan_context_data_items:
+            changed_display_items.update(document_model.get_display_items_for_data_item(data_item))
+        return changed_display_items
+
+    return DisplayItemListModel(document_model, "display_items", is_scan_context_display_item,
+                                stem_controller.scan_context_data_items_changed_event, get_changed_display_items)
 
 
 class EventLoopMonitor:
@@ -626,12 +881,16 @@ class EventLoopMonitor:
         self.__event_loop : typing.Optional[asyncio.AbstractEventLoop] = event_loop
         self.__document_close_listener = document_model.about_to_close_event.listen(self._unlisten)
         self.__closed = False
+        self.__pending_calls : typing.Dict[typing.Any, typing.Tuple[typing.Callable, typing.Tuple]] = dict()
+        self.__pending_calls_lock = threading.RLock()
 
     def _unlisten(self) -> None:
         pass
 
     def _mark_closed(self) -> None:
         self.__closed = True
+        with self.__pending_calls_lock:
+            self.__pending_calls.clear()
         self.__document_close_listener.close()
         self.__document_close_listener = None
         self.__event_loop = None
@@ -645,6 +904,22 @@ class EventLoopMonitor:
             assert self.__event_loop
             self.__event_loop.call_soon_threadsafe(safe_fn)
 
+    def _call_soon_threadsafe_coalesced(self, key: typing.Any, fn: typing.Callable, *args) -> None:
+        """Call fn with args on the event loop, keeping at most one pending call per key.
+
+        If a call with the same key is already pending, it is replaced so that only the latest fn and args are called.
+        """
+        with self.__pending_calls_lock:
+            is_pending = key in self.__pending_calls
+            self.__pending_calls[key] = (fn, args)
+        if not is_pending:
+            self._call_soon_threadsafe(self.__call_pending, key)
+
+    def __call_pending(self, key: typing.Any) -> None:
+        with self.__pending_calls_lock:
+            fn, args = self.__pending_calls.pop(key)
+        fn(*args)
+
 
 class ProbeView(EventLoopMonitor, AbstractGraphicSetHandler, DocumentModel.AbstractImplicitDependency):
     """Observes the probe (STEM controller) and updates data items and graphics."""
@@ -680,7 +955,7 @@ class ProbeView(EventLoopMonitor, AbstractGraphicSetHandler, DocumentModel.Abstr
 
     def __probe_state_changed(self, probe_state: str, probe_position: typing.Optional[Geometry.FloatPoint]) -> None:
         # thread safe. move actual call to main thread using the event loop.
-        self._call_soon_threadsafe(self.__update_probe_state, probe_state, probe_position)
+        self._call_soon_threadsafe_coalesced("probe_state", self.__update_probe_state, probe_state, probe_position)
 
     def __update_probe_state(self, probe_state: str, probe_position: typing.Optional[Geometry.FloatPoint]) -> None:
         assert threading.current_thread() == threading.main_thread()
@@ -755,12 +1030,12 @@ class SubscanView(EventLoopMonitor, AbstractGraphicSetHandler, DocumentModel.Abs
     def __subscan_region_changed(self, name: str) -> None:
         # must be thread safe
         if name == "subscan_region":
-            self._call_soon_threadsafe(self.__update_subscan_region)
+            self._call_soon_threadsafe_coalesced("subscan_region", self.__update_subscan_region)
 
     def __subscan_rotation_changed(self, name: str) -> None:
         # must be thread safe
         if name == "subscan_rotation":
-            self._call_soon_threadsafe(self.__update_subscan_region)
+            self._call_soon_threadsafe_coalesced("subscan_region", self.__update_subscan_region)
 
     def __update_subscan_region(self) -> None:
         assert threading.current_thread() == threading.main_thread()
@@ -848,24 +1123,24 @@ class DriftView(EventLoopMonitor):
 
     def __scan_context_data_items_changed(self) -> None:
         # must be thread safe
-        self._call_soon_threadsafe(self.__update_drift_region)
+        self._call_soon_threadsafe_coalesced("drift_region", self.__update_drift_region)
 
     # methods for handling changes to the drift region
 
     def __drift_channel_id_changed(self, name: str) -> None:
         # must be thread safe
         if name == "drift_channel_id":
-            self._call_soon_threadsafe(self.__update_drift_region)
+            self._call_soon_threadsafe_coalesced("drift_region", self.__update_drift_region)
 
     def __drift_region_changed(self, name: str) -> None:
         # must be thread safe
         if name == "drift_region":
-            self._call_soon_threadsafe(self.__update_drift_region)
+            self._call_soon_threadsafe_coalesced("drift_region", self.__update_drift_region)
 
     def __drift_rotation_changed(self, name: str) -> None:
         # must be thread safe
         if name == "drift_rotation":
-            self._call_soon_threadsafe(self.__update_drift_region)
+            self._call_soon_threadsafe_coalesced("drift_region", self.__update_drift_region)
 
     def __update_drift_region(self) -> None:
         assert threading.current_thread() == threading.main_thread()
@@ -0,0 +1,202 @@
+# standard libraries
+import logging
+import pathlib
+import queue
+import threading
+import time
+import typing
+
+# third party libraries
+import numpy
+
+# local libraries
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+
+
+class StreamRecorder:
+    """Record the frames of a hardware source into memory mapped files as they arrive.
+
+    The recorder listens to the live data stream and copies each frame into a queue; a writer thread writes the
+    frames into one memory mapped file per data channel. The files grow as needed, so the recording length is limited
+    by disk space (or frame_count, if specified) rather than by the buffer of the hardware source.
+
+    Frames are counted as dropped when the writer falls behind (the queue is full) or when there is a gap in the frame
+    numbers reported by the hardware source. The timestamps of the first max_timestamp_count recorded frames are kept;
+    the first and last timestamp and the longest interval between frames cover the whole recording.
+
+    The recording stops if a frame cannot be written (for instance, the disk is full) or if the frame shape changes;
+    the error is kept in error.
+    """
+
+    def __init__(self, hardware_source, directory: pathlib.Path, frame_count: typing.Optional[int] = None, queue_size: int = 32,
+                 initial_capacity: int = 64, max_timestamp_count: int = 1024):
+        self.__hardware_source = hardware_source
+        self.__directory = pathlib.Path(directory)
+        self.__frame_count = frame_count
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__capacity = initial_capacity
+        self.__memmaps = list()
+        self.__file_paths = list()
+        self.__frame_shapes = list()
+        self.__last_frame_number = None
+        self.__xdatas_available_listener = None
+        self.__writer_thread = None
+        self.__finished_event = threading.Event()
+        # the dropped count is incremented on the acquisition thread and on the writer thread.
+        self.__dropped_count_lock = threading.Lock()
+        self.__max_timestamp_count = max_timestamp_count
+        self.recorded_count = 0
+        self.dropped_count = 0
+        self.timestamps = list()
+        self.first_timestamp: typing.Optional[float] = None
+        self.last_timestamp: typing.Optional[float] = None
+        self.max_frame_interval = 0.0
+        self.exemplar_xdatas = list()
+        self.error = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.__finished_event.is_set()
+
+    def start(self) -> None:
+        self.__directory.mkdir(parents=True, exist_ok=True)
+        self.__writer_thread = threading.Thread(target=self.__write_frames, daemon=True)
+        self.__writer_thread.start()
+        self.__xdatas_available_listener = self.__hardware_source.xdatas_available_event.listen(self.__xdatas_available)
+
+    def stop(self) -> None:
+        """Stop listening for new frames and wait for the queued frames to be written."""
+        if self.__xdatas_available_listener:
+            self.__xdatas_available_listener.close()
+            self.__xdatas_available_listener = None
+        if self.__writer_thread:
+            # the writer thread stops on its own after an error, possibly leaving the queue full.
+            while self.__writer_thread.is_alive():
+                try:
+                    self.__queue.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            self.__writer_thread.join()
+            self.__writer_thread = None
+        self.__finished_event.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.__finished_event.wait(timeout)
+
+    def __xdatas_available(self, xdatas) -> None:
+        # called on the acquisition thread. the xdatas may point to memory in low level code, so copy them here.
+        if self.__finished_event.is_set():
+            return
+        metadata = xdatas[0].metadata.get("hardware_source", dict()) if xdatas else dict()
+        frame_number = metadata.get("frame_number", metadata.get("frame_index"))
+        if frame_number is not None and self.__last_frame_number is not None and frame_number > self.__last_frame_number + 1:
+            self.__add_dropped_count(frame_number - self.__last_frame_number - 1)
+        if frame_number is not None:
+            self.__last_frame_number = frame_number
+        try:
+            self.__queue.put_nowait(([DataAndMetadata.new_data_and_metadata(numpy.copy(xdata.data),
+                                                                             intensity_calibration=xdata.intensity_calibration,
+                                                                             dimensional_calibrations=xdata.dimensional_calibrations,
+                                                                             metadata=xdata.metadata,
+                                                                             timestamp=xdata.timestamp,
+                                                                             data_descriptor=xdata.data_descriptor) for xdata in xdatas], time.time()))
+        except queue.Full:
+            self.__add_dropped_count(1)
+
+    def __add_dropped_count(self, count: int) -> None:
+        with self.__dropped_count_lock:
+            self.dropped_count += count
+
+    def __add_timestamp(self, timestamp: float) -> None:
+        if self.last_timestamp is not None:
+            self.max_frame_interval = max(self.max_frame_interval, timestamp - self.last_timestamp)
+        else:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+        if len(self.timestamps) < self.__max_timestamp_count:
+            self.timestamps.append(timestamp)
+
+    def __write_frames(self) -> None:
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                break
+            if self.__frame_count is not None and self.recorded_count >= self.__frame_count:
+                continue
+            xdatas, receive_time = item
+            try:
+                if not self.__memmaps:
+                    self.__allocate(xdatas)
+                elif [xdata.data_shape for xdata in xdatas] != self.__frame_shapes:
+                    # the frame shape changed (e.g. new scan size); the recording cannot continue.
+                    raise ValueError("The frame shape changed from {} to {}.".format(self.__frame_shapes, [xdata.data_shape for xdata in xdatas]))
+                if self.recorded_count >= self.__capacity:
+                    self.__grow()
+                for memmap, xdata in zip(self.__memmaps, xdatas):
+                    memmap[self.recorded_count] = xdata.data
+                self.__add_timestamp(xdatas[0].timestamp.timestamp() if xdatas[0].timestamp else receive_time)
+                self.recorded_count += 1
+            except Exception as e:
+                # most likely the disk is full; keep what has been recorded so far. frames arriving later are ignored
+                # and the frames still in the queue are not written.
+                logging.error("Stream recording stopped: {}".format(e))
+                self.error = e
+                self.__finished_event.set()
+                break
+            if self.__frame_count is not None and self.recorded_count >= self.__frame_count:
+                self.__finished_event.set()
+
+    def __open_memmap(self, file_path: pathlib.Path, dtype, shape, mode: str) -> numpy.memmap:
+        return numpy.memmap(str(file_path), dtype=dtype, mode=mode, shape=shape)
+
+    def __allocate(self, xdatas) -> None:
+        if self.__frame_count is not None:
+            self.__capacity = self.__frame_count
+        self.exemplar_xdatas = xdatas
+        self.__frame_shapes = [xdata.data_shape for xdata in xdatas]
+        for i, xdata in enumerate(xdatas):
+            file_path = self.__directory / "stream_{}_{}.dat".format(int(time.time() * 1000), i)
+            self.__file_paths.append(file_path)
+            self.__memmaps.append(self.__open_memmap(file_path, xdata.data_dtype, (self.__capacity,) + tuple(xdata.data_shape), "w+"))
+
+    def __grow(self) -> None:
+        self.__capacity *= 2
+        for i, (memmap, file_path) in enumerate(zip(self.__memmaps, self.__file_paths)):
+            dtype, frame_shape = memmap.dtype, memmap.shape[1:]
+            memmap.flush()
+            del memmap
+            self.__memmaps[i] = None
+            with open(file_path, "r+b") as f:
+                f.truncate(self.__capacity * int(numpy.prod(frame_shape, dtype=numpy.int64)) * dtype.itemsize)
+            self.__memmaps[i] = self.__open_memmap(file_path, dtype, (self.__capacity,) + tuple(frame_shape), "r+")
+
+    def get_xdatas(self) -> typing.List[DataAndMetadata.DataAndMetadata]:
+        """Return the recorded sequences. The data refers to the memory mapped files; nothing is copied."""
+        xdatas = list()
+        for memmap, xdata in zip(self.__memmaps, self.exemplar_xdatas):
+            memmap.flush()
+            metadata = dict(xdata.metadata)
+            metadata["recording"] = {"timestamps": list(self.timestamps), "first_timestamp": self.first_timestamp,
+                                     "last_timestamp": self.last_timestamp, "max_frame_interval": self.max_frame_interval,
+                                     "dropped_frames": self.dropped_count, "frame_count": self.recorded_count}
+            data_descriptor = DataAndMetadata.DataDescriptor(True, xdata.data_descriptor.collection_dimension_count,
+                                                             xdata.data_descriptor.datum_dimension_count)
+            xdatas.append(DataAndMetadata.new_data_and_metadata(memmap[:self.recorded_count],
+                                                                intensity_calibration=xdata.intensity_calibration,
+                                                                dimensional_calibrations=[Calibration.Calibration()] + list(xdata.dimensional_calibrations),
+                                                                metadata=metadata,
+                                                                data_descriptor=data_descriptor))
+        return xdatas
+
+    def close(self) -> None:
+        self.stop()
+        self.__memmaps = list()
+        self.exemplar_xdatas = list()
+        for file_path in self.__file_paths:
+            try:
+                file_path.unlink()
+            except OSError:
+                pass
+        self.__file_paths = list()
@@ -0,0 +1,179 @@
+# standard libraries
+import bisect
+import csv
+import io
+import json
+import pathlib
+import threading
+import time
+import typing
+
+# third party libraries
+# None
+
+# local libraries
+from nion.utils import Event
+
+
+# upper bounds (seconds) of the histogram buckets for durations, 10 us to 100 s in 1-2-5 steps.
+DURATION_BOUNDS = tuple(m * 10 ** e for e in range(-5, 2) for m in (1, 2, 5)) + (100,)
+
+
+class Counter:
+    """Count occurrences (e.g. frames or sections)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.__lock = threading.RLock()
+        self.value = 0
+
+    def increment(self, n: int = 1) -> None:
+        with self.__lock:
+            self.value += n
+
+    def snapshot(self) -> typing.Dict:
+        return {"value": self.value}
+
+
+class Histogram:
+    """Record the distribution of values (e.g. durations) with summary statistics and fixed buckets.
+
+    The bucket counts have one more entry than the bounds; the last entry counts values above the largest bound.
+    """
+
+    def __init__(self, name: str, bounds: typing.Sequence[float] = DURATION_BOUNDS):
+        self.name = name
+        self.bounds = tuple(bounds)
+        self.__lock = threading.RLock()
+        self.__bucket_counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum: typing.Optional[float] = None
+        self.maximum: typing.Optional[float] = None
+
+    def record(self, value: float) -> None:
+        with self.__lock:
+            self.__bucket_counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            self.minimum = value if self.minimum is None else min(self.minimum, value)
+            self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    @property
+    def mean(self) -> typing.Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def snapshot(self) -> typing.Dict:
+        with self.__lock:
+            return {"count": self.count, "total": self.total, "min": self.minimum, "max": self.maximum,
+                    "mean": self.mean, "bounds": list(self.bounds), "buckets": list(self.__bucket_counts)}
+
+
+class Span:
+    """Time a block of code and record the duration (seconds) in a histogram of the registry. Use as a context manager."""
+
+    def __init__(self, registry: "MetricsRegistry", name: str):
+        self.__registry = registry
+        self.name = name
+        self.__start_time = 0.0
+        self.duration: typing.Optional[float] = None
+
+    def __enter__(self) -> "Span":
+        self.__start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.duration = time.perf_counter() - self.__start_time
+        self.__registry.record(self.name, self.duration)
+
+
+class MetricsRegistry:
+    """Keep named counters and histograms of acquisition telemetry.
+
+    Metrics are created on first use. Each increment or recorded value fires metric_recorded_event with the metric
+    name, the kind ("counter" or "histogram"), and the value; publish fires snapshot_event with a snapshot of all
+    metrics. Listeners of metric_recorded_event are called on the thread doing the acquisition and must be quick.
+
+    When disabled, nothing is recorded; the hooks in the acquisition code then only cost a method call.
+    """
+
+    def __init__(self):
+        self.__lock = threading.RLock()
+        self.__counters: typing.Dict[str, Counter] = dict()
+        self.__histograms: typing.Dict[str, Histogram] = dict()
+        self.enabled = True
+        self.metric_recorded_event = Event.Event()
+        self.snapshot_event = Event.Event()
+
+    def counter(self, name: str) -> Counter:
+        with self.__lock:
+            counter = self.__counters.get(name)
+            if counter is None:
+                counter = Counter(name)
+                self.__counters[name] = counter
+            return counter
+
+    def histogram(self, name: str, bounds: typing.Sequence[float] = DURATION_BOUNDS) -> Histogram:
+        with self.__lock:
+            histogram = self.__histograms.get(name)
+            if histogram is None:
+                histogram = Histogram(name, bounds)
+                self.__histograms[name] = histogram
+            return histogram
+
+    def increment(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            self.counter(name).increment(n)
+            self.metric_recorded_event.fire(name, "counter", n)
+
+    def record(self, name: str, value: float) -> None:
+        if self.enabled:
+            self.histogram(name).record(value)
+            self.metric_recorded_event.fire(name, "histogram", value)
+
+    def span(self, name: str) -> Span:
+        """Return a context manager recording the duration of its block in the histogram name."""
+        return Span(self, name)
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__counters = dict()
+            self.__histograms = dict()
+
+    def snapshot(self) -> typing.Dict:
+        with self.__lock:
+            counters = list(self.__counters.values())
+            histograms = list(self.__histograms.values())
+        return {"timestamp": time.time(),
+                "counters": {counter.name: counter.snapshot() for counter in counters},
+                "histograms": {histogram.name: histogram.snapshot() for histogram in histograms}}
+
+    def publish(self) -> typing.Dict:
+        """Fire snapshot_event with a snapshot of the metrics and return the snapshot."""
+        snapshot = self.snapshot()
+        self.snapshot_event.fire(snapshot)
+        return snapshot
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_csv(self) -> str:
+        """Return the metrics as csv with one row per metric; the bucket counts are omitted."""
+        snapshot = self.snapshot()
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator="\n")
+        writer.writerow(["kind", "name", "count", "total", "min", "max", "mean"])
+        for name, counter in sorted(snapshot["counters"].items()):
+            writer.writerow(["counter", name, counter["value"], "", "", "", ""])
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            writer.writerow(["histogram", name] + [histogram[key] for key in ("count", "total", "min", "max", "mean")])
+        return output.getvalue()
+
+    def save(self, file_path: pathlib.Path) -> None:
+        """Write a snapshot to file_path as csv if its suffix is '.csv', otherwise as json."""
+        file_path = pathlib.Path(file_path)
+        file_path.write_text(self.to_csv() if file_path.suffix.lower() == ".csv" else self.to_json())
+
+
+# the registry used by the hooks in the camera, scan, and synchronized acquisition code.
+registry = MetricsRegistry()
@@ -0,0 +1,91 @@
+import pathlib
+import tempfile
+import threading
+import unittest
+
+import numpy
+
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.instrumentation import job_queue
+
+
+class TestRunner(job_queue.AcquisitionJobRunnerInterface):
+
+    def __init__(self):
+        self.specs = list()
+        self.started_event = threading.Event()
+        self.block = False
+        self.__cancel_event = threading.Event()
+
+    def run(self, spec):
+        self.specs.append(spec)
+        self.started_event.set()
+        if self.block:
+            self.__cancel_event.wait(5.0)
+            self.__cancel_event.clear()
+            self.block = False
+            return None
+        if spec.get("fail"):
+            raise RuntimeError("failed")
+        data = numpy.full((4, 5), spec.get("value", 0), numpy.float32)
+        return [DataAndMetadata.new_data_and_metadata(data, dimensional_calibrations=[Calibration.Calibration(units="nm"), Calibration.Calibration(units="eV")])]
+
+    def cancel(self):
+        self.__cancel_event.set()
+
+
+class TestAcquisitionJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.save_path = pathlib.Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_jobs_run_in_order_and_results_are_persisted(self):
+        runner = TestRunner()
+        queue = job_queue.AcquisitionJobQueue(self.save_path, {"test": runner})
+        jobs = queue.add_jobs([{"kind": "test", "value": 1}, {"kind": "test", "value": 2}])
+        queue.start()
+        self.assertTrue(queue.join(5.0))
+        self.assertEqual([1, 2], [spec["value"] for spec in runner.specs])
+        for job, value in zip(jobs, (1, 2)):
+            self.assertEqual(job_queue.JobState.COMPLETE, job.state)
+            self.assertGreaterEqual(job.duration, 0.0)
+            results = queue.get_results(job)
+            self.assertEqual(1, len(results))
+            self.assertTrue(numpy.array_equal(numpy.full((4, 5), value), results[0].data))
+            self.assertEqual("eV", results[0].dimensional_calibrations[-1].units)
+
+    def test_failed_job_does_not_stop_queue(self):
+        runner = TestRunner()
+        queue = job_queue.AcquisitionJobQueue(self.save_path, {"test": runner})
+        jobs = queue.add_jobs([{"kind": "test", "fail": True}, {"kind": "unknown"}, {"kind": "test"}])
+        queue.start()
+        self.assertTrue(queue.join(5.0))
+        self.assertEqual([job_queue.JobState.FAILED, job_queue.JobState.FAILED, job_queue.JobState.COMPLETE], [job.state for job in jobs])
+        self.assertEqual("failed", jobs[0].error)
+
+    def test_canceled_queue_resumes_from_saved_state(self):
+        runner = TestRunner()
+        runner.block = True
+        queue = job_queue.AcquisitionJobQueue(self.save_path, {"test": runner})
+        jobs = queue.add_jobs([{"kind": "test", "value": 1}, {"kind": "test", "value": 2}])
+        queue.start()
+        self.assertTrue(runner.started_event.wait(5.0))
+        queue.cancel()
+        self.assertTrue(queue.join(5.0))
+        self.assertEqual([job_queue.JobState.CANCELED, job_queue.JobState.PENDING], [job.state for job in jobs])
+        # a new queue reads the saved state and finishes the remaining jobs on resume
+        queue2 = job_queue.AcquisitionJobQueue(self.save_path, {"test": runner})
+        self.assertEqual([job.job_id for job in jobs], [job.job_id for job in queue2.jobs])
+        queue2.resume()
+        self.assertTrue(queue2.join(5.0))
+        self.assertEqual([job_queue.JobState.COMPLETE, job_queue.JobState.COMPLETE], [job.state for job in queue2.jobs])
+        self.assertEqual(2, queue2.get_results(queue2.jobs[1])[0].data[0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+import unittest
+import unittest.mock
+
+import numpy
+
+from nion.data import DataAndMetadata
+from nion.instrumentation import async_acquisition
+from nion.utils import Event
+
+
+class FakeHardwareSource:
+    """Deliver numbered frames on a thread while playing."""
+
+    def __init__(self, frame_time=0.01):
+        self.xdatas_available_event = Event.Event()
+        self.acquisition_state_changed_event = Event.Event()
+        self.abort_event = Event.Event()
+        self.frame_time = frame_time
+        self.frame_number = 0
+        self.is_playing = False
+        self.sequence_aborted = threading.Event()
+        self.__thread = None
+
+    def start_playing(self):
+        if not self.is_playing:
+            self.is_playing = True
+            self.__thread = threading.Thread(target=self.__acquire_loop, daemon=True)
+            self.__thread.start()
+            self.acquisition_state_changed_event.fire(True)
+
+    def stop_playing(self):
+        if self.is_playing:
+            self.is_playing = False
+            self.__thread.join()
+            self.acquisition_state_changed_event.fire(False)
+
+    def __acquire_loop(self):
+        while self.is_playing:
+            time.sleep(self.frame_time)
+            self.frame_number += 1
+            self.xdatas_available_event.fire([DataAndMetadata.new_data_and_metadata(numpy.full((2, 2), self.frame_number))])
+
+    def grab_sequence(self, count):
+        self.sequence_aborted.wait(5.0)
+        return None
+
+    def grab_sequence_abort(self):
+        self.sequence_aborted.set()
+
+
+class TestAsyncAcquisition(unittest.TestCase):
+
+    def setUp(self):
+        self.event_loop = asyncio.new_event_loop()
+        self.hardware_source = FakeHardwareSource()
+
+    def tearDown(self):
+        self.hardware_source.stop_playing()
+        self.event_loop.close()
+
+    def test_grab_next_starts_playing_and_returns_next_frame(self):
+        xdatas = self.event_loop.run_until_complete(async_acquisition.grab_next(self.hardware_source, timeout=5.0))
+        self.assertTrue(self.hardware_source.is_playing)
+        frame_number = int(xdatas[0].data[0, 0])
+        xdatas = self.event_loop.run_until_complete(async_acquisition.grab_next(self.hardware_source, to_start=True, timeout=5.0))
+        self.assertLessEqual(frame_number + 2, int(xdatas[0].data[0, 0]))
+
+    def test_grab_next_times_out_if_no_frame_arrives(self):
+        self.hardware_source.frame_time = 10.0
+        with self.assertRaises(asyncio.TimeoutError):
+            self.event_loop.run_until_complete(async_acquisition.grab_next(self.hardware_source, timeout=0.05))
+        self.hardware_source.is_playing = False
+
+    def test_grab_next_ignores_frames_after_the_resolving_frame(self):
+        self.hardware_source.is_playing = True  # frames are fired by the test
+
+        async def grab():
+            task = self.event_loop.create_task(async_acquisition.grab_next(self.hardware_source, timeout=5.0))
+            await asyncio.sleep(0)
+            for i in range(3):
+                self.hardware_source.xdatas_available_event.fire([DataAndMetadata.new_data_and_metadata(numpy.full((2, 2), i))])
+            return await task
+
+        with unittest.mock.patch.object(async_acquisition, "_copy_xdatas", wraps=async_acquisition._copy_xdatas) as copy_xdatas:
+            xdatas = self.event_loop.run_until_complete(grab())
+        self.assertEqual(0, int(xdatas[0].data[0, 0]))
+        self.assertEqual(1, copy_xdatas.call_count)
+        self.hardware_source.is_playing = False
+
+    def test_wait_for_playing_waits_for_state_change(self):
+
+        async def start_later():
+            await asyncio.sleep(0.05)
+            self.hardware_source.start_playing()
+
+        async def wait():
+            self.event_loop.create_task(start_later())
+            await async_acquisition.wait_for_playing(self.hardware_source, timeout=5.0)
+
+        self.event_loop.run_until_complete(wait())
+        self.assertTrue(self.hardware_source.is_playing)
+
+    def test_frame_iterator_returns_newest_frames_and_counts_dropped(self):
+
+        async def iterate():
+            frame_numbers = list()
+            async with async_acquisition.frames(self.hardware_source) as frame_iterator:
+                self.hardware_source.start_playing()
+                async for xdatas in frame_iterator:
+                    frame_numbers.append(int(xdatas[0].data[0, 0]))
+                    await asyncio.sleep(0.05)  # slow consumer
+                    if len(frame_numbers) == 3:
+                        break
+            return frame_numbers, frame_iterator
+
+        frame_numbers, frame_iterator = self.event_loop.run_until_complete(iterate())
+        self.assertEqual(sorted(frame_numbers), frame_numbers)
+        self.assertLess(0, frame_iterator.dropped_count)
+
+    def test_frame_iterator_reuses_buffers_of_dropped_frames(self):
+        self.hardware_source.is_playing = True  # frames are fired by the test
+
+        async def iterate():
+            async with async_acquisition.frames(self.hardware_source) as frame_iterator:
+                await asyncio.sleep(0)
+                with unittest.mock.patch.object(numpy, "copy", wraps=numpy.copy) as copy:
+                    for i in range(3):
+                        self.hardware_source.xdatas_available_event.fire([DataAndMetadata.new_data_and_metadata(numpy.full((2, 2), i))])
+                xdatas = await frame_iterator.__anext__()
+            return xdatas, frame_iterator, copy.call_count
+
+        xdatas, frame_iterator, copy_count = self.event_loop.run_until_complete(iterate())
+        self.assertEqual(2, int(xdatas[0].data[0, 0]))
+        self.assertEqual(3, frame_iterator.received_count)
+        self.assertEqual(2, frame_iterator.dropped_count)
+        self.assertEqual(1, copy_count)
+        self.hardware_source.is_playing = False
+
+    def test_frame_iterator_times_out_if_no_frame_arrives(self):
+
+        async def iterate():
+            async with async_acquisition.frames(self.hardware_source, timeout=0.05) as frame_iterator:
+                async for xdatas in frame_iterator:
+                    pass
+
+        with self.assertRaises(asyncio.TimeoutError):
+            self.event_loop.run_until_complete(iterate())
+
+    def test_cancelling_grab_sequence_aborts_the_sequence(self):
+
+        async def cancel_grab():
+            task = self.event_loop.create_task(async_acquisition.grab_sequence(self.hardware_source, 10))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        self.event_loop.run_until_complete(cancel_grab())
+        self.assertTrue(self.hardware_source.sequence_aborted.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()
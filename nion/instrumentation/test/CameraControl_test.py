@@ -18,6 +18,7 @@ from nion.utils import Event
 from nion.utils import Geometry
 from nion.utils import Registry
 from nion.instrumentation import camera_base
+from nion.instrumentation import frame_statistics
 from nionswift_plugin.nion_instrumentation_ui import CameraControlPanel
 from nionswift_plugin.usim import InstrumentDevice
 from nionswift_plugin.usim import CameraDevice
@@ -155,6 +156,45 @@ class TestCameraControlClass(unittest.TestCase):
             self._acquire_one(document_controller, hardware_source)
             self.assertEqual(len(document_model.data_items), 1)
 
+    def test_camera_current_is_updated_from_frame_statistics_service(self):
+        document_controller, document_model, hardware_source, state_controller = self.__setup_hardware_source()
+        with contextlib.closing(document_controller), contextlib.closing(state_controller):
+            # run the queued ui tasks directly.
+            current_state_controller = CameraControlPanel.CameraControlStateController(hardware_source, lambda fn: fn(), document_model)
+            service = frame_statistics.acquire_frame_statistics_service(hardware_source)
+            self.assertEqual(2, service.statistics_changed_event.listener_count)
+            camera_currents = list()
+            current_state_controller.on_camera_current_changed = camera_currents.append
+            hardware_source.start_playing()
+            try:
+                start_time = time.time()
+                while not any(camera_currents):
+                    time.sleep(0.05)
+                    self.assertTrue(time.time() - start_time < TIMEOUT)
+            finally:
+                hardware_source.abort_playing()
+                current_state_controller.close()
+            self.assertLess(0.0, next(filter(None, camera_currents)))
+            self.assertLess(0, service.processed_count)
+            frame_statistics.release_frame_statistics_service(service)
+
+    def test_control_widget_replaces_pending_data_item_states_with_newest_frame(self):
+        document_controller, document_model, hardware_source, state_controller = self.__setup_hardware_source()
+        with contextlib.closing(document_controller), contextlib.closing(state_controller):
+            camera_control_widget = CameraControlPanel.CameraControlWidget(document_controller, hardware_source)
+            with contextlib.closing(camera_control_widget):
+                hardware_source.start_playing()
+                try:
+                    for i in range(4):
+                        hardware_source.get_next_xdatas_to_finish()
+                finally:
+                    hardware_source.abort_playing(sync_timeout=3.0)
+                # the ui thread has not run, so only the first update is queued and the others replace it.
+                display_statistics = camera_control_widget.display_statistics
+                self.assertLessEqual(4, display_statistics["submitted"])
+                self.assertEqual(0, display_statistics["displayed"])
+                self.assertEqual(display_statistics["submitted"] - 1, display_statistics["dropped"])
+
     def test_ability_to_set_profile_parameters_is_reflected_in_acquisition(self):
         document_controller, document_model, hardware_source, state_controller = self.__setup_hardware_source()
         with contextlib.closing(document_controller), contextlib.closing(state_controller):
@@ -0,0 +1,67 @@
+import unittest
+
+import numpy
+
+from nion.instrumentation import drift_tracker
+from nion.instrumentation import registration
+
+
+def make_shifted_frame(shift, shape=(64, 64)):
+    # the frame content moves by shift so that the tracker should report the negative shift (registration convention)
+    rng = numpy.random.RandomState(3)
+    yy, xx = numpy.mgrid[0:shape[0], 0:shape[1]]
+    frame = numpy.zeros(shape)
+    for i in range(20):
+        cy, cx = rng.uniform(8, shape[0] - 8), rng.uniform(8, shape[1] - 8)
+        frame += numpy.exp(-((yy - cy) ** 2 + (xx - cx) ** 2) / 6)
+    return numpy.fft.ifftn(numpy.fft.fftn(frame) * registration.phase_ramp(shape, shift)).real
+
+
+class TestDriftTracker(unittest.TestCase):
+
+    def test_register_measures_sub_pixel_offset_in_calibrated_units(self):
+        for downsample_factor in (1, 2):
+            with self.subTest(downsample_factor=downsample_factor):
+                tracker = drift_tracker.DriftTracker(downsample_factor=downsample_factor)
+                tracker.set_reference(make_shifted_frame((0, 0)), 0.0, (0.5, 0.5))
+                offset = tracker.register(make_shifted_frame((1.6, -2.4)))
+                self.assertTrue(numpy.allclose((-0.8, 1.2), offset, atol=0.1 * downsample_factor))
+
+    def test_prediction_follows_constant_drift_velocity(self):
+        tracker = drift_tracker.DriftTracker(measurement_noise=0.01)
+        tracker.set_reference(make_shifted_frame((0, 0)), 0.0)
+        for t in range(1, 6):
+            tracker.measure(make_shifted_frame((0.5 * t, -0.25 * t)), float(t))
+        offset, uncertainty = tracker.predict(8.0)
+        self.assertTrue(numpy.allclose((-4.0, 2.0), offset, atol=0.2))
+        self.assertTrue(numpy.all(uncertainty > 0))
+        self.assertEqual(5, tracker.measured_count)
+
+    def test_drift_frames_are_skipped_only_while_prediction_is_certain(self):
+        tracker = drift_tracker.DriftTracker(measurement_noise=0.01, process_noise=1e-4, skip_uncertainty=0.1, max_skip_count=2)
+        self.assertTrue(tracker.needs_measurement(0.0))
+        tracker.set_reference(make_shifted_frame((0, 0)), 0.0)
+        for t in range(1, 4):
+            tracker.update((0.0, 0.0), float(t))
+        self.assertFalse(tracker.needs_measurement(3.5))
+        self.assertFalse(tracker.needs_measurement(3.6))
+        self.assertTrue(tracker.needs_measurement(3.7))  # skip count exceeded
+        tracker.update((0.0, 0.0), 3.8)
+        self.assertTrue(tracker.needs_measurement(1000.0))  # uncertainty grows with time
+        self.assertEqual(2, tracker.skipped_count)
+
+    def test_drift_log_keeps_newest_entries_in_order(self):
+        drift_log = drift_tracker.DriftLog(4)
+        self.assertEqual((3, 0), drift_log.data.shape)
+        for i in range(6):
+            drift_log.append((3.0 * i, 4.0 * i))
+        self.assertEqual(4, drift_log.count)
+        self.assertEqual([2, 3, 4, 5], list(drift_log.data[0] / 3))
+        self.assertEqual([10, 15, 20, 25], list(drift_log.data[2]))
+        self.assertEqual("nm", drift_log.get_xdata().intensity_calibration.units)
+        drift_log.clear()
+        self.assertEqual(0, drift_log.count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import unittest.mock
+
+import numpy
+
+from nion.data import DataAndMetadata
+from nion.instrumentation import camera_base
+from nionswift_plugin.usim import CameraDevice
+from nionswift_plugin.usim import InstrumentDevice
+
+
+class TestElectronCounting(unittest.TestCase):
+
+    def test_count_electrons_finds_one_event_per_blob(self):
+        frames = numpy.zeros((3, 16, 16), numpy.uint16)
+        frames[0, 4:6, 4:6] = [[20, 30], [25, 10]]  # one electron spread over four pixels
+        frames[0, 10, 12] = 40
+        frames[2, 0, 0] = 15  # at the corner
+        frames[2, 8, 8:10] = 22  # equal neighbors count once
+        frames[1] = 3  # below threshold
+        sparse_frames = camera_base.count_electrons(frames, 5)
+        self.assertEqual(3, sparse_frames.frame_count)
+        self.assertEqual([0, 2, 2, 4], list(sparse_frames.frame_offsets))
+        self.assertEqual([(4, 5), (10, 12)], list(zip(*[list(a) for a in sparse_frames.get_frame_events(0)])))
+        self.assertEqual([(0, 0), (8, 8)], list(zip(*[list(a) for a in sparse_frames.get_frame_events(2)])))
+        self.assertEqual([0, 0, 2, 2], list(sparse_frames.frame_indexes))
+
+    def test_count_electrons_without_maxima_keeps_all_pixels_above_threshold(self):
+        frames = numpy.zeros((1, 8, 8), numpy.float32)
+        frames[0, 2, 2:5] = 10
+        sparse_frames = camera_base.count_electrons(frames, 5, find_maxima=False)
+        self.assertEqual(3, sparse_frames.event_count)
+
+    def test_sparse_frames_dense_view_matches_events(self):
+        rng = numpy.random.RandomState(1)
+        frames = rng.poisson(0.01, size=(5, 32, 32)) * 100
+        sparse_frames = camera_base.count_electrons(frames, 50, find_maxima=False)
+        self.assertTrue(numpy.array_equal(frames > 50, sparse_frames.to_dense() > 0))
+        self.assertTrue(numpy.array_equal(frames[3] > 50, sparse_frames.get_frame(3) > 0))
+        self.assertTrue(numpy.array_equal(frames[2:4] > 50, sparse_frames.to_dense(2, 2) > 0))
+        self.assertLess(sparse_frames.nbytes, frames.nbytes // 10)
+
+    def test_counting_in_chunks_matches_counting_all_frames(self):
+        rng = numpy.random.RandomState(2)
+        frames = rng.poisson(0.02, size=(7, 16, 16)) * 100
+        sparse_frames = camera_base.count_electrons(frames, 50)
+        for chunk_size in (1, 3, 7):
+            chunks = (frames[i:i + chunk_size] for i in range(0, frames.shape[0], chunk_size))
+            chunked_sparse_frames = camera_base.count_electrons_in_chunks(chunks, 50)
+            self.assertEqual(7, chunked_sparse_frames.frame_count)
+            self.assertEqual(list(sparse_frames.frame_offsets), list(chunked_sparse_frames.frame_offsets))
+            self.assertTrue(numpy.array_equal(sparse_frames.to_dense(), chunked_sparse_frames.to_dense()))
+        self.assertEqual(0, camera_base.count_electrons_in_chunks(iter(()), 50).frame_count)
+
+    def test_grab_sequence_counted_rejects_frames_which_are_not_two_dimensional(self):
+        instrument = InstrumentDevice.Instrument("usim_stem_controller")
+        camera_device = CameraDevice.Camera("usim_ronchigram_camera", "ronchigram", "uSim Camera", instrument)
+        camera_settings = CameraDevice.CameraSettings("usim_ronchigram_camera")
+        camera_hardware_source = camera_base.CameraHardwareSource("usim_stem_controller", camera_device, camera_settings, None, None)
+        try:
+            frame_parameters = camera_hardware_source.get_current_frame_parameters()
+            frame_parameters["processing"] = "sum_project"
+            camera_hardware_source.set_current_frame_parameters(frame_parameters)
+            with self.assertRaises(ValueError):
+                camera_hardware_source.grab_sequence_counted(2, 50)
+            self.assertFalse(camera_hardware_source.is_playing)
+            frame_parameters["processing"] = None
+            camera_hardware_source.set_current_frame_parameters(frame_parameters)
+            spectra_xdata = DataAndMetadata.new_data_and_metadata(numpy.zeros((2, 16)), data_descriptor=DataAndMetadata.DataDescriptor(True, 0, 1))
+            with unittest.mock.patch.object(camera_hardware_source, "grab_sequence", return_value=[spectra_xdata]):
+                with self.assertRaises(ValueError):
+                    camera_hardware_source.grab_sequence_counted(2, 50)
+        finally:
+            camera_hardware_source.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import contextlib
+import threading
+import time
+import unittest
+
+import numpy
+
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.instrumentation import frame_statistics
+from nion.utils import Event
+
+
+class FakeHardwareSource:
+
+    def __init__(self):
+        self.xdatas_available_event = Event.Event()
+
+
+class TestFrameStatistics(unittest.TestCase):
+
+    def test_statistics_of_small_frame_are_exact(self):
+        data = numpy.arange(12, dtype=numpy.uint16).reshape(3, 4)
+        statistics = frame_statistics.compute_frame_statistics(data, saturation_level=10, bins=4)
+        self.assertTrue(statistics.is_exact)
+        self.assertEqual(66, statistics.sum)
+        self.assertAlmostEqual(5.5, statistics.mean)
+        self.assertEqual((0, 11), (statistics.minimum, statistics.maximum))
+        self.assertEqual(2, statistics.saturation_count)
+        self.assertEqual(12, numpy.sum(statistics.histogram))
+
+    def test_large_frames_are_subsampled_and_sum_is_scaled(self):
+        data = numpy.full((400, 300), 2, numpy.float32)
+        subsampled, step = frame_statistics.subsample(data, 10000)
+        self.assertLessEqual(subsampled.size, 10000)
+        statistics = frame_statistics.compute_frame_statistics(subsampled, subsample_step=step, frame_shape=data.shape)
+        self.assertFalse(statistics.is_exact)
+        self.assertAlmostEqual(2 * data.size, statistics.sum, delta=1)
+
+    def test_service_publishes_statistics_with_detector_current(self):
+        hardware_source = FakeHardwareSource()
+        service = frame_statistics.acquire_frame_statistics_service(hardware_source)
+        self.assertIs(service, frame_statistics.acquire_frame_statistics_service(hardware_source))
+        statistics_event = threading.Event()
+        statistics_list = list()
+
+        def statistics_changed(statistics):
+            statistics_list.append(statistics)
+            statistics_event.set()
+
+        listener = service.statistics_changed_event.listen(statistics_changed)
+        try:
+            metadata = {"hardware_source": {"counts_per_electron": 2.0, "exposure": 0.5}}
+            xdata = DataAndMetadata.new_data_and_metadata(numpy.full((8, 8), 4.0), intensity_calibration=Calibration.Calibration(units="counts"), metadata=metadata)
+            hardware_source.xdatas_available_event.fire([xdata])
+            self.assertTrue(statistics_event.wait(5.0))
+            self.assertEqual(256, statistics_list[0].sum)
+            self.assertAlmostEqual(256 / 0.5 / 2.0 / 6.242e18, statistics_list[0].detector_current)
+            self.assertIs(statistics_list[0], service.latest_statistics)
+        finally:
+            listener.close()
+            frame_statistics.release_frame_statistics_service(service)
+            frame_statistics.release_frame_statistics_service(service)
+        new_service = frame_statistics.acquire_frame_statistics_service(hardware_source)
+        self.assertIsNot(service, new_service)
+        frame_statistics.release_frame_statistics_service(new_service)
+
+    def test_service_only_samples_frames_for_listeners_and_at_most_once_per_interval(self):
+        hardware_source = FakeHardwareSource()
+        service = frame_statistics.FrameStatisticsService(hardware_source, interval=60.0)
+        statistics_event = threading.Event()
+        try:
+            xdata = DataAndMetadata.new_data_and_metadata(numpy.ones((8, 8)))
+            hardware_source.xdatas_available_event.fire([xdata])
+            with contextlib.closing(service.statistics_changed_event.listen(lambda statistics: statistics_event.set())):
+                for i in range(3):
+                    hardware_source.xdatas_available_event.fire([xdata])
+                self.assertTrue(statistics_event.wait(5.0))
+            time.sleep(0.05)
+            self.assertEqual(1, service.processed_count)
+            self.assertEqual(0, service.skipped_count)
+        finally:
+            service.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import time
+import unittest
+
+from nion.instrumentation import instrument_server
+from nion.instrumentation import stem_controller
+
+
+class TestInstrument(stem_controller.STEMController):
+
+    def __init__(self, values):
+        super().__init__()
+        self.values = dict(values)
+
+    def TryGetVal(self, s):
+        if s in self.values:
+            return True, self.values[s]
+        return False, None
+
+    def GetVal(self, s, default_value=None):
+        if s in self.values:
+            return self.values[s]
+        if default_value is not None:
+            return default_value
+        raise Exception(f"No element named '{s}' exists! Cannot get value.")
+
+    def SetVal(self, s, val):
+        self.values[s] = val
+        return True
+
+
+class TestInstrumentServer(unittest.TestCase):
+
+    def test_proxy_forwards_calls_and_errors(self):
+        server = instrument_server.InstrumentServer(TestInstrument({"C10": 1.0}))
+        proxy = instrument_server.ProxySTEMController(server.address, server.authkey)
+        try:
+            self.assertEqual((True, 1.0), proxy.TryGetVal("C10"))
+            self.assertTrue(proxy.SetVals({"C10": 2.0, "C12": 3.0}))
+            self.assertEqual({"C10": 2.0, "C12": 3.0}, proxy.TryGetVals(["C10", "C12", "C30"]))
+            with self.assertRaises(Exception):
+                proxy.GetVal("C30")
+            with self.assertRaises(AttributeError):
+                proxy.call_async("close").result(5.0)
+            self.assertEqual(1, server.call_counts["TryGetVals"])
+        finally:
+            proxy.close()
+            server.close()
+
+    def test_pipelined_calls_overlap_latency(self):
+        latency = 0.1
+        server = instrument_server.InstrumentServer(TestInstrument({"C10": 1.0}), latency=latency)
+        proxy = instrument_server.ProxySTEMController(server.address, server.authkey, pool_size=1)
+        try:
+            start = time.perf_counter()
+            self.assertEqual((True, 1.0), proxy.TryGetVal("C10"))
+            self.assertGreaterEqual(time.perf_counter() - start, latency)
+            start = time.perf_counter()
+            futures = [proxy.call_async("TryGetVal", "C10") for i in range(10)]
+            self.assertEqual([(True, 1.0)] * 10, [future.result(5.0) for future in futures])
+            self.assertLess(time.perf_counter() - start, 5 * latency)
+        finally:
+            proxy.close()
+            server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,16 @@ import unittest
 import threading
 import copy
 import time
+import unittest.mock
 import numpy as np
 
-from nion.instrumentation import camera_base, scan_base
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.instrumentation import camera_base, reduction, scan_base
 from nion.swift.model import HardwareSource, DocumentModel
 from nion.swift import Facade, Application
 from nion.utils import Event
+from nion.utils import Geometry
 from nion.utils import Registry
 from nionswift_plugin.usim import InstrumentDevice, CameraDevice, ScanDevice
 from nion.ui import TestUI
@@ -65,6 +69,77 @@ class TestMultiAcquire(unittest.TestCase):
         multi_acquire.spectrum_parameters[:] = parameters
         return multi_acquire
 
+    def test_shift_x_and_adjust_focus_falls_back_to_overridden_shift_x(self):
+
+        class ShiftingMultiAcquireController(MultiAcquire.MultiAcquireController):
+            def __init__(self):
+                super().__init__()
+                self.shifts = list()
+
+            def shift_x(self, eV):
+                self.shifts.append(eV)
+
+        multi_acquire = ShiftingMultiAcquireController()
+        multi_acquire.stem_controller = unittest.mock.Mock()
+        multi_acquire.shift_x_and_adjust_focus(160)
+        self.assertEqual([160], multi_acquire.shifts)
+        multi_acquire.stem_controller.SetValsAndConfirm.assert_not_called()
+
+    def test_acquire_multi_eels_spectrum_image_sums_reduced_maps_of_each_spectrum(self):
+        settings = {'x_shifter': '', 'blanker': '', 'x_shift_delay': 0, 'focus': '', 'focus_delay': 0,
+                    'auto_dark_subtract': False, 'bin_spectra': True, 'blanker_delay': 0, 'sum_frames': True,
+                    'camera_hardware_source_id': ''}
+        parameters = [{'index': 0, 'offset_x': 0, 'exposure_ms': 5, 'frames': 2},
+                      {'index': 1, 'offset_x': 160, 'exposure_ms': 8, 'frames': 1}]
+        multi_acquire = self._set_up_multi_acquire(settings, parameters)
+        multi_acquire.stem_controller = unittest.mock.Mock()
+        multi_acquire.camera = unittest.mock.Mock()
+        multi_acquire.camera.get_current_frame_parameters.return_value = dict()
+        multi_acquire.superscan = unittest.mock.Mock()
+        multi_acquire.superscan.get_current_frame_parameters.return_value.size = (2, 3)
+        scan_calibrations = (Calibration.Calibration(), Calibration.Calibration())
+        grab_sync_info = scan_base.ScanHardwareSource.GrabSynchronizedInfo(
+            Geometry.IntSize(h=2, w=3), Geometry.FloatRect.unit_rect(), False, (8,), (8,), None, scan_calibrations,
+            (Calibration.Calibration(),), Calibration.Calibration(), dict(), dict())
+
+        def grab_synchronized(*, reduction_stage, **kwargs):
+            reduction_stage.prepare(grab_sync_info)
+            section_xdata = DataAndMetadata.new_data_and_metadata(np.ones((2, 3, 8), np.float32), data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1))
+            reduction_stage.update(section_xdata, Geometry.IntRect.from_tlhw(0, 0, 2, 3), 2)
+
+        multi_acquire.superscan.grab_synchronized.side_effect = grab_synchronized
+        energy_offsets = list()
+
+        def reducers_fn(energy_offset):
+            energy_offsets.append(energy_offset)
+            return [reduction.VirtualDetectorReducer({"sum": np.ones((8,), bool)})]
+
+        reduced_data_dicts = list()
+        listener = multi_acquire.new_data_ready_event.listen(lambda data_dict: reduced_data_dicts.append(data_dict) if data_dict.get('is_reduced_data') else None)
+        multi_acquire.acquire_multi_eels_spectrum_image(reducers_fn=reducers_fn)
+        listener.close()
+        self.assertEqual([0, 160], energy_offsets)
+        self.assertEqual([0, 0, 1], [data_dict['parameters']['index'] for data_dict in reduced_data_dicts])
+        self.assertTrue(np.all(reduced_data_dicts[1]['xdata_list'][0].data == 16))
+        self.assertTrue(np.all(reduced_data_dicts[2]['xdata_list'][0].data == 8))
+
+    def test_close_data_item_refs_exits_write_suspend_state_after_flushed_updates(self):
+        tasks = list()
+        api = unittest.mock.Mock()
+        api.queue_task.side_effect = tasks.append
+        si_receiver = MultiAcquirePanel.MultiAcquirePanelDelegate(api)
+        calls = list()
+        appendable_data_item = unittest.mock.Mock()
+        appendable_data_item.exit_write_suspend_state.side_effect = lambda: calls.append('exit')
+        si_receiver.result_data_items = {0: appendable_data_item}
+        display_coalescer = si_receiver._MultiAcquirePanelDelegate__display_coalescer
+        display_coalescer.mark_dirty(0, (...,), lambda slice_tuple: calls.append('update'))
+        si_receiver._MultiAcquirePanelDelegate__close_data_item_refs()
+        for task in tasks:
+            task()
+        self.assertEqual(['update', 'exit'], calls)
+        si_receiver.close()
+
     def test_acquire_multi_eels_spectrum_works_and_finishes_in_time(self):
         settings = {'x_shifter': 'EELS_MagneticShift_Offset', 'blanker': 'C_Blank',
                     'x_shift_delay': 0.05, 'focus': '', 'focus_delay': 0, 'auto_dark_subtract': True,
@@ -0,0 +1,192 @@
+import collections
+import unittest
+
+import numpy
+
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.instrumentation import reduction
+from nion.utils import Geometry
+
+
+GrabSynchronizedInfo = collections.namedtuple("GrabSynchronizedInfo", ["scan_size", "camera_readout_size_squeezed", "scan_calibrations",
+                                                                       "data_calibrations", "camera_metadata", "scan_metadata"])
+
+
+def make_grab_sync_info(scan_size, datum_shape, data_calibrations=None):
+    scan_calibrations = (Calibration.Calibration(scale=2.0, units="nm"), Calibration.Calibration(scale=2.0, units="nm"))
+    data_calibrations = data_calibrations or tuple(Calibration.Calibration() for d in datum_shape)
+    return GrabSynchronizedInfo(Geometry.IntSize.make(scan_size), tuple(datum_shape), scan_calibrations, data_calibrations, dict(), dict())
+
+
+def make_section_xdata(data):
+    return DataAndMetadata.new_data_and_metadata(data, data_descriptor=DataAndMetadata.DataDescriptor(False, 2, len(data.shape) - 2))
+
+
+class TestReduction(unittest.TestCase):
+
+    def test_section_reducer_requires_output_names_and_reduce(self):
+
+        class NamesOnlyReducer(reduction.SectionReducer):
+            @property
+            def output_names(self):
+                return ["sum"]
+
+        with self.assertRaises(TypeError):
+            NamesOnlyReducer()
+
+    def test_virtual_detector_images_match_masked_sums(self):
+        rng = numpy.random.RandomState(0)
+        data = rng.poisson(5, size=(6, 5, 16, 16)).astype(numpy.uint16)
+        bright_field_mask = reduction.make_disk_mask((16, 16), (8, 8), 3)
+        annular_mask = reduction.make_annular_mask((16, 16), (8, 8), 4, 8)
+        weights = rng.uniform(size=(16, 16))
+        for thread_count in (1, 3):
+            with self.subTest(thread_count=thread_count):
+                reducer = reduction.VirtualDetectorReducer({"bf": bright_field_mask, "adf": annular_mask, "weighted": weights})
+                reduction_stage = reduction.ReductionStage([reducer], thread_count=thread_count)
+                try:
+                    reduction_stage.prepare(make_grab_sync_info((6, 5), (16, 16)))
+                    reduction_stage.update(make_section_xdata(data), Geometry.IntRect.from_tlhw(0, 0, 6, 5), 6)
+                    bf, adf, weighted = [xdata.data for xdata in reducer.get_xdatas()]
+                    self.assertTrue(numpy.allclose(numpy.sum(data * bright_field_mask, axis=(2, 3)), bf))
+                    self.assertTrue(numpy.allclose(numpy.sum(data * annular_mask, axis=(2, 3)), adf))
+                    self.assertTrue(numpy.allclose(numpy.sum(data * weights, axis=(2, 3)), weighted, rtol=1e-5))
+                    self.assertEqual("nm", reducer.get_xdatas()[0].dimensional_calibrations[0].units)
+                finally:
+                    reduction_stage.close()
+
+    def test_reduction_stage_reduces_only_newly_valid_rows_of_each_section(self):
+        data = numpy.ones((8, 4, 4, 4), numpy.float32)
+        reducer = reduction.VirtualDetectorReducer({"sum": numpy.ones((4, 4), bool)})
+        reduction_stage = reduction.ReductionStage([reducer])
+        reduction_stage.prepare(make_grab_sync_info((8, 4), (4, 4)))
+        updated_rects = list()
+        listener = reducer.data_changed_event.listen(updated_rects.append)
+        try:
+            section_data = numpy.zeros((4, 4, 4, 4), numpy.float32)
+            section_rect = Geometry.IntRect.from_tlhw(4, 0, 4, 4)
+            section_data[:1] = data[4:5]
+            reduction_stage.update(make_section_xdata(section_data), section_rect, 1)
+            section_data[1:3] = data[5:7]
+            reduction_stage.update(make_section_xdata(section_data), section_rect, 3)
+            reduction_stage.update(make_section_xdata(section_data), section_rect, 3)
+            self.assertEqual([Geometry.IntRect.from_tlhw(4, 0, 1, 4), Geometry.IntRect.from_tlhw(5, 0, 2, 4)], updated_rects)
+            expected = numpy.zeros((8, 4))
+            expected[4:7] = 16
+            self.assertTrue(numpy.array_equal(expected, reducer.get_xdatas()[0].data))
+        finally:
+            listener.close()
+            reduction_stage.close()
+
+    def test_center_of_mass_maps_follow_shifted_disk(self):
+        shifts = [(0, 0), (2, -1), (-3, 4)]
+        data = numpy.zeros((1, 3, 32, 32), numpy.uint16)
+        for i, (dy, dx) in enumerate(shifts):
+            data[0, i] = reduction.make_disk_mask((32, 32), (15.5 + dy, 15.5 + dx), 5) * 10 + 1
+        data_calibrations = (Calibration.Calibration(scale=0.5, units="mrad"), Calibration.Calibration(scale=0.5, units="mrad"))
+        reducer = reduction.CenterOfMassReducer(threshold=5, calibrated=True)
+        reduction_stage = reduction.ReductionStage([reducer])
+        reduction_stage.prepare(make_grab_sync_info((1, 3), (32, 32), data_calibrations))
+        reduction_stage.update(make_section_xdata(data), Geometry.IntRect.from_tlhw(0, 0, 1, 3), 1)
+        com_x, com_y, intensity = reducer.get_xdatas()
+        self.assertTrue(numpy.allclose([dx * 0.5 for dy, dx in shifts], com_x.data[0], atol=0.05))
+        self.assertTrue(numpy.allclose([dy * 0.5 for dy, dx in shifts], com_y.data[0], atol=0.05))
+        self.assertEqual("mrad", com_x.intensity_calibration.units)
+        # the threshold removes the background
+        self.assertTrue(numpy.allclose(numpy.sum(data[0] * (data[0] >= 5), axis=(1, 2)), intensity.data[0]))
+
+    def test_center_of_mass_of_empty_frame_is_zero(self):
+        reducer = reduction.CenterOfMassReducer(mask=reduction.make_disk_mask((8, 8), (3.5, 3.5), 2))
+        reducer.prepare(Geometry.IntSize(h=1, w=2), (8, 8))
+        data = numpy.zeros((1, 2, 8, 8), numpy.float32)
+        data[0, 1, 0, 0] = 100  # outside of the mask
+        reducer.update(data, Geometry.IntRect.from_tlhw(0, 0, 1, 2))
+        self.assertTrue(numpy.array_equal(numpy.zeros((3, 1, 2)), numpy.array([xdata.data for xdata in reducer.get_xdatas()])))
+
+    def test_eels_edge_map_subtracts_power_law_background(self):
+        energies = 400 + 2.0 * (numpy.arange(256) + 0.5)
+        background = 1e9 * energies ** -3.0
+        edge = numpy.where(energies >= 530, 50.0, 0.0)
+        amplitudes = numpy.array([[0.0, 1.0, 2.5]])
+        spectra = background + amplitudes[..., numpy.newaxis] * edge
+        energy_calibration = Calibration.Calibration(offset=400, scale=2.0, units="eV")
+        reducer = reduction.EELSEdgeMapReducer({"O": ((470, 525), (530, 580))})
+        reducer.prepare(Geometry.IntSize(h=1, w=3), (256,), data_calibrations=(energy_calibration,))
+        reducer.update(spectra.astype(numpy.float32), Geometry.IntRect.from_tlhw(0, 0, 1, 3))
+        signal_channel_count = numpy.count_nonzero((energies >= 530) & (energies < 580))
+        self.assertTrue(numpy.allclose(amplitudes[0] * 50 * signal_channel_count, reducer.get_xdatas()[0].data[0], rtol=1e-3, atol=1.0))
+
+    def test_eels_edge_map_windows_are_shifted_by_energy_offset(self):
+        energies = 400 + 2.0 * (numpy.arange(256) + 0.5)
+        spectra = (1e9 * energies ** -3.0 + numpy.where(energies >= 530, 50.0, 0.0))[numpy.newaxis, numpy.newaxis, :]
+        reducer = reduction.EELSEdgeMapReducer({"O": ((470, 525), (530, 580))})
+        reducer.prepare(Geometry.IntSize(h=1, w=1), (256,), data_calibrations=(Calibration.Calibration(offset=400, scale=2.0, units="eV"),))
+        reducer.update(spectra.astype(numpy.float32), Geometry.IntRect.from_tlhw(0, 0, 1, 1))
+        shifted_reducer = reduction.EELSEdgeMapReducer({"O": ((470, 525), (530, 580))}, energy_offset=160)
+        shifted_reducer.prepare(Geometry.IntSize(h=1, w=1), (256,), data_calibrations=(Calibration.Calibration(offset=240, scale=2.0, units="eV"),))
+        shifted_reducer.update(spectra.astype(numpy.float32), Geometry.IntRect.from_tlhw(0, 0, 1, 1))
+        self.assertTrue(numpy.allclose(reducer.get_xdatas()[0].data, shifted_reducer.get_xdatas()[0].data))
+
+    def test_eels_edge_map_rejects_windows_outside_of_spectrum(self):
+        reducer = reduction.EELSEdgeMapReducer({"Fe": ((100, 120), (130, 150))})
+        with self.assertRaises(ValueError):
+            reducer.prepare(Geometry.IntSize(h=1, w=1), (64,), data_calibrations=(Calibration.Calibration(offset=400, scale=1.0, units="eV"),))
+
+    def test_electron_counting_maps_counts_and_keeps_events_in_scan_order(self):
+        data = numpy.zeros((4, 3, 8, 8), numpy.uint16)
+        data[1, 2, 3, 4] = 50
+        data[1, 2, 6, 1] = 50
+        data[3, 0, 0, 7] = 50
+        reducer = reduction.ElectronCountingReducer(10)
+        reduction_stage = reduction.ReductionStage([reducer], thread_count=2)
+        try:
+            reduction_stage.prepare(make_grab_sync_info((4, 3), (8, 8)))
+            reduction_stage.update(make_section_xdata(data[2:]), Geometry.IntRect.from_tlhw(2, 0, 2, 3), 2)
+            reduction_stage.update(make_section_xdata(data[:2]), Geometry.IntRect.from_tlhw(0, 0, 2, 3), 2)
+            expected = numpy.zeros((4, 3))
+            expected[1, 2] = 2
+            expected[3, 0] = 1
+            self.assertTrue(numpy.array_equal(expected, reducer.get_xdatas()[0].data))
+            sparse_frames = reducer.get_sparse_frames()
+            self.assertEqual(12, sparse_frames.frame_count)
+            self.assertEqual([5, 5, 9], list(sparse_frames.frame_indexes))
+            self.assertTrue(numpy.array_equal(data.reshape(12, 8, 8) > 0, sparse_frames.to_dense() > 0))
+        finally:
+            reduction_stage.close()
+
+    def test_electron_counting_rejects_one_dimensional_data(self):
+        with self.assertRaises(ValueError):
+            reduction.ElectronCountingReducer(10).prepare(Geometry.IntSize(h=1, w=1), (64,))
+
+    def test_storage_format_crops_bins_and_converts(self):
+        data = numpy.arange(2 * 3 * 8 * 10, dtype=numpy.float32).reshape(2, 3, 8, 10)
+        storage_format = reduction.StorageFormat(dtype=numpy.uint32, binning=(2, 3), crop=((1, 7), None))
+        self.assertEqual((3, 3), storage_format.get_datum_shape((8, 10)))
+        stored = storage_format.convert(data, 2)
+        self.assertEqual(numpy.uint32, stored.dtype)
+        self.assertEqual((2, 3, 3, 3), stored.shape)
+        self.assertEqual(numpy.sum(data[1, 2, 3:5, 3:6]), stored[1, 2, 1, 1])
+        calibrations = storage_format.get_data_calibrations((8, 10), (Calibration.Calibration(offset=-4, scale=0.5, units="mrad"), Calibration.Calibration(scale=2.0)))
+        self.assertEqual((-3.5, 1.0), (calibrations[0].offset, calibrations[0].scale))
+        self.assertEqual((0.0, 6.0), (calibrations[1].offset, calibrations[1].scale))
+        self.assertEqual(0, storage_format.clipped_count)
+
+    def test_storage_format_clips_values_outside_of_dtype(self):
+        storage_format = reduction.StorageFormat(dtype=numpy.uint16, binning=(2,))
+        stored = storage_format.convert(numpy.array([[40000, 40000, 3, 4], [-1, 0, 1.4, 1.4]], numpy.float32), 1)
+        self.assertEqual([[65535, 7], [0, 3]], stored.tolist())
+        self.assertEqual(2, storage_format.clipped_count)
+        with self.assertRaises(ValueError):
+            reduction.StorageFormat(dtype=numpy.int8)
+        with self.assertRaises(ValueError):
+            reduction.StorageFormat(binning=(16,)).get_datum_shape((8,))
+
+    def test_virtual_detector_rejects_mask_with_wrong_shape(self):
+        reducer = reduction.VirtualDetectorReducer({"bf": numpy.ones((4, 4), bool)})
+        with self.assertRaises(ValueError):
+            reduction.ReductionStage([reducer]).prepare(make_grab_sync_info((2, 2), (8, 8)))
+
+
+if __name__ == '__main__':
+    unittest.main()
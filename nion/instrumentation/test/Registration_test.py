@@ -0,0 +1,46 @@
+import unittest
+
+import numpy
+
+from nion.instrumentation import registration
+
+
+def make_shifted_stack(shifts):
+    rng = numpy.random.RandomState(1)
+    yy, xx = numpy.mgrid[0:64, 0:96]
+    frame = numpy.zeros((64, 96))
+    for i in range(12):
+        cy, cx = rng.uniform(16, 48), rng.uniform(16, 80)
+        frame += numpy.exp(-((yy - cy) ** 2 + (xx - cx) ** 2) / 8)
+    # the frames are shifted by the negative shifts so that the registration should find the shifts themselves
+    frame_fft = numpy.fft.fftn(frame)
+    return frame, numpy.array([numpy.fft.ifftn(frame_fft * registration.phase_ramp(frame.shape, -shift)).real for shift in numpy.array(shifts, dtype=float)])
+
+
+class TestRegistration(unittest.TestCase):
+
+    def test_register_fft_finds_sub_pixel_shift(self):
+        frame, stack = make_shifted_stack([(0, 0), (1.37, -2.61)])
+        shift = registration.register_fft(numpy.fft.fftn(stack[0]), numpy.fft.fftn(stack[1]), 100)
+        self.assertTrue(numpy.allclose((1.37, -2.61), shift, atol=0.02))
+
+    def test_stack_registration_accumulates_shifts_across_batches(self):
+        shifts = numpy.cumsum(numpy.full((11, 2), (0.4, -0.7)), axis=0) - (0.4, -0.7)
+        frame, stack = make_shifted_stack(shifts)
+        for relative_to_previous in (True, False):
+            with self.subTest(relative_to_previous=relative_to_previous):
+                stack_registration = registration.StackRegistration(upsample_factor=20, relative_to_previous=relative_to_previous, batch_size=4)
+                measured_shifts = stack_registration.register(stack)
+                self.assertTrue(numpy.allclose(shifts, measured_shifts, atol=0.15))
+
+    def test_sum_shifted_matches_sum_of_aligned_frames(self):
+        shifts = [(0, 0), (0.5, 1.5), (-1.25, 2.0)]
+        frame, stack = make_shifted_stack(shifts)
+        sum_image, measured_shifts = registration.StackRegistration(upsample_factor=100).register_and_sum(stack)
+        self.assertEqual(frame.shape, sum_image.shape)
+        # compare away from the edges, where padding differs from the wrapped test frames
+        self.assertTrue(numpy.allclose(3 * frame[8:-8, 8:-8], sum_image[8:-8, 8:-8], atol=0.05))
+
+
+if __name__ == '__main__':
+    unittest.main()
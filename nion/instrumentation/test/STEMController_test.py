@@ -0,0 +1,212 @@
+import asyncio
+import threading
+import unittest
+
+import numpy
+
+from nion.swift.model import DataItem
+from nion.swift.model import DocumentModel
+from nion.instrumentation import camera_base
+from nion.instrumentation import stem_controller
+from nion.utils import Event
+
+
+class TestInstrument(stem_controller.STEMController):
+
+    def __init__(self, values):
+        super().__init__()
+        self.values = dict(values)
+        self.get_count = 0
+        self.batch_get_count = 0
+
+    def TryGetVal(self, s):
+        self.get_count += 1
+        if s in self.values:
+            return True, self.values[s]
+        return False, None
+
+    @stem_controller.invalidates_value_cache()
+    def SetVal(self, s, val):
+        if s in self.values:
+            self.values[s] = val
+            return True
+        return False
+
+    @stem_controller.invalidates_value_cache()
+    def SetValAndConfirm(self, s, val, tolfactor, timeout_ms):
+        return self.SetVal(s, val)
+
+    def _get_metadata_group_controls(self, group_name):
+        return {"eels": ["EELS_Energy", "EELS_Missing"], "probe": ["C10"]}.get(group_name, list())
+
+
+class BatchedTestInstrument(TestInstrument):
+
+    def TryGetVals(self, names):
+        self.batch_get_count += 1
+        return {name: self.values[name] for name in names if name in self.values}
+
+
+class TestSTEMController(unittest.TestCase):
+
+    def test_batched_functions_fall_back_to_single_value_functions(self):
+        instrument = TestInstrument({"C10": 1.0, "C12": 2.0})
+        self.assertEqual({"C10": 1.0}, instrument.TryGetVals(["C10", "C30"]))
+        self.assertTrue(instrument.SetVals({"C10": 3.0, "C12": 4.0}))
+        self.assertFalse(instrument.SetValsAndConfirm({"C10": 5.0, "C30": 6.0}, 1.0, 1000))
+        self.assertEqual({"C10": 5.0, "C12": 4.0}, instrument.values)
+
+    def test_apply_metadata_groups_reads_all_groups_in_one_batch(self):
+        instrument = BatchedTestInstrument({"EELS_Energy": 10.0, "C10": 1.0})
+        properties = dict()
+        instrument.apply_metadata_groups(properties, [(["eels"], "eels"), (["autostem", "probe"], "probe"), (["empty"], "empty")])
+        self.assertEqual({"eels": {"EELS_Energy": 10.0}, "autostem": {"probe": {"C10": 1.0}}}, properties)
+        self.assertEqual(1, instrument.batch_get_count)
+        self.assertEqual(0, instrument.get_count)
+
+    def test_spatial_calibrations_are_read_in_one_batch(self):
+        instrument = BatchedTestInstrument({"x_scale": 2.0, "y_scale": 3.0, "x_units": "nm"})
+        calibration_controls = {"x_scale_control": "x_scale", "y_scale_control": "y_scale", "x_units_control": "x_units",
+                                "y_units_value": "um", "x_offset_control": "missing", "x_offset_value": 5.0}
+        data_element = {"properties": dict(), "calibration_controls": calibration_controls}
+        camera_base.update_spatial_calibrations(data_element, instrument, None, "eels", (4, 6), 1, 2)
+        y_calibration_dict, x_calibration_dict = data_element["spatial_calibrations"]
+        self.assertEqual({"offset": 5.0, "scale": 2.0, "units": "nm"}, x_calibration_dict)
+        self.assertEqual({"scale": 6.0, "units": "um"}, y_calibration_dict)
+        self.assertEqual(1, instrument.batch_get_count)
+        self.assertEqual(0, instrument.get_count)
+
+    def test_value_cache_is_opt_in(self):
+        instrument = BatchedTestInstrument({"C10": 1.0})
+        self.assertIsNone(instrument.value_cache)
+        instrument.TryGetValsCached(["C10"])
+        instrument.TryGetValsCached(["C10"])
+        self.assertEqual(2, instrument.batch_get_count)
+
+    def test_value_cache_reads_misses_in_one_batch_and_counts_hits(self):
+        instrument = BatchedTestInstrument({"C10": 1.0, "C12": 2.0})
+        value_cache = instrument.enable_value_cache(default_ttl=None)
+        self.assertEqual({"C10": 1.0, "C12": 2.0}, instrument.TryGetValsCached(["C10", "C12", "C30"]))
+        self.assertEqual({"C10": 1.0, "C12": 2.0}, instrument.TryGetValsCached(["C10", "C12", "C30"]))
+        self.assertEqual((False, None), instrument.TryGetValCached("C30"))
+        self.assertEqual(1, instrument.batch_get_count)
+        self.assertEqual(4, value_cache.hit_count)
+        self.assertEqual(3, value_cache.miss_count)
+        instrument.close()
+        self.assertIsNone(instrument.value_cache)
+
+    def test_value_cache_respects_per_control_ttl(self):
+        instrument = BatchedTestInstrument({"C10": 1.0, "counts_per_electron": 40.0})
+        instrument.enable_value_cache(default_ttl=0, ttls={"counts_per_electron": None})
+        instrument.TryGetValsCached(["C10", "counts_per_electron"])
+        instrument.values.update({"C10": 2.0, "counts_per_electron": 50.0})
+        self.assertEqual({"C10": 2.0, "counts_per_electron": 40.0}, instrument.TryGetValsCached(["C10", "counts_per_electron"]))
+
+    def test_value_cache_is_invalidated_by_setters_and_property_changes(self):
+        instrument = BatchedTestInstrument({"C10": 1.0, "C12": 2.0})
+        value_cache = instrument.enable_value_cache(default_ttl=None)
+        instrument.TryGetValsCached(["C10", "C12"])
+        instrument.SetVal("C10", 3.0)
+        self.assertEqual({"C10": 3.0, "C12": 2.0}, instrument.TryGetValsCached(["C10", "C12"]))
+        instrument.SetValsAndConfirm({"C12": 4.0}, 1.0, 1000)
+        self.assertEqual({"C10": 3.0, "C12": 4.0}, instrument.TryGetValsCached(["C10", "C12"]))
+        instrument.values["C10"] = 5.0
+        instrument.notify_property_changed("C10")
+        self.assertEqual({"C10": 5.0, "C12": 4.0}, instrument.TryGetValsCached(["C10", "C12"]))
+        self.assertLessEqual(3, value_cache.statistics["invalidations"])
+
+    def test_value_cache_does_not_keep_value_read_during_invalidation(self):
+        reading = threading.Event()
+        value_set = threading.Event()
+        values = {"C10": 1.0}
+
+        def try_get_vals(names):
+            result = {name: values[name] for name in names if name in values}
+            if not reading.is_set():
+                # the first read is slow; the value is changed and invalidated before it returns.
+                reading.set()
+                value_set.wait(5.0)
+            return result
+
+        value_cache = stem_controller.ControlValueCache(try_get_vals, default_ttl=None)
+        thread = threading.Thread(target=value_cache.get_values, args=(["C10"],))
+        thread.start()
+        self.assertTrue(reading.wait(5.0))
+        values["C10"] = 2.0
+        value_cache.invalidate("C10")
+        value_set.set()
+        thread.join()
+        self.assertEqual({"C10": 2.0}, value_cache.get_values(["C10"]))
+        self.assertEqual({"C10": 2.0}, value_cache.get_values(["C10"]))
+        self.assertEqual(1, value_cache.hit_count)
+
+    def test_calibration_values_are_read_through_value_cache(self):
+        instrument = BatchedTestInstrument({"counts_per_electron": 40.0})
+        instrument.enable_value_cache(default_ttl=None)
+        calibration_controls = {"counts_per_electron_control": "counts_per_electron"}
+        for i in range(3):
+            data_element = {"properties": dict(), "calibration_controls": calibration_controls}
+            camera_base.update_intensity_calibration(data_element, instrument, None)
+            self.assertEqual(40.0, data_element["properties"]["counts_per_electron"])
+        self.assertEqual(1, instrument.batch_get_count)
+
+    def test_scan_context_display_item_list_model_tracks_scan_context_changes(self):
+        document_model = DocumentModel.DocumentModel()
+        instrument = TestInstrument(dict())
+        instrument.subscan_state = stem_controller.SubscanState.DISABLED
+        try:
+            data_items = [DataItem.DataItem(numpy.zeros((4, 4))) for i in range(5)]
+            for data_item in data_items:
+                document_model.append_data_item(data_item)
+            display_items = [document_model.get_display_item_for_data_item(data_item) for data_item in data_items]
+            list_model = stem_controller.ScanContextDisplayItemListModel(document_model, instrument)
+            inserted = list()
+            removed = list()
+            item_inserted_listener = list_model.item_inserted_event.listen(lambda key, value, index: inserted.append((value, index)))
+            item_removed_listener = list_model.item_removed_event.listen(lambda key, value, index: removed.append((value, index)))
+            instrument._data_item_states_changed([{"data_item": data_items[3]}, {"data_item": data_items[1]}])
+            self.assertEqual([display_items[1], display_items[3]], list(list_model.display_items))
+            instrument._data_item_states_changed([{"data_item": data_items[3]}, {"data_item": data_items[4]}])
+            self.assertEqual([display_items[3], display_items[4]], list(list_model.display_items))
+            self.assertEqual([(display_items[1], 0)], removed)
+            document_model.remove_data_item(data_items[3])
+            self.assertEqual([display_items[4]], list(list_model.display_items))
+            self.assertEqual((display_items[3], 0), removed[-1])
+            self.assertEqual([(display_items[1], 0), (display_items[3], 1), (display_items[4], 1)], inserted)
+            item_inserted_listener.close()
+            item_removed_listener.close()
+            list_model.close()
+        finally:
+            document_model.close()
+
+    def test_event_loop_monitor_coalesces_calls_with_same_key(self):
+
+        class DocumentModel:
+            about_to_close_event = Event.Event()
+
+        event_loop = asyncio.new_event_loop()
+        try:
+            monitor = stem_controller.EventLoopMonitor(DocumentModel(), event_loop)
+            calls = list()
+
+            def post_calls():
+                for i in range(10):
+                    monitor._call_soon_threadsafe_coalesced("a", calls.append, ("a", i))
+                monitor._call_soon_threadsafe_coalesced("b", calls.append, ("b", 0))
+
+            thread = threading.Thread(target=post_calls)
+            thread.start()
+            thread.join()
+            event_loop.run_until_complete(asyncio.sleep(0))
+            self.assertEqual([("a", 9), ("b", 0)], calls)
+            # a call after the pending call has run is scheduled again
+            monitor._call_soon_threadsafe_coalesced("a", calls.append, ("a", 10))
+            event_loop.run_until_complete(asyncio.sleep(0))
+            self.assertEqual(("a", 10), calls[-1])
+            monitor._mark_closed()
+        finally:
+            event_loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,11 @@
 import contextlib
 import copy
+import math
 import threading
 import time
 import typing
 import unittest
+import unittest.mock
 import uuid
 
 import numpy
@@ -23,6 +25,7 @@ from nion.utils import Geometry
 from nion.utils import Registry
 from nion.instrumentation import stem_controller
 from nion.instrumentation import scan_base
+from nion.instrumentation import telemetry
 from nionswift_plugin.nion_instrumentation_ui import ScanControlPanel
 
 """
@@ -1226,6 +1229,128 @@ class TestScanControlClass(unittest.TestCase):
             self.assertAlmostEqual(document_model.data_items[0].dimensional_calibrations[0].scale, xdata.dimensional_calibrations[1].scale * 2)
             self.assertEqual(document_model.data_items[0].dimensional_calibrations[0].units, xdata.dimensional_calibrations[1].units)
 
+    def test_record_subscans_records_each_region_with_proper_calibrations(self):
+        with self._make_scan_context() as scan_context:
+            document_controller, document_model, hardware_source, scan_state_controller = scan_context.objects
+            frame_parameters = copy.copy(hardware_source.get_current_frame_parameters())
+            frame_parameters.size = 256, 256
+            frame_parameters.pixel_time_us = 0.1
+            subscan_regions = [scan_base.SubscanRegion(Geometry.FloatRect.from_tlhw(0.1, 0.1, 0.25, 0.25)),
+                               scan_base.SubscanRegion(Geometry.FloatRect.from_tlhw(0.5, 0.4, 0.25, 0.5), math.radians(30), Geometry.IntSize(h=128, w=256))]
+            published = list()
+            def xdatas_available(xdatas):
+                published.append(([xdata.data_shape for xdata in xdatas], hardware_source.is_recording))
+            with contextlib.closing(hardware_source.xdatas_available_event.listen(xdatas_available)):
+                xdatas_list = hardware_source.record_subscans(frame_parameters, subscan_regions, [0])
+            self.assertEqual([([(64, 64)], True), ([(128, 256)], True)], published)
+            self.assertEqual(2, len(xdatas_list))
+            self.assertEqual((64, 64), xdatas_list[0][0].data_shape)
+            self.assertEqual((128, 256), xdatas_list[1][0].data_shape)
+            self.assertEqual("a_roi0", xdatas_list[0][0].metadata["hardware_source"]["channel_id"])
+            self.assertEqual("a_roi1", xdatas_list[1][0].metadata["hardware_source"]["channel_id"])
+            context_scale = frame_parameters.fov_nm / 256
+            self.assertAlmostEqual(context_scale, xdatas_list[0][0].dimensional_calibrations[1].scale)
+            self.assertAlmostEqual(context_scale / 2, xdatas_list[1][0].dimensional_calibrations[1].scale)
+            self.assertAlmostEqual(math.radians(30), xdatas_list[1][0].metadata["hardware_source"]["subscan_rotation"])
+            self.assertFalse(hardware_source.is_playing)
+
+    def test_record_subscans_abort_stops_recording_and_returns_no_data(self):
+        with self._make_scan_context() as scan_context:
+            document_controller, document_model, hardware_source, scan_state_controller = scan_context.objects
+            frame_parameters = copy.copy(hardware_source.get_current_frame_parameters())
+            frame_parameters.size = 256, 256
+            frame_parameters.pixel_time_us = 100
+            subscan_regions = [scan_base.SubscanRegion(Geometry.FloatRect.from_tlhw(0.1, 0.1, 0.5, 0.5))]
+            xdatas_list = [None]
+            def record_subscans():
+                xdatas_list[0] = hardware_source.record_subscans(frame_parameters, subscan_regions, [0])
+            thread = threading.Thread(target=record_subscans)
+            thread.start()
+            start = time.time()
+            while not hardware_source.is_recording:
+                time.sleep(0.01)
+                self.assertLess(time.time() - start, 3.0)
+            hardware_source.record_subscans_abort()
+            thread.join(3.0)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(list(), xdatas_list[0])
+            self.assertFalse(hardware_source.is_recording)
+
+    def test_recording_records_scan_telemetry(self):
+        with self._make_scan_context() as scan_context:
+            document_controller, document_model, hardware_source, scan_state_controller = scan_context.objects
+            frame_parameters = copy.copy(hardware_source.get_current_frame_parameters())
+            frame_parameters.size = 64, 64
+            read_partial_count = telemetry.registry.histogram("scan.read_partial").count
+            frame_count = telemetry.registry.counter("scan.frames").value
+            hardware_source.record_immediate(frame_parameters, [0])
+            self.assertLess(read_partial_count, telemetry.registry.histogram("scan.read_partial").count)
+            self.assertEqual(frame_count + 1, telemetry.registry.counter("scan.frames").value)
+
+    def test_drift_tracking_logs_offsets_of_live_frames(self):
+        with self._make_scan_context() as scan_context:
+            document_controller, document_model, hardware_source, scan_state_controller = scan_context.objects
+            frame_parameters = hardware_source.get_frame_parameters(0)
+            frame_parameters.size = 256, 256
+            frame_parameters.pixel_time_us = 1
+            hardware_source.set_frame_parameters(0, frame_parameters)
+            hardware_source.drift_channel_id = hardware_source.get_channel_state(0).channel_id
+            hardware_source.drift_region = Geometry.FloatRect.from_tlhw(0.25, 0.25, 0.5, 0.5)
+            hardware_source.drift_tracking_enabled = True
+            drift_offsets = list()
+            with contextlib.closing(hardware_source.drift_log_changed_event.listen(drift_offsets.append)):
+                hardware_source.start_playing(sync_timeout=3.0)
+                try:
+                    for i in range(10):
+                        hardware_source.get_next_xdatas_to_finish()
+                finally:
+                    hardware_source.stop_playing(sync_timeout=3.0)
+            self.assertLess(0, hardware_source.drift_log.count)
+            self.assertEqual(len(drift_offsets), hardware_source.drift_log.count)
+            # only the new entry is sent with each change.
+            self.assertEqual(drift_offsets[-1].height, hardware_source.drift_log.data[0, -1])
+            self.assertEqual(drift_offsets[-1].width, hardware_source.drift_log.data[1, -1])
+            # the scan does not drift, so the offsets are typically below a pixel (the simulated frames are noisy).
+            self.assertLess(numpy.median(hardware_source.drift_log.data[2]), 2 * frame_parameters.fov_nm / 256)
+
+    def test_drift_tracking_does_not_apply_corrections_below_the_threshold(self):
+        with self._make_scan_context() as scan_context:
+            document_controller, document_model, hardware_source, scan_state_controller = scan_context.objects
+            frame_parameters = hardware_source.get_frame_parameters(0)
+            frame_parameters.size = 256, 256
+            frame_parameters.pixel_time_us = 1
+            hardware_source.set_frame_parameters(0, frame_parameters)
+            hardware_source.drift_channel_id = hardware_source.get_channel_state(0).channel_id
+            hardware_source.drift_region = Geometry.FloatRect.from_tlhw(0.25, 0.25, 0.5, 0.5)
+            hardware_source.drift_tracking_enabled = True
+            with unittest.mock.patch.object(scan_base.ScanAcquisitionTask, "minimum_drift_correction", 1000.0):
+                hardware_source.start_playing(sync_timeout=3.0)
+                try:
+                    for i in range(5):
+                        hardware_source.get_next_xdatas_to_finish()
+                finally:
+                    hardware_source.stop_playing(sync_timeout=3.0)
+            self.assertLess(0, hardware_source.drift_log.count)
+            self.assertEqual(0.0, numpy.amax(hardware_source.drift_log.data[2]))
+
+    def test_drift_log_data_item_has_labeled_rows_and_is_updated_once_per_queued_update(self):
+        with self._make_scan_context() as scan_context:
+            document_controller, document_model, hardware_source, scan_state_controller = scan_context.objects
+            for i in range(3):
+                hardware_source._append_drift_offset(Geometry.FloatSize(h=i, w=2 * i))
+            document_controller.periodic()
+            data_item = next(data_item for data_item in document_model.data_items if data_item.title == "Drift Log")
+            display_item = document_model.get_display_item_for_data_item(data_item)
+            self.assertEqual(["y", "x", "m"], [display_layer["label"] for display_layer in display_item.display_layers])
+            self.assertEqual([0.0, 1.0, 2.0], list(data_item.xdata.data[0]))
+            self.assertEqual([0.0, 2.0, 4.0], list(data_item.xdata.data[1]))
+            with unittest.mock.patch.object(DataItem.DataItem, "set_data_and_metadata", autospec=True) as set_data_and_metadata:
+                for i in range(3):
+                    hardware_source._append_drift_offset(Geometry.FloatSize(h=i, w=2 * i))
+                document_controller.periodic()
+                self.assertEqual(1, set_data_and_metadata.call_count)
+                self.assertEqual((3, 6), set_data_and_metadata.call_args[0][1].data_shape)
+
     def test_get_buffer_data_basic_functionality(self):
         with self._make_scan_context() as scan_context:
             document_controller, document_model, hardware_source, scan_state_controller = scan_context.objects
@@ -0,0 +1,136 @@
+import datetime
+import pathlib
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+import numpy
+
+from nion.data import DataAndMetadata
+from nion.utils import Event
+from nion.instrumentation import stream_recorder
+
+
+class FakeHardwareSource:
+
+    def __init__(self):
+        self.xdatas_available_event = Event.Event()
+        self.frame_number = 0
+
+    def send_frame(self, skip: int = 0, shape=(3, 4)):
+        self.frame_number += 1 + skip
+        data = numpy.full(shape, self.frame_number, numpy.float32)
+        metadata = {"hardware_source": {"frame_number": self.frame_number}}
+        self.xdatas_available_event.fire([DataAndMetadata.new_data_and_metadata(data, metadata=metadata, timestamp=datetime.datetime.utcnow())])
+
+
+class TestStreamRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_stream_recorder_grows_beyond_initial_capacity_and_tracks_dropped_frames(self):
+        hardware_source = FakeHardwareSource()
+        recorder = stream_recorder.StreamRecorder(hardware_source, pathlib.Path(self.temp_dir.name), initial_capacity=2)
+        recorder.start()
+        try:
+            for i in range(5):
+                hardware_source.send_frame()
+            hardware_source.send_frame(skip=2)
+            recorder.stop()
+            self.assertEqual(6, recorder.recorded_count)
+            self.assertEqual(2, recorder.dropped_count)
+            xdata = recorder.get_xdatas()[0]
+            self.assertEqual((6, 3, 4), xdata.data_shape)
+            self.assertTrue(xdata.is_sequence)
+            self.assertEqual([1, 2, 3, 4, 5, 8], list(xdata.data[:, 0, 0]))
+            self.assertEqual(6, len(xdata.metadata["recording"]["timestamps"]))
+        finally:
+            recorder.close()
+
+    def test_stream_recorder_finishes_after_frame_count(self):
+        hardware_source = FakeHardwareSource()
+        recorder = stream_recorder.StreamRecorder(hardware_source, pathlib.Path(self.temp_dir.name), frame_count=3)
+        recorder.start()
+        try:
+            for i in range(5):
+                hardware_source.send_frame()
+            self.assertTrue(recorder.wait(5.0))
+            recorder.stop()
+            self.assertEqual((3, 3, 4), recorder.get_xdatas()[0].data_shape)
+        finally:
+            recorder.close()
+        self.assertEqual(list(), list(pathlib.Path(self.temp_dir.name).iterdir()))
+
+    def test_stream_recorder_stops_after_write_error_with_full_queue(self):
+        hardware_source = FakeHardwareSource()
+        recorder = stream_recorder.StreamRecorder(hardware_source, pathlib.Path(self.temp_dir.name), queue_size=2)
+        writing = threading.Event()
+        disk_full = threading.Event()
+
+        def open_memmap(*args, **kwargs):
+            writing.set()
+            disk_full.wait(5.0)
+            raise OSError("No space left on device")
+
+        with unittest.mock.patch.object(stream_recorder.numpy, "memmap", open_memmap):
+            recorder.start()
+            try:
+                hardware_source.send_frame()
+                self.assertTrue(writing.wait(5.0))
+                # fill the queue while the writer is busy with the first frame.
+                hardware_source.send_frame()
+                hardware_source.send_frame()
+                disk_full.set()
+                self.assertTrue(recorder.wait(5.0))
+                recorder.stop()
+                self.assertIsInstance(recorder.error, OSError)
+                self.assertEqual(0, recorder.recorded_count)
+            finally:
+                recorder.close()
+
+    def test_stream_recorder_caps_timestamps_and_keeps_summary(self):
+        hardware_source = FakeHardwareSource()
+        recorder = stream_recorder.StreamRecorder(hardware_source, pathlib.Path(self.temp_dir.name), max_timestamp_count=3)
+        recorder.start()
+        try:
+            for i in range(5):
+                hardware_source.send_frame()
+            recorder.stop()
+            self.assertEqual(5, recorder.recorded_count)
+            recording = recorder.get_xdatas()[0].metadata["recording"]
+            self.assertEqual(3, len(recording["timestamps"]))
+            self.assertEqual(recording["timestamps"][0], recording["first_timestamp"])
+            self.assertLessEqual(recording["timestamps"][-1], recording["last_timestamp"])
+            self.assertGreaterEqual(recording["max_frame_interval"], 0.0)
+        finally:
+            recorder.close()
+
+    def test_stream_recorder_stops_once_when_frame_shape_changes(self):
+        hardware_source = FakeHardwareSource()
+        recorder = stream_recorder.StreamRecorder(hardware_source, pathlib.Path(self.temp_dir.name))
+        recorder.start()
+        try:
+            with unittest.mock.patch.object(stream_recorder.logging, "error") as error_mock:
+                hardware_source.send_frame()
+                hardware_source.send_frame()
+                hardware_source.send_frame(shape=(5, 6))
+                self.assertTrue(recorder.wait(5.0))
+                hardware_source.send_frame(shape=(5, 6))
+                hardware_source.send_frame(shape=(5, 6))
+                recorder.stop()
+            self.assertEqual(1, error_mock.call_count)
+            self.assertIsInstance(recorder.error, ValueError)
+            self.assertEqual(2, recorder.recorded_count)
+            self.assertEqual(0, recorder.dropped_count)
+        finally:
+            recorder.close()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
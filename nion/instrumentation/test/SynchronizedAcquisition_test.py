@@ -1,10 +1,14 @@
 import collections
+import contextlib
 import copy
 import math
 import numpy
+import time
 import unittest
+import unittest.mock
 import uuid
 
+from nion.data import Calibration
 from nion.data import DataAndMetadata
 from nion.swift import Application
 from nion.swift import DocumentController
@@ -15,6 +19,7 @@ from nion.utils import Event
 from nion.utils import Geometry
 from nion.utils import Registry
 from nion.instrumentation import camera_base
+from nion.instrumentation import reduction
 from nion.instrumentation import stem_controller
 from nion.instrumentation import scan_base
 from nionswift_plugin.nion_instrumentation_ui import ScanAcquisition
@@ -192,6 +197,169 @@ class TestScanControlClass(unittest.TestCase):
             finally:
                 camera_data_channel.stop()
 
+    def test_camera_data_channel_is_not_affected_by_reuse_of_section_buffer(self):
+
+        class DocumentModel:
+            def __init__(self):
+                self.updates = list()
+
+            def append_data_item(self, data_item):
+                pass
+
+            def item_transaction(self, data_item):
+                return contextlib.closing(data_item)
+
+            def begin_data_item_live(self, data_item):
+                pass
+
+            def end_data_item_live(self, data_item):
+                pass
+
+            def update_data_item_partial(self, data_item, data_metadata, data_and_metadata, src_slice, dst_slice):
+                self.updates.append((numpy.copy(data_and_metadata.data[src_slice]), dst_slice, data_metadata.metadata))
+
+        scan_calibrations = (Calibration.Calibration(), Calibration.Calibration())
+        grab_sync_info = scan_base.ScanHardwareSource.GrabSynchronizedInfo(
+            Geometry.IntSize(h=4, w=3), Geometry.FloatRect.unit_rect(), False, (8,), (8,), None, scan_calibrations,
+            (Calibration.Calibration(),), Calibration.Calibration(), dict(), dict())
+        # the rows of a section are copied once, when they become valid.
+        document_model = DocumentModel()
+        camera_data_channel = ScanAcquisition.CameraDataChannel(document_model, "test", grab_sync_info, display_update_rate_hz=0.01)
+        section_buffer = numpy.zeros((4, 3, 8), numpy.float32)
+        section_xdata = DataAndMetadata.new_data_and_metadata(section_buffer, data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1))
+        section_buffer[0:2] = 1
+        camera_data_channel.update(section_xdata, "partial", Geometry.IntSize(h=4, w=3), Geometry.IntRect.from_tlhw(0, 0, 2, 3), Geometry.IntRect.from_tlhw(0, 0, 2, 3), None)
+        section_buffer[:] = 2
+        camera_data_channel.update(section_xdata, "partial", Geometry.IntSize(h=4, w=3), Geometry.IntRect.from_tlhw(0, 0, 4, 3), Geometry.IntRect.from_tlhw(0, 0, 4, 3), None)
+        camera_data_channel.stop()
+        self.assertEqual(slice(0, 4), document_model.updates[-1][1][0])
+        self.assertTrue(numpy.all(document_model.updates[-1][0][0:2] == 1))
+        self.assertTrue(numpy.all(document_model.updates[-1][0][2:4] == 2))
+        # the rows of a section are converted to the storage format once, so clipped values are counted once.
+        document_model = DocumentModel()
+        camera_data_channel = ScanAcquisition.CameraDataChannel(document_model, "test", grab_sync_info, display_update_rate_hz=0.01,
+                                                                storage_format=reduction.StorageFormat(dtype=numpy.uint16))
+        section_buffer = numpy.ones((4, 3, 8), numpy.float32)
+        section_buffer[0, 0, 0] = 70000
+        section_xdata = DataAndMetadata.new_data_and_metadata(section_buffer, data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1))
+        camera_data_channel.update(section_xdata, "partial", Geometry.IntSize(h=4, w=3), Geometry.IntRect.from_tlhw(0, 0, 2, 3), Geometry.IntRect.from_tlhw(0, 0, 2, 3), None)
+        camera_data_channel.update(section_xdata, "partial", Geometry.IntSize(h=4, w=3), Geometry.IntRect.from_tlhw(0, 0, 4, 3), Geometry.IntRect.from_tlhw(0, 0, 4, 3), None)
+        with self.assertLogs(level="WARNING"):
+            camera_data_channel.stop()
+        self.assertEqual(1, camera_data_channel.clipped_count)
+        self.assertEqual(numpy.uint16, document_model.updates[-1][0].dtype)
+        self.assertEqual(1, document_model.updates[-1][2]["storage_format"]["clipped_count"])
+        # a float32 storage format converts without copying; a uint16 storage format clips the last value.
+        for storage_format in (None, reduction.StorageFormat(dtype=numpy.float32), reduction.StorageFormat(dtype=numpy.uint16)):
+            with self.subTest(storage_format=storage_format.dtype if storage_format else None):
+                document_model = DocumentModel()
+                # a slow display rate defers the updates until the flush at stop.
+                camera_data_channel = ScanAcquisition.CameraDataChannel(document_model, "test", grab_sync_info, display_update_rate_hz=0.01,
+                                                                        storage_format=storage_format)
+                section_buffer = numpy.ones((2, 3, 8), numpy.float32)
+                section_xdata = DataAndMetadata.new_data_and_metadata(section_buffer, data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1))
+                camera_data_channel.update(section_xdata, "partial", Geometry.IntSize(h=4, w=3), Geometry.IntRect.from_tlhw(0, 0, 2, 3), Geometry.IntRect.from_tlhw(0, 0, 2, 3), None)
+                section_buffer[:] = 2  # the camera reuses the buffer for the next section
+                section_buffer[-1, -1, -1] = 70000
+                camera_data_channel.update(section_xdata, "partial", Geometry.IntSize(h=4, w=3), Geometry.IntRect.from_tlhw(2, 0, 2, 3), Geometry.IntRect.from_tlhw(0, 0, 2, 3), None)
+                section_buffer[:] = 3
+                with self.assertLogs(level="WARNING") if storage_format and storage_format.dtype == numpy.uint16 else contextlib.nullcontext():
+                    camera_data_channel.stop()
+                updates = {dst_slice[0].start: (data, metadata) for data, dst_slice, metadata in document_model.updates}
+                self.assertTrue(numpy.all(updates[0][0] == 1))
+                self.assertTrue(numpy.all(updates[2][0][:-1] == 2))
+                if storage_format:
+                    clipped_count = 1 if storage_format.dtype == numpy.uint16 else 0
+                    self.assertEqual(clipped_count, camera_data_channel.clipped_count)
+                    self.assertEqual(clipped_count, updates[2][1]["storage_format"]["clipped_count"])
+
+    def test_grab_synchronized_with_reduction_stage_produces_virtual_images(self):
+        with self._make_acquisition_context(is_eels=False) as context:
+            document_controller, document_model, scan_hardware_source, camera_hardware_source = context.objects
+            scan_frame_parameters = scan_hardware_source.get_current_frame_parameters()
+            scan_frame_parameters["scan_id"] = str(uuid.uuid4())
+            scan_frame_parameters["size"] = (4, 4)
+            camera_frame_parameters = camera_hardware_source.get_current_frame_parameters()
+            grab_sync_info = scan_hardware_source.grab_synchronized_get_info(
+                scan_frame_parameters=scan_frame_parameters,
+                camera=camera_hardware_source,
+                camera_frame_parameters=camera_frame_parameters)
+            datum_shape = tuple(grab_sync_info.camera_readout_size_squeezed)
+            center = datum_shape[0] / 2, datum_shape[1] / 2
+            reducer = reduction.VirtualDetectorReducer({"bf": reduction.make_disk_mask(datum_shape, center, datum_shape[0] / 8)})
+            reduction_stage = reduction.ReductionStage([reducer])
+            try:
+                scans, camera_data = scan_hardware_source.grab_synchronized(scan_frame_parameters=scan_frame_parameters,
+                                                                            camera=camera_hardware_source,
+                                                                            camera_frame_parameters=camera_frame_parameters,
+                                                                            reduction_stage=reduction_stage,
+                                                                            keep_camera_data=False)
+            finally:
+                reduction_stage.close()
+            self.assertEqual(0, len(camera_data))
+            virtual_image = reducer.get_xdatas()[0]
+            self.assertEqual(scans[0].data_shape, virtual_image.data_shape)
+            self.assertTrue(numpy.all(virtual_image.data > 0))
+
+    def test_grab_synchronized_with_two_cameras_acquires_both_during_one_scan(self):
+        with self._make_acquisition_context() as context:
+            document_controller, document_model, scan_hardware_source, eels_camera_hardware_source = context.objects
+            ronchigram_camera_hardware_source = self._setup_camera_hardware_source(context.instrument, False)
+            try:
+                scan_frame_parameters = scan_hardware_source.get_current_frame_parameters()
+                scan_frame_parameters["scan_id"] = str(uuid.uuid4())
+                scan_frame_parameters["size"] = (4, 4)
+                eels_camera_frame_parameters = eels_camera_hardware_source.get_current_frame_parameters()
+                eels_camera_frame_parameters["processing"] = "sum_project"
+                ronchigram_camera_frame_parameters = ronchigram_camera_hardware_source.get_current_frame_parameters()
+                cameras = [scan_base.SynchronizedCamera(eels_camera_hardware_source, eels_camera_frame_parameters),
+                           scan_base.SynchronizedCamera(ronchigram_camera_hardware_source, ronchigram_camera_frame_parameters)]
+                scans, camera_data = scan_hardware_source.grab_synchronized(scan_frame_parameters=scan_frame_parameters, cameras=cameras)
+                self.assertEqual(2, len(camera_data))
+                self.assertEqual(DataAndMetadata.DataDescriptor(False, 2, 1), camera_data[0].data_descriptor)
+                self.assertEqual(DataAndMetadata.DataDescriptor(False, 2, 2), camera_data[1].data_descriptor)
+                for xdata in camera_data:
+                    self.assertEqual(scans[0].data_shape, xdata.data_shape[:2])
+                    self.assertEqual(tuple(scans[0].dimensional_calibrations), tuple(xdata.dimensional_calibrations[:2]))
+                    self.assertEqual(scan_frame_parameters["scan_id"], xdata.metadata["scan_detector"]["scan_id"])
+            finally:
+                ronchigram_camera_hardware_source.close()
+
+    def test_grab_synchronized_with_two_cameras_cancels_other_camera_when_one_aborts(self):
+        with self._make_acquisition_context() as context:
+            document_controller, document_model, scan_hardware_source, eels_camera_hardware_source = context.objects
+            ronchigram_camera_hardware_source = self._setup_camera_hardware_source(context.instrument, False)
+            try:
+                scan_frame_parameters = scan_hardware_source.get_current_frame_parameters()
+                scan_frame_parameters["size"] = (8, 8)
+                eels_camera_frame_parameters = eels_camera_hardware_source.get_current_frame_parameters()
+                eels_camera_frame_parameters["processing"] = "sum_project"
+                ronchigram_camera_frame_parameters = ronchigram_camera_hardware_source.get_current_frame_parameters()
+                cameras = [scan_base.SynchronizedCamera(eels_camera_hardware_source, eels_camera_frame_parameters),
+                           scan_base.SynchronizedCamera(ronchigram_camera_hardware_source, ronchigram_camera_frame_parameters)]
+
+                def acquire_canceled(camera_frame_parameters, scan_shape):
+                    time.sleep(0.05)
+                    return camera_base.CameraHardwareSource.PartialData(None, False, True, 0)
+
+                def acquire_failed(camera_frame_parameters, scan_shape):
+                    time.sleep(0.05)
+                    raise RuntimeError("camera failed")
+
+                for acquire_synchronized_begin in (acquire_canceled, acquire_failed):
+                    with self.subTest(acquire_synchronized_begin=acquire_synchronized_begin.__name__):
+                        scan_frame_parameters["scan_id"] = str(uuid.uuid4())
+                        with unittest.mock.patch.object(ronchigram_camera_hardware_source, "acquire_synchronized_begin", acquire_synchronized_begin), \
+                                unittest.mock.patch.object(eels_camera_hardware_source, "acquire_sequence_cancel", wraps=eels_camera_hardware_source.acquire_sequence_cancel) as acquire_sequence_cancel:
+                            if acquire_synchronized_begin == acquire_failed:
+                                with self.assertRaises(RuntimeError):
+                                    scan_hardware_source.grab_synchronized(scan_frame_parameters=scan_frame_parameters, cameras=cameras)
+                            else:
+                                self.assertIsNone(scan_hardware_source.grab_synchronized(scan_frame_parameters=scan_frame_parameters, cameras=cameras))
+                            self.assertEqual(1, acquire_sequence_cancel.call_count)
+            finally:
+                ronchigram_camera_hardware_source.close()
+
     def test_grab_sync_info_has_proper_calibrations(self):
         with self._make_acquisition_context() as context:
             document_controller, document_model, scan_hardware_source, camera_hardware_source = context.objects
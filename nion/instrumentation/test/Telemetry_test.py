@@ -0,0 +1,61 @@
+import contextlib
+import csv
+import io
+import json
+import pathlib
+import tempfile
+import unittest
+
+from nion.instrumentation import telemetry
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_histogram_summarizes_values_in_buckets(self):
+        histogram = telemetry.Histogram("h", (1, 10))
+        for value in (0.5, 1, 2, 20):
+            histogram.record(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual([2, 1, 1], snapshot["buckets"])
+        self.assertEqual((4, 23.5, 0.5, 20), (snapshot["count"], snapshot["total"], snapshot["min"], snapshot["max"]))
+        self.assertAlmostEqual(23.5 / 4, snapshot["mean"])
+
+    def test_spans_and_counters_are_recorded_and_fire_events(self):
+        registry = telemetry.MetricsRegistry()
+        recorded = list()
+        with contextlib.closing(registry.metric_recorded_event.listen(lambda *args: recorded.append(args))):
+            for i in range(3):
+                with registry.span("scan.read_partial") as span:
+                    pass
+                registry.increment("scan.frames")
+        self.assertLessEqual(0, span.duration)
+        self.assertEqual(3, registry.histogram("scan.read_partial").count)
+        self.assertEqual(3, registry.counter("scan.frames").value)
+        self.assertEqual([("scan.read_partial", "histogram"), ("scan.frames", "counter")] * 3, [args[:2] for args in recorded])
+        registry.enabled = False
+        registry.increment("scan.frames")
+        self.assertEqual(3, registry.counter("scan.frames").value)
+        self.assertEqual(6, len(recorded))
+
+    def test_snapshot_exports_as_json_and_csv(self):
+        registry = telemetry.MetricsRegistry()
+        registry.increment("camera.frames", 2)
+        registry.record("camera.acquire_image", 0.25)
+        snapshots = list()
+        with contextlib.closing(registry.snapshot_event.listen(snapshots.append)):
+            registry.publish()
+        self.assertEqual({"value": 2}, snapshots[0]["counters"]["camera.frames"])
+        self.assertEqual(0.25, json.loads(registry.to_json())["histograms"]["camera.acquire_image"]["total"])
+        rows = list(csv.DictReader(io.StringIO(registry.to_csv())))
+        self.assertEqual([("counter", "camera.frames", "2"), ("histogram", "camera.acquire_image", "1")], [(row["kind"], row["name"], row["count"]) for row in rows])
+        with tempfile.TemporaryDirectory() as directory:
+            registry.save(pathlib.Path(directory) / "telemetry.csv")
+            registry.save(pathlib.Path(directory) / "telemetry.json")
+            self.assertEqual(registry.to_csv(), (pathlib.Path(directory) / "telemetry.csv").read_text())
+            self.assertIn("camera.frames", json.loads((pathlib.Path(directory) / "telemetry.json").read_text())["counters"])
+        registry.reset()
+        self.assertEqual({"counters": dict(), "histograms": dict()}, {k: v for k, v in registry.snapshot().items() if k != "timestamp"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+
+from nion.instrumentation import update_coalescer
+
+
+class TestUpdateCoalescer(unittest.TestCase):
+
+    def test_merge_slices_returns_bounding_region(self):
+        merged = update_coalescer.merge_slices((slice(0, 4), slice(2, 8)), (slice(1, 6), slice(0, 3)))
+        self.assertEqual((slice(0, 6), slice(0, 8)), merged)
+        self.assertEqual((Ellipsis,), update_coalescer.merge_slices((Ellipsis,), (Ellipsis,)))
+        self.assertIsNone(update_coalescer.merge_slices((slice(0, 4),), (slice(0, 4), slice(0, 4))))
+
+    def test_updates_within_period_are_merged_into_one_flush(self):
+        flushed = list()
+        flushed_event = threading.Event()
+        def flush(payload):
+            flushed.append(payload)
+            if len(flushed) == 2:
+                flushed_event.set()
+        coalescer = update_coalescer.UpdateCoalescer(rate_hz=20.0)
+        try:
+            for i in range(10):
+                coalescer.mark_dirty("a", (slice(0, i + 1),), flush, update_coalescer.merge_slices)
+            self.assertTrue(flushed_event.wait(2.0))
+            time.sleep(0.2)
+            # the first update is flushed immediately, the other nine are merged into a single delayed flush
+            self.assertEqual([(slice(0, 1),), (slice(0, 10),)], flushed)
+            self.assertEqual(8, coalescer.coalesced_count)
+        finally:
+            coalescer.close()
+
+    def test_dispatch_function_receives_at_most_one_pending_flush_per_key(self):
+        dispatched = list()
+        flushed = list()
+        coalescer = update_coalescer.UpdateCoalescer(rate_hz=0.0, dispatch_fn=dispatched.append)
+        try:
+            for i in range(5):
+                coalescer.mark_dirty("a", i, flushed.append)
+                coalescer.mark_dirty("b", i, flushed.append)
+            self.assertEqual(2, len(dispatched))
+            for fn in dispatched:
+                fn()
+            self.assertEqual([4, 4], flushed)
+        finally:
+            coalescer.close()
+
+    def test_flush_sends_pending_update_without_waiting_for_period(self):
+        flushed = list()
+        coalescer = update_coalescer.UpdateCoalescer(rate_hz=0.1)
+        try:
+            coalescer.mark_dirty("a", 1, flushed.append)
+            coalescer.mark_dirty("a", 2, flushed.append)
+            self.assertEqual([1], flushed)
+            coalescer.flush()
+            self.assertEqual([1, 2], flushed)
+        finally:
+            coalescer.close()
+
+    def test_display_decimator_displays_newest_value_per_channel_and_counts_dropped(self):
+        dispatched = list()
+        displayed = list()
+        decimator = update_coalescer.DisplayDecimator(dispatched.append)
+        try:
+            for i in range(5):
+                decimator.submit("a", i, displayed.append)
+            decimator.submit("b", 0, displayed.append)
+            for fn in dispatched:
+                fn()
+            self.assertEqual([4, 0], displayed)
+            decimator.submit("a", 5, displayed.append)
+            dispatched[-1]()
+            self.assertEqual(5, displayed[-1])
+            self.assertEqual({"submitted": 6, "displayed": 2, "dropped": 4}, decimator.get_display_statistics("a"))
+            self.assertEqual({"submitted": 7, "displayed": 3, "dropped": 4}, decimator.get_display_statistics())
+        finally:
+            decimator.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import pathlib
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy
+
+from nion.instrumentation import video_base
+
+
+class TestVideoCamera(video_base.AbstractVideoCamera):
+
+    def __init__(self, frame_period: float = 0.0):
+        self.camera_id = "test_video"
+        self.camera_name = "Test Video"
+        self.frame_period = frame_period
+        self.value = 0
+        self.acquire_data_count = 0
+        self.acquire_data_into_count = 0
+        self.stopped_event = threading.Event()
+
+    def close(self):
+        pass
+
+    def start_acquisition(self):
+        self.stopped_event.clear()
+
+    def acquire_data(self):
+        time.sleep(self.frame_period)
+        self.value += 1
+        self.acquire_data_count += 1
+        return numpy.full((4, 6), self.value, numpy.uint16)
+
+    def acquire_data_into(self, buffer):
+        time.sleep(self.frame_period)
+        self.value += 1
+        self.acquire_data_into_count += 1
+        buffer[:] = self.value
+        return True
+
+    def stop_acquisition(self):
+        self.stopped_event.set()
+
+    def update_settings(self, settings):
+        pass
+
+
+class TestVideoBase(unittest.TestCase):
+
+    def test_frame_pool_reuses_buffers_once_released(self):
+        frame_pool = video_base.FramePool(max_count=2)
+        buffer1 = frame_pool.get_buffer((4, 6), numpy.uint16)
+        buffer2 = frame_pool.get_buffer((4, 6), numpy.uint16)
+        self.assertIsNot(buffer1, buffer2)
+        view = buffer1[1:]
+        self.assertIsNone(frame_pool.get_buffer((4, 6), numpy.uint16))
+        del buffer1
+        self.assertIsNone(frame_pool.get_buffer((4, 6), numpy.uint16))
+        del view
+        self.assertIsNotNone(frame_pool.get_buffer((4, 6), numpy.uint16))
+        self.assertEqual(2, frame_pool.allocation_count)
+        self.assertEqual((2, 2), frame_pool.get_buffer((2, 2), numpy.float32).shape)
+
+    def test_frame_pool_ignores_release_of_buffers_from_previous_format(self):
+        frame_pool = video_base.FramePool(max_count=1)
+        buffer = frame_pool.get_buffer((4, 6), numpy.uint16)
+        new_buffer = frame_pool.get_buffer((2, 2), numpy.float32)
+        del buffer
+        self.assertIsNone(frame_pool.get_buffer((2, 2), numpy.float32))
+        del new_buffer
+        self.assertEqual((2, 2), frame_pool.get_buffer((2, 2), numpy.float32).shape)
+        self.assertEqual(2, frame_pool.allocation_count)
+
+    def test_capture_thread_acquires_into_pool_and_latest_frame_wins(self):
+        camera = TestVideoCamera(frame_period=0.002)
+        capture_thread = video_base.VideoCaptureThread(camera)
+        camera.start_acquisition()
+        capture_thread.start()
+        try:
+            frame = capture_thread.get_next_frame(5.0)
+            time.sleep(0.1)
+            next_frame = capture_thread.get_next_frame(5.0)
+            self.assertGreater(next_frame.frame_number, frame.frame_number + 1)
+            self.assertTrue(numpy.all(next_frame.data == next_frame.data[0, 0]))
+            self.assertGreater(capture_thread.skipped_count, 0)
+        finally:
+            capture_thread.stop()
+            camera.stop_acquisition()
+            capture_thread.join()
+        self.assertEqual(1, camera.acquire_data_count)
+        self.assertGreater(camera.acquire_data_into_count, 0)
+        self.assertLessEqual(capture_thread.frame_pool.allocation_count, capture_thread.frame_pool.max_count)
+
+    def test_capture_thread_limits_frame_rate(self):
+        camera = TestVideoCamera()
+        capture_thread = video_base.VideoCaptureThread(camera, max_frame_rate=20)
+        capture_thread.start()
+        time.sleep(0.25)
+        capture_thread.stop()
+        capture_thread.join()
+        self.assertLessEqual(capture_thread.captured_count, 7)
+
+    def test_frame_ring_buffer_keeps_latest_frames_within_budget(self):
+        frame = numpy.zeros((4, 6), numpy.uint16)
+        ring_buffer = video_base.FrameRingBuffer(frame.nbytes * 3)
+        for i in range(5):
+            ring_buffer.append(frame + i, i, float(i))
+        self.assertEqual(3, ring_buffer.capacity)
+        self.assertEqual(3, ring_buffer.count)
+        self.assertEqual([3, 4], [frame.frame_number for frame in ring_buffer.get_frames(-2, 2)])
+        self.assertEqual([2, 3], [int(frame.data[0, 0]) for frame in ring_buffer.get_frames(-3, 2)])
+        self.assertIsNone(ring_buffer.get_frames(-4, 1))
+
+    def test_video_hardware_source_grab_buffer_and_sequence(self):
+        hardware_source = video_base.VideoHardwareSource(TestVideoCamera(frame_period=0.005))
+        self.assertEqual(0, hardware_source.buffer_memory_budget)
+        hardware_source.buffer_memory_budget = 1024 * 1024
+        try:
+            xdatas = hardware_source.grab_sequence(4, timeout=5.0)
+            self.assertEqual((4, 4, 6), xdatas[0].data_shape)
+            self.assertTrue(xdatas[0].is_sequence)
+            frame_numbers = xdatas[0].metadata["sequence"]["frame_numbers"]
+            self.assertEqual(4, len(xdatas[0].metadata["sequence"]["timestamps"]))
+            self.assertEqual(sorted(frame_numbers), frame_numbers)
+            frames = hardware_source.grab_buffer(2)
+            self.assertEqual(2, len(frames))
+            self.assertEqual((4, 6), frames[-1][0].data_shape)
+            self.assertLess(frames[0][0].metadata["hardware_source"]["frame_number"], frames[1][0].metadata["hardware_source"]["frame_number"])
+        finally:
+            hardware_source.abort_playing()
+            hardware_source.close()
+
+    def test_video_hardware_source_grab_sequence_restores_playing_state(self):
+        hardware_source = video_base.VideoHardwareSource(TestVideoCamera(frame_period=0.005))
+        try:
+            self.assertIsNotNone(hardware_source.grab_sequence(2, timeout=5.0))
+            start_time = time.perf_counter()
+            while hardware_source.is_playing and time.perf_counter() - start_time < 5.0:
+                time.sleep(0.01)
+            self.assertFalse(hardware_source.is_playing)
+            hardware_source.start_playing(sync_timeout=5.0)
+            self.assertIsNotNone(hardware_source.grab_sequence(2, timeout=5.0))
+            self.assertTrue(hardware_source.is_playing)
+        finally:
+            hardware_source.abort_playing()
+            hardware_source.close()
+
+    def test_video_hardware_source_records_stream_to_disk(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            hardware_source = video_base.VideoHardwareSource(TestVideoCamera(frame_period=0.005))
+            try:
+                recorder = hardware_source.start_stream_recording(pathlib.Path(temp_dir), frame_count=5)
+                self.assertTrue(recorder.wait(5.0))
+                recorder.stop()
+                xdata = recorder.get_xdatas()[0]
+                self.assertEqual((5, 4, 6), xdata.data_shape)
+                self.assertEqual(5, len(xdata.metadata["recording"]["timestamps"]))
+                recorder.close()
+            finally:
+                hardware_source.abort_playing()
+                hardware_source.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+# standard libraries
+import functools
+import threading
+import time
+import typing
+
+# third party libraries
+# None
+
+# local libraries
+# None
+
+
+def merge_slices(slices_a: typing.Optional[typing.Sequence[slice]], slices_b: typing.Optional[typing.Sequence[slice]]) -> typing.Optional[typing.Tuple[slice, ...]]:
+    """Return the bounding slices of two dirty regions.
+
+    A region of None means the entire item is dirty. Regions with different ranks cannot be merged and are treated as the
+    entire item.
+    """
+    if slices_a is None or slices_b is None or len(slices_a) != len(slices_b):
+        return None
+    merged = list()
+    for slice_a, slice_b in zip(slices_a, slices_b):
+        if slice_a is Ellipsis or slice_b is Ellipsis:
+            if slice_a is not slice_b:
+                return None
+            merged.append(Ellipsis)
+        elif slice_a.start is None or slice_b.start is None or slice_a.stop is None or slice_b.stop is None:
+            merged.append(slice(None))
+        else:
+            merged.append(slice(min(slice_a.start, slice_b.start), max(slice_a.stop, slice_b.stop)))
+    return tuple(merged)
+
+
+class UpdateCoalescer:
+    """Coalesce display updates per key and flush them at a limited rate.
+
+    Producers call mark_dirty with a key (typically one per data item), a payload describing the dirty region and a
+    flush function. Payloads for the same key are merged until the flush runs, and at most one flush per key is ever
+    pending. Flushes are passed to dispatch_fn, which may queue them to the UI thread; by default they run directly on
+    the calling (or timer) thread.
+    """
+
+    def __init__(self, rate_hz: float = 10.0, dispatch_fn: typing.Optional[typing.Callable[[typing.Callable[[], None]], None]] = None):
+        self.__period = 1.0 / rate_hz if rate_hz and rate_hz > 0 else 0.0
+        self.__dispatch_fn = dispatch_fn if dispatch_fn else lambda fn: fn()
+        self.__lock = threading.RLock()
+        self.__pending = dict()  # key -> [payload, flush_fn]
+        self.__scheduled_keys = set()  # keys with a flush waiting on a timer or dispatched
+        self.__timers = dict()
+        self.__last_flush_times = dict()
+        self.__key_counts = dict()  # key -> [marked, coalesced, flushed]
+        self.__closed = False
+        self.flush_count = 0
+        self.coalesced_count = 0
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__closed = True
+            for timer in self.__timers.values():
+                timer.cancel()
+            self.__timers = dict()
+            self.__pending = dict()
+            self.__scheduled_keys = set()
+
+    @property
+    def rate_hz(self) -> float:
+        return 1.0 / self.__period if self.__period > 0 else 0.0
+
+    @rate_hz.setter
+    def rate_hz(self, value: float) -> None:
+        self.__period = 1.0 / value if value and value > 0 else 0.0
+
+    def get_statistics(self, key=None) -> typing.Dict[str, int]:
+        """Return the marked, coalesced and flushed counts for key, or the totals over all keys if key is None."""
+        with self.__lock:
+            key_counts_list = [self.__key_counts.get(key, [0, 0, 0])] if key is not None else list(self.__key_counts.values())
+            return {name: sum(key_counts[i] for key_counts in key_counts_list) for i, name in enumerate(("marked", "coalesced", "flushed"))}
+
+    def mark_dirty(self, key, payload, flush_fn: typing.Callable[[typing.Any], None], merge_fn: typing.Optional[typing.Callable[[typing.Any, typing.Any], typing.Any]] = None) -> None:
+        """Mark the region described by payload as dirty and schedule a flush if none is pending for key.
+
+        If merge_fn is None, a newer payload replaces the pending one. The most recent flush_fn is used.
+        """
+        with self.__lock:
+            if self.__closed:
+                return
+            key_counts = self.__key_counts.setdefault(key, [0, 0, 0])
+            key_counts[0] += 1
+            entry = self.__pending.get(key)
+            if entry is not None:
+                entry[0] = merge_fn(entry[0], payload) if merge_fn else payload
+                entry[1] = flush_fn
+                self.coalesced_count += 1
+                key_counts[1] += 1
+            else:
+                self.__pending[key] = [payload, flush_fn]
+            if key in self.__scheduled_keys:
+                return
+            self.__scheduled_keys.add(key)
+            delay = self.__last_flush_times.get(key, 0.0) + self.__period - time.perf_counter()
+            if delay > 0:
+                timer = threading.Timer(delay, self.__dispatch, args=(key,))
+                timer.daemon = True
+                self.__timers[key] = timer
+                timer.start()
+                return
+        self.__dispatch(key)
+
+    def flush(self, key=None) -> None:
+        """Dispatch pending updates now, ignoring the rate limit. Flush all keys if key is None."""
+        with self.__lock:
+            keys = [key] if key is not None else list(self.__pending.keys())
+            dispatch_keys = list()
+            for key_ in keys:
+                timer = self.__timers.pop(key_, None)
+                if timer:
+                    timer.cancel()
+                if key_ in self.__pending:
+                    self.__scheduled_keys.add(key_)
+                    dispatch_keys.append(key_)
+        for key_ in dispatch_keys:
+            self.__dispatch(key_)
+
+    def __dispatch(self, key) -> None:
+        with self.__lock:
+            self.__timers.pop(key, None)
+            if self.__closed:
+                return
+        self.__dispatch_fn(functools.partial(self.__flush_key, key))
+
+    def __flush_key(self, key) -> None:
+        with self.__lock:
+            entry = self.__pending.pop(key, None)
+            self.__scheduled_keys.discard(key)
+            self.__last_flush_times[key] = time.perf_counter()
+            if entry is not None:
+                self.flush_count += 1
+                self.__key_counts.setdefault(key, [0, 0, 0])[2] += 1
+        if entry is not None:
+            payload, flush_fn = entry
+            flush_fn(payload)
+
+
+class DisplayDecimator(UpdateCoalescer):
+    """Deliver only the newest display update per channel, dropping intermediate ones.
+
+    Producers, typically acquisition threads, call submit for each frame. At most one delivery per channel is pending on
+    dispatch_fn (typically queue_task to the UI thread); a value submitted while a delivery is pending replaces the
+    pending value and the replaced value is counted as dropped. A rate_hz above zero additionally limits the delivery
+    rate per channel.
+    """
+
+    def __init__(self, dispatch_fn: typing.Optional[typing.Callable[[typing.Callable[[], None]], None]] = None, rate_hz: float = 0.0):
+        super().__init__(rate_hz=rate_hz, dispatch_fn=dispatch_fn)
+
+    def submit(self, channel_id, value, display_fn: typing.Callable[[typing.Any], None]) -> None:
+        self.mark_dirty(channel_id, value, display_fn)
+
+    def get_display_statistics(self, channel_id=None) -> typing.Dict[str, int]:
+        """Return the submitted, displayed and dropped counts for the channel, or the totals if channel_id is None."""
+        statistics = self.get_statistics(channel_id)
+        return {"submitted": statistics["marked"], "displayed": statistics["flushed"], "dropped": statistics["coalesced"]}
+
+    @property
+    def dropped_count(self) -> int:
+        return self.coalesced_count
+
+    @property
+    def displayed_count(self) -> int:
+        return self.flush_count
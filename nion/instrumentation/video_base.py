@@ -1,16 +1,23 @@
 # standard libraries
 import abc
 import json
+import logging
 import os
 import pathlib
+import threading
+import time
+import weakref
 
 # typing
-# None
+import typing
 
 # third party libraries
 import numpy
 
 # local libraries
+from nion.data import Calibration
+from nion.data import DataAndMetadata
+from nion.instrumentation import stream_recorder
 from nion.swift.model import HardwareSource
 from nion.utils import ListModel
 from nion.utils import Registry
@@ -18,6 +25,13 @@ from nion.utils import StructuredModel
 
 
 class AbstractVideoCamera(abc.ABC):
+    """A video camera.
+
+    A camera may also implement the optional method acquire_data_into(buffer: numpy.ndarray) -> bool. It acquires the
+    most recent image directly into buffer, which has the shape and dtype of the previous image, and returns True. If
+    the image does not fit the buffer (the shape or dtype changed), it returns False and acquire_data is used instead.
+    Cameras implementing it avoid allocating a new array for each frame.
+    """
 
     @abc.abstractmethod
     def close(self) -> None:
@@ -52,34 +66,261 @@ class AbstractVideoCamera(abc.ABC):
         ...
 
 
+class FrameBuffer:
+    """Expose a pool buffer to numpy so that arrays made from it (and their views) reference this object."""
+
+    def __init__(self, buffer: numpy.ndarray):
+        self.__buffer = buffer
+        self.__array_interface__ = buffer.__array_interface__
+
+
+class FramePool:
+    """A pool of frame buffers which are reused once released.
+
+    Each buffer handed out by get_buffer is an array made from a new FrameBuffer; the buffer is released explicitly by
+    a finalizer of the FrameBuffer, which runs once the array and all views of it are gone. Frames passed on to data
+    items are therefore never overwritten while in use.
+    """
+
+    def __init__(self, max_count: int = 4):
+        self.max_count = max_count
+        self.__buffers: typing.List[numpy.ndarray] = list()
+        self.__free_indexes: typing.List[int] = list()
+        self.__generation = 0  # incremented when the buffers are dropped so stale releases are ignored
+        self.__lock = threading.RLock()
+        self.allocation_count = 0
+
+    def __release(self, generation: int, index: int) -> None:
+        with self.__lock:
+            if generation == self.__generation:
+                self.__free_indexes.append(index)
+
+    def __hand_out(self, index: int) -> numpy.ndarray:
+        frame_buffer = FrameBuffer(self.__buffers[index])
+        weakref.finalize(frame_buffer, self.__release, self.__generation, index)
+        return numpy.asarray(frame_buffer)
+
+    def get_buffer(self, shape: typing.Tuple[int, ...], dtype: numpy.dtype) -> typing.Optional[numpy.ndarray]:
+        """Return a free buffer with shape and dtype, or None if all max_count buffers are in use."""
+        with self.__lock:
+            dtype = numpy.dtype(dtype)
+            if self.__buffers and (self.__buffers[0].shape != tuple(shape) or self.__buffers[0].dtype != dtype):
+                # the frame format changed; buffers in use are released by their users.
+                self.__buffers = list()
+                self.__free_indexes = list()
+                self.__generation += 1
+            if self.__free_indexes:
+                return self.__hand_out(self.__free_indexes.pop())
+            if len(self.__buffers) < self.max_count:
+                self.__buffers.append(numpy.empty(shape, dtype))
+                self.allocation_count += 1
+                return self.__hand_out(len(self.__buffers) - 1)
+            return None
+
+
+class VideoFrame:
+    """A captured frame. The data may be a buffer from a frame pool."""
+
+    def __init__(self, data: numpy.ndarray, frame_number: int, timestamp: float):
+        self.data = data
+        self.frame_number = frame_number
+        self.timestamp = timestamp
+
+
+class VideoCaptureThread:
+    """Capture frames from a video camera on a thread and hand off the latest frame.
+
+    The capture thread acquires into buffers from a frame pool when the camera supports acquire_data_into. Frames
+    which are not picked up before the next frame is captured are skipped (latest frame wins), so a slow consumer never
+    blocks the capture of this or any other camera. If max_frame_rate is set, capture is limited to that rate.
+    """
+
+    def __init__(self, camera: AbstractVideoCamera, frame_pool: typing.Optional[FramePool] = None,
+                 max_frame_rate: typing.Optional[float] = None):
+        self.__camera = camera
+        self.__frame_pool = frame_pool if frame_pool else FramePool()
+        self.max_frame_rate = max_frame_rate
+        self.__condition = threading.Condition()
+        self.__latest_frame: typing.Optional[VideoFrame] = None
+        self.__frame_number = 0
+        self.__stop_event = threading.Event()
+        self.__thread: typing.Optional[threading.Thread] = None
+        self.error: typing.Optional[Exception] = None
+        self.captured_count = 0
+        self.skipped_count = 0
+
+    @property
+    def frame_pool(self) -> FramePool:
+        return self.__frame_pool
+
+    def start(self) -> None:
+        self.__stop_event.clear()
+        self.error = None
+        self.__thread = threading.Thread(target=self.__capture_loop, daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """Signal the thread to stop. Call join after stopping the camera so a blocked acquire returns."""
+        self.__stop_event.set()
+        with self.__condition:
+            self.__condition.notify_all()
+
+    def join(self, timeout: float = 5.0) -> None:
+        if self.__thread:
+            self.__thread.join(timeout)
+            self.__thread = None
+        with self.__condition:
+            self.__latest_frame = None
+
+    def get_next_frame(self, timeout: typing.Optional[float] = None) -> typing.Optional[VideoFrame]:
+        """Return the latest frame not returned before, waiting for it up to timeout. Return None if stopped."""
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: self.__latest_frame is not None or self.__stop_event.is_set() or self.error, timeout):
+                return None
+            if self.error:
+                raise self.error
+            frame = self.__latest_frame
+            self.__latest_frame = None
+            return frame
+
+    def __acquire(self, previous_format: typing.Optional[typing.Tuple[typing.Tuple[int, ...], numpy.dtype]]) -> numpy.ndarray:
+        acquire_data_into = getattr(self.__camera, "acquire_data_into", None)
+        if callable(acquire_data_into) and previous_format is not None:
+            buffer = self.__frame_pool.get_buffer(*previous_format)
+            if buffer is not None and acquire_data_into(buffer):
+                return buffer
+        return self.__camera.acquire_data()
+
+    def __capture_loop(self) -> None:
+        # only the format of the previous frame is kept so its buffer is released once its users are done.
+        previous_format = None
+        last_capture_time = None
+        while not self.__stop_event.is_set():
+            if self.max_frame_rate and last_capture_time is not None:
+                delay = last_capture_time + 1.0 / self.max_frame_rate - time.perf_counter()
+                if delay > 0 and self.__stop_event.wait(delay):
+                    break
+            last_capture_time = time.perf_counter()
+            try:
+                data = self.__acquire(previous_format)
+            except Exception as e:
+                if not self.__stop_event.is_set():
+                    logging.exception("Video capture failed.")
+                    with self.__condition:
+                        self.error = e
+                        self.__condition.notify_all()
+                break
+            if data is None or self.__stop_event.is_set():
+                continue
+            previous_format = (data.shape, data.dtype)
+            self.__frame_number += 1
+            frame = VideoFrame(data, self.__frame_number, time.time())
+            del data
+            with self.__condition:
+                if self.__latest_frame is not None:
+                    self.skipped_count += 1
+                self.__latest_frame = frame
+                self.captured_count += 1
+                self.__condition.notify_all()
+            del frame
+
+
+class FrameRingBuffer:
+    """Keep copies of the most recent frames in a preallocated ring within a memory budget (in bytes).
+
+    The ring is allocated for the first frame and reallocated (dropping the buffered frames) if the frame format
+    changes. The capacity is the number of frames that fit in the memory budget.
+    """
+
+    def __init__(self, memory_budget: int):
+        self.memory_budget = memory_budget
+        self.__frames: typing.Optional[numpy.ndarray] = None
+        self.__frame_numbers = numpy.zeros((0,), numpy.int64)
+        self.__timestamps = numpy.zeros((0,), numpy.float64)
+        self.__count = 0  # the total number of frames appended since the ring was allocated
+        self.__lock = threading.RLock()
+
+    @property
+    def capacity(self) -> int:
+        return self.__frames.shape[0] if self.__frames is not None else 0
+
+    @property
+    def count(self) -> int:
+        """Return the number of frames available."""
+        return min(self.__count, self.capacity)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__count = 0
+
+    def append(self, data: numpy.ndarray, frame_number: int, timestamp: float) -> None:
+        with self.__lock:
+            if self.__frames is None or self.__frames.shape[1:] != data.shape or self.__frames.dtype != data.dtype:
+                capacity = self.memory_budget // max(1, data.nbytes)
+                self.__frames = numpy.empty((capacity,) + data.shape, data.dtype) if capacity > 0 else None
+                self.__frame_numbers = numpy.zeros((capacity,), numpy.int64)
+                self.__timestamps = numpy.zeros((capacity,), numpy.float64)
+                self.__count = 0
+            if self.__frames is not None:
+                index = self.__count % self.capacity
+                self.__frames[index] = data
+                self.__frame_numbers[index] = frame_number
+                self.__timestamps[index] = timestamp
+                self.__count += 1
+
+    def get_frames(self, start: int, count: int) -> typing.Optional[typing.List[VideoFrame]]:
+        """Return copies of count frames from start, where start is negative and counts back from the latest frame.
+
+        Return None if the frames are not available.
+        """
+        with self.__lock:
+            available = self.count
+            if start >= 0 or count <= 0 or -start > available or start + count > 0:
+                return None
+            frames = list()
+            for i in range(self.__count + start, self.__count + start + count):
+                index = i % self.capacity
+                frames.append(VideoFrame(numpy.copy(self.__frames[index]), int(self.__frame_numbers[index]), float(self.__timestamps[index])))
+            return frames
+
+
 class AcquisitionTask(HardwareSource.AcquisitionTask):
 
-    def __init__(self, hardware_source_id: str, camera: AbstractVideoCamera, display_name: str):
+    def __init__(self, hardware_source_id: str, camera: AbstractVideoCamera, display_name: str,
+                 frame_pool: typing.Optional[FramePool] = None, max_frame_rate: typing.Optional[float] = None):
         super().__init__(True)
         self.__hardware_source_id = hardware_source_id
         self.__camera = camera
         self.__display_name = display_name
+        self.__capture_thread = VideoCaptureThread(camera, frame_pool, max_frame_rate)
 
     def _start_acquisition(self) -> bool:
         if not super()._start_acquisition():
             return False
         self.__camera.start_acquisition()
+        self.__capture_thread.start()
         return True
 
     def _acquire_data_elements(self):
-        data = self.__camera.acquire_data()
+        # wait for the next frame, the same as acquire_data blocks on the camera.
+        frame = self.__capture_thread.get_next_frame()
+        if frame is None:
+            return list()
         data_element = {
             "version": 1,
-            "data": data,
+            "data": frame.data,
             "properties": {
                 "hardware_source_name": self.__display_name,
                 "hardware_source_id": self.__hardware_source_id,
+                "frame_number": frame.frame_number,
             }
         }
         return [data_element]
 
     def _stop_acquisition(self) -> None:
+        self.__capture_thread.stop()
         self.__camera.stop_acquisition()
+        self.__capture_thread.join()
         super()._stop_acquisition()
 
 
@@ -91,8 +332,19 @@ class VideoHardwareSource(HardwareSource.HardwareSource):
         self.add_data_channel()
         self.__camera = camera
         self.__acquisition_task = None
+        # frame buffers are shared between view tasks so restarting the view does not allocate new buffers.
+        self.__frame_pool = FramePool()
+        self.max_frame_rate: typing.Optional[float] = None
+        # recent frames are kept for grab_buffer only if a memory budget is set, since each frame is then copied.
+        self.__frame_ring_buffer = FrameRingBuffer(0)
+        self.__sequence_lock = threading.RLock()
+        self.__sequence_abort_event = threading.Event()
+        self.__sequence_progress: typing.Optional[float] = None
+        self.__xdatas_available_listener = self.xdatas_available_event.listen(self.__xdatas_available)
 
     def close(self):
+        self.__xdatas_available_listener.close()
+        self.__xdatas_available_listener = None
         super().close()
         # keep the camera device around until super close is called, since super may do something that requires it.
         camera_close_method = getattr(self.__camera, "close", None)
@@ -104,8 +356,125 @@ class VideoHardwareSource(HardwareSource.HardwareSource):
     def video_device(self) -> AbstractVideoCamera:
         return self.__camera
 
+    @property
+    def buffer_memory_budget(self) -> int:
+        """Return the memory (in bytes) used to keep recent frames for grab_buffer. Zero (the default) disables it."""
+        return self.__frame_ring_buffer.memory_budget
+
+    @buffer_memory_budget.setter
+    def buffer_memory_budget(self, value: int) -> None:
+        self.__frame_ring_buffer = FrameRingBuffer(value)
+
+    def __xdatas_available(self, xdatas: typing.Sequence[DataAndMetadata.DataAndMetadata]) -> None:
+        # called on the acquisition thread.
+        if xdatas and self.__frame_ring_buffer.memory_budget > 0:
+            xdata = xdatas[0]
+            frame_number = xdata.metadata.get("hardware_source", dict()).get("frame_number", 0)
+            timestamp = xdata.timestamp.timestamp() if xdata.timestamp else time.time()
+            self.__frame_ring_buffer.append(xdata.data, frame_number, timestamp)
+
+    def __make_xdata(self, data: numpy.ndarray, metadata: typing.Mapping, is_sequence: bool = False) -> DataAndMetadata.DataAndMetadata:
+        data_descriptor = DataAndMetadata.DataDescriptor(is_sequence, 0, len(data.shape) - (1 if is_sequence else 0))
+        dimensional_calibrations = [Calibration.Calibration() for i in range(len(data.shape))]
+        return DataAndMetadata.new_data_and_metadata(data, dimensional_calibrations=dimensional_calibrations,
+                                                     metadata=metadata, data_descriptor=data_descriptor)
+
+    def grab_buffer(self, count: int, *, start: int=None, **kwargs) -> typing.Optional[typing.List[typing.List[DataAndMetadata.DataAndMetadata]]]:
+        """Return recent frames from the buffer, as a list of frames each with a list of one xdata.
+
+        Start is negative and counts back from the latest frame. If start is not specified, the latest count frames
+        are returned. Return None if the frames are not available. Frames are only kept after buffer_memory_budget has
+        been set.
+        """
+        if start is None and count is not None:
+            assert count > 0
+            start = -count
+        if start is not None and count is None:
+            assert start < 0
+            count = -start
+        frames = self.__frame_ring_buffer.get_frames(start, count)
+        if frames is None:
+            return None
+        return [[self.__make_xdata(frame.data, {"hardware_source": {"hardware_source_id": self.hardware_source_id, "frame_number": frame.frame_number, "timestamp": frame.timestamp}})] for frame in frames]
+
+    def grab_sequence_prepare(self, count: int, **kwargs) -> bool:
+        return True
+
+    def grab_sequence(self, count: int, **kwargs) -> typing.Optional[typing.List[DataAndMetadata.DataAndMetadata]]:
+        """Grab the next count frames into a preallocated stack and return a list with the sequence xdata.
+
+        The frame numbers and timestamps of the frames are stored in the 'sequence' metadata. Return None if aborted,
+        if the frame format changes during the sequence, or if the timeout (keyword argument, in seconds) expires.
+
+        The view is started if needed and stopped again afterwards if it was not playing before.
+        """
+        timeout = kwargs.get("timeout")
+        with self.__sequence_lock:
+            self.__sequence_abort_event.clear()
+            self.__sequence_progress = 0.0
+            state = {"stack": None, "index": 0, "failed": False}
+            frame_numbers = list()
+            timestamps = list()
+            done_event = threading.Event()
+
+            def xdatas_available(xdatas: typing.Sequence[DataAndMetadata.DataAndMetadata]) -> None:
+                if done_event.is_set() or not xdatas:
+                    return
+                data = xdatas[0].data
+                if state["stack"] is None:
+                    state["stack"] = numpy.empty((count,) + data.shape, data.dtype)
+                elif state["stack"].shape[1:] != data.shape:
+                    state["failed"] = True
+                    done_event.set()
+                    return
+                state["stack"][state["index"]] = data
+                frame_numbers.append(xdatas[0].metadata.get("hardware_source", dict()).get("frame_number", 0))
+                timestamps.append(xdatas[0].timestamp.timestamp() if xdatas[0].timestamp else time.time())
+                state["index"] += 1
+                self.__sequence_progress = state["index"] / count
+                if state["index"] >= count:
+                    done_event.set()
+
+            was_playing = self.is_playing
+            xdatas_available_listener = self.xdatas_available_event.listen(xdatas_available)
+            try:
+                self.start_playing()
+                start_time = time.perf_counter()
+                while not done_event.wait(0.05):
+                    if self.__sequence_abort_event.is_set() or (timeout is not None and time.perf_counter() - start_time > timeout):
+                        return None
+            finally:
+                done_event.set()
+                xdatas_available_listener.close()
+                self.__sequence_progress = None
+                if not was_playing:
+                    self.stop_playing()
+            if state["failed"]:
+                return None
+            metadata = {"hardware_source": {"hardware_source_id": self.hardware_source_id},
+                        "sequence": {"frame_numbers": frame_numbers, "timestamps": timestamps}}
+            return [self.__make_xdata(state["stack"], metadata, is_sequence=True)]
+
+    def grab_sequence_abort(self) -> None:
+        self.__sequence_abort_event.set()
+
+    def grab_sequence_get_progress(self) -> typing.Optional[float]:
+        return self.__sequence_progress
+
+    def start_stream_recording(self, directory: pathlib.Path, frame_count: typing.Optional[int] = None) -> stream_recorder.StreamRecorder:
+        """Start recording frames to disk and return the recorder. Starts the view if needed.
+
+        The caller stops the recorder (or waits for frame_count frames), gets the memory mapped sequences with
+        get_xdatas, and closes the recorder to delete the files. The frame timestamps and dropped frames are recorded in
+        the 'recording' metadata.
+        """
+        recorder = stream_recorder.StreamRecorder(self, directory, frame_count)
+        recorder.start()
+        self.start_playing()
+        return recorder
+
     def _create_acquisition_view_task(self) -> AcquisitionTask:
-        return AcquisitionTask(self.hardware_source_id, self.__camera, self.display_name)
+        return AcquisitionTask(self.hardware_source_id, self.__camera, self.display_name, self.__frame_pool, self.max_frame_rate)
 
 
 class VideoDeviceInstance:
@@ -1,7 +1,9 @@
 # system imports
+import asyncio
 import gettext
+import logging
+import pathlib
 import threading
-import time
 
 # third part imports
 import numpy
@@ -9,6 +11,8 @@ import numpy
 # local libraries
 from nion.data import Calibration
 from nion.data import DataAndMetadata
+from nion.instrumentation import async_acquisition
+from nion.instrumentation import stream_recorder
 from nion.swift.model import DataItem
 from nion.swift.model import ImportExportManager
 from nion.typeshed import API_1_0 as API
@@ -38,6 +42,7 @@ class Controller:
         self.frame_count_model = Model.PropertyModel(20)
         self.progress_model = Model.PropertyModel(0)
         self.cancel_event = threading.Event()
+        self.stream_directory = pathlib.Path.home() / "AcquisitionRecorder"
         self.__grab_thread = None
         self.__record_thread = None
 
@@ -59,7 +64,8 @@ class Controller:
     async def grab(self, document_controller, hardware_source, do_acquire):
         # this is an async method meaning that it will execute until it calls await, at which time
         # it will let other parts of the software run until the awaited function finishes. in this
-        # case, waiting for acquired data and grabbing the last frames are run in a thread.
+        # case, waiting for acquired data is done by awaiting the hardware source events and
+        # grabbing the last frames is run in a thread.
 
         assert document_controller
         assert hardware_source
@@ -73,27 +79,33 @@ class Controller:
         frame_count = self.frame_count_model.value
         was_playing = hardware_source.is_playing
 
+        # the count line edit allows more frames than the device buffers; grabbing previous frames is limited by it.
+        buffer_size = getattr(hardware_source, "buffer_size", None)
+        if not do_acquire and buffer_size is not None and frame_count > buffer_size:
+            logging.warning("Grab previous is limited to the {} frames in the buffer.".format(buffer_size))
+            frame_count = buffer_size
+
         success_ref = [True]
 
         xdata_group_list = list()
 
-        def exec_acquire():
-            # this will execute in a thread; the enclosing async routine will continue when it finishes
+        async def acquire():
             try:
-                start_time = time.time()
                 max_wait_time = max(hardware_source.get_current_frame_time() * 1.5, 3)
-                while not hardware_source.is_playing:
-                    if time.time() - start_time > max_wait_time:
-                        success_ref[0] = False
-                        return
-                    time.sleep(0.01)
-                hardware_source.get_next_xdatas_to_start(max_wait_time * 2)  # wait for frame + next frame
-                for i in range(frame_count):
-                    self.progress_model.value = int(100 * i / frame_count)
-                    if self.cancel_event.is_set():
-                        success_ref[0] = False
-                        break
-                    hardware_source.get_next_xdatas_to_finish(max_wait_time * 2)
+                await async_acquisition.wait_for_playing(hardware_source, timeout=max_wait_time)
+                async with async_acquisition.frames(hardware_source, timeout=max_wait_time * 2) as frame_iterator:
+                    async for xdatas in frame_iterator:
+                        # the first two frames are the frame in progress and the next frame.
+                        recorded_count = frame_iterator.received_count - 2
+                        if recorded_count >= frame_count:
+                            break
+                        if recorded_count >= 0:
+                            self.progress_model.value = int(100 * recorded_count / frame_count)
+                        if self.cancel_event.is_set():
+                            success_ref[0] = False
+                            break
+            except asyncio.TimeoutError:
+                success_ref[0] = False
             except Exception as e:
                 import traceback
                 traceback.print_exc()
@@ -103,19 +115,12 @@ class Controller:
             print("AR: start playing")
             hardware_source.start_playing()
             print("AR: wait for acquire")
-            await event_loop.run_in_executor(None, exec_acquire)
+            await acquire()
             print("AR: acquire finished")
 
         def exec_grab():
             # this will execute in a thread; the enclosing async routine will continue when it finishes
             try:
-                start_time = time.time()
-                max_wait_time = max(hardware_source.get_current_frame_time() * 1.5, 3)
-                while hardware_source.is_playing:
-                    if time.time() - start_time > max_wait_time:
-                        success_ref[0] = False
-                        return
-                    time.sleep(0.01)
                 data_element_groups = hardware_source.get_buffer_data(-frame_count, frame_count)
                 for data_element_group in data_element_groups:
                     if self.cancel_event.is_set():
@@ -135,6 +140,13 @@ class Controller:
         if success_ref[0]:
             print("AR: stop playing")
             hardware_source.stop_playing()
+            try:
+                max_wait_time = max(hardware_source.get_current_frame_time() * 1.5, 3)
+                await async_acquisition.wait_for_playing(hardware_source, False, timeout=max_wait_time)
+            except asyncio.TimeoutError:
+                success_ref[0] = False
+
+        if success_ref[0]:
             print("AR: grabbing data")
             await event_loop.run_in_executor(None, exec_grab)
             print("AR: grab finished")
@@ -190,6 +202,60 @@ class Controller:
         self.progress_model.value = 0
         print("AR: done")
 
+    async def stream(self, document_controller, hardware_source):
+        # record the next frames straight to disk as they arrive. unlike grab, this is not limited by the buffer of
+        # the hardware source.
+
+        assert document_controller
+        assert hardware_source
+
+        event_loop = document_controller.event_loop
+
+        self.cancel_event.clear()
+
+        self.state.value = "running"
+        self.progress_model.value = 0
+        frame_count = self.frame_count_model.value
+        was_playing = hardware_source.is_playing
+
+        recorder = stream_recorder.StreamRecorder(hardware_source, self.stream_directory, frame_count)
+        recorder.start()
+
+        if not was_playing:
+            hardware_source.start_playing()
+
+        def exec_stream():
+            # this will execute in a thread; the enclosing async routine will continue when it finishes
+            while not self.cancel_event.is_set() and not recorder.wait(0.1):
+                self.progress_model.value = int(100 * recorder.recorded_count / frame_count)
+            recorder.stop()
+
+        try:
+            await event_loop.run_in_executor(None, exec_stream)
+
+            if not was_playing:
+                hardware_source.stop_playing()
+
+            if recorder.dropped_count:
+                logging.warning("Stream recording dropped {} frames.".format(recorder.dropped_count))
+
+            if recorder.recorded_count > 0:
+                for xdata in recorder.get_xdatas():
+                    data_item = DataItem.DataItem(large_format=True)
+                    channel_name = xdata.metadata.get("hardware_source", dict()).get("channel_name")
+                    channel_ext = (" (" + channel_name + ")") if channel_name else ""
+                    data_item.title = _("Recording of ") + hardware_source.display_name + channel_ext
+                    document_controller.document_model.append_data_item(data_item)
+                    # the data item has no other clients at this point; so setting the data will write it to the
+                    # library storage directly from the memory mapped file and unload it.
+                    data_item.set_xdata(xdata)
+                    display_item = document_controller.document_model.get_display_item_for_data_item(data_item)
+                    document_controller.show_display_item(display_item)
+        finally:
+            recorder.close()
+            self.state.value = "idle"
+            self.progress_model.value = 0
+
     def cancel(self):
         self.cancel_event.set()
 
@@ -218,6 +284,7 @@ class PanelDelegate:
         count_line_edit = ui.create_line_edit_widget()
         grab_button = ui.create_push_button_widget(_("Grab Previous"))
         record_button = ui.create_push_button_widget(_("Record Next"))
+        stream_button = ui.create_push_button_widget(_("Stream Next"))
         cancel_button = ui.create_push_button_widget(_("Cancel"))
         progress_bar = ui._ui.create_progress_bar_widget(properties={"height": 18, "min-width": 200})
         progress_bar.minimum = 0
@@ -242,6 +309,8 @@ class PanelDelegate:
         button_row.add_spacing(12)
         button_row.add(record_button)
         button_row.add_spacing(12)
+        button_row.add(stream_button)
+        button_row.add_spacing(12)
         button_row.add(cancel_button)
         button_row.add_spacing(12)
         button_row.add_stretch()
@@ -267,18 +336,21 @@ class PanelDelegate:
                 count_line_edit._widget.enabled = False
                 grab_button._widget.enabled = False
                 record_button._widget.enabled = False
+                stream_button._widget.enabled = False
                 cancel_button._widget.enabled = False
             elif self.__controller.state.value == "idle":
                 source_combo_box.enabled = True
                 count_line_edit._widget.enabled = True
                 grab_button._widget.enabled = True
                 record_button._widget.enabled = True
+                stream_button._widget.enabled = True
                 cancel_button._widget.enabled = False
             elif self.__controller.state.value == "running":
                 source_combo_box.enabled = False
                 count_line_edit._widget.enabled = False
                 grab_button._widget.enabled = False
                 record_button._widget.enabled = False
+                stream_button._widget.enabled = False
                 cancel_button._widget.enabled = True
 
         def scan_hardware_source_changed(hardware_source):
@@ -287,7 +359,7 @@ class PanelDelegate:
 
         self.__scan_hardware_changed_event_listener = self.__scan_hardware_source_choice.hardware_source_changed_event.listen(scan_hardware_source_changed)
 
-        count_line_edit._widget.bind_text(Binding.PropertyBinding(self.__controller.frame_count_model, "value", converter=Converter.IntegerToStringConverter(), validator=Validator.IntegerRangeValidator(1, 100)))
+        count_line_edit._widget.bind_text(Binding.PropertyBinding(self.__controller.frame_count_model, "value", converter=Converter.IntegerToStringConverter(), validator=Validator.IntegerRangeValidator(1, 100000)))
 
         self.__state_changed_listener = self.__controller.state.property_changed_event.listen(state_property_changed)
 
@@ -301,8 +373,12 @@ class PanelDelegate:
         def record():
             event_loop.create_task(self.__controller.grab(document_controller._document_controller, self.__scan_hardware_source, True))
 
+        def stream():
+            event_loop.create_task(self.__controller.stream(document_controller._document_controller, self.__scan_hardware_source))
+
         grab_button.on_clicked = grab
         record_button.on_clicked = record
+        stream_button.on_clicked = stream
         cancel_button.on_clicked = self.__controller.cancel
 
         scan_hardware_source_changed(self.__scan_hardware_source_choice.hardware_source)
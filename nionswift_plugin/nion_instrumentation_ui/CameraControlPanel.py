@@ -15,6 +15,8 @@ import typing
 
 # local libraries
 from nion.instrumentation import camera_base
+from nion.instrumentation import frame_statistics
+from nion.instrumentation import update_coalescer
 from nion.swift import DataItemThumbnailWidget
 from nion.swift import DisplayPanel
 from nion.swift import Panel
@@ -126,9 +128,10 @@ class CameraControlStateController:
 
         self.__captured_xdatas_available_event = None
 
+        # the service samples the delivered frames and computes their statistics on its worker thread.
         self.__camera_current = None
-        self.__last_camera_current_time = 0
-        self.__xdatas_available_event = self.__hardware_source.xdatas_available_event.listen(self.__receive_new_xdatas)
+        self.__frame_statistics_service = frame_statistics.acquire_frame_statistics_service(self.__hardware_source)
+        self.__statistics_changed_event_listener = self.__frame_statistics_service.statistics_changed_event.listen(self.__statistics_changed)
 
         self.data_item_reference = document_model.get_data_item_reference(self.__hardware_source.hardware_source_id)
         self.processed_data_item_reference = document_model.get_data_item_reference(document_model.make_data_item_reference_key(self.__hardware_source.hardware_source_id, "summed"))
@@ -137,9 +140,12 @@ class CameraControlStateController:
         if self.__captured_xdatas_available_event:
             self.__captured_xdatas_available_event.close()
             self.__captured_xdatas_available_event = None
-        if self.__xdatas_available_event:
-            self.__xdatas_available_event.close()
-            self.__xdatas_available_event = None
+        if self.__statistics_changed_event_listener:
+            self.__statistics_changed_event_listener.close()
+            self.__statistics_changed_event_listener = None
+        if self.__frame_statistics_service:
+            frame_statistics.release_frame_statistics_service(self.__frame_statistics_service)
+            self.__frame_statistics_service = None
         if self.__profile_changed_event_listener:
             self.__profile_changed_event_listener.close()
             self.__profile_changed_event_listener = None
@@ -170,7 +176,7 @@ class CameraControlStateController:
         self.__hardware_source = None
 
     def _reset_camera_current(self):
-        self.__last_camera_current_time = 0
+        self.__camera_current = None
 
     def __update_play_button_state(self):
         enabled = self.__hardware_source is not None
@@ -213,21 +219,15 @@ class CameraControlStateController:
     def has_processed_data(self) -> bool:
         return self.__has_processed_channel
 
-    def __receive_new_xdatas(self, xdatas):
-        current_time = time.time()
-        if current_time - self.__last_camera_current_time > 5.0 and len(xdatas) > 0 and callable(self.on_camera_current_changed):
-            xdata = xdatas[0]
-            counts_per_electron = xdata.metadata.get("hardware_source", dict()).get("counts_per_electron")
-            exposure = xdata.metadata.get("hardware_source", dict()).get("exposure")
-            if xdata.intensity_calibration.units == "counts" and counts_per_electron and exposure:
-                sum_counts = xdata.intensity_calibration.convert_to_calibrated_value(numpy.sum(xdatas[0].data))
-                detector_current = sum_counts / exposure / counts_per_electron / 6.242e18 if exposure > 0 and counts_per_electron > 0 else 0.0
-                if detector_current != self.__camera_current:
-                    self.__camera_current = detector_current
-                    def update_camera_current():
-                        self.on_camera_current_changed(self.__camera_current)
-                    self.queue_task(update_camera_current)
-            self.__last_camera_current_time = current_time
+    def __statistics_changed(self, statistics: frame_statistics.FrameStatistics) -> None:
+        # called on the worker thread of the statistics service.
+        detector_current = statistics.detector_current
+        if detector_current is not None and detector_current != self.__camera_current and callable(self.on_camera_current_changed):
+            self.__camera_current = detector_current
+            def update_camera_current():
+                if callable(self.on_camera_current_changed):
+                    self.on_camera_current_changed(self.__camera_current)
+            self.queue_task(update_camera_current)
 
     def initialize_state(self):
         """ Call this to initialize the state of the UI after everything has been connected. """
@@ -595,6 +595,11 @@ class CameraControlWidget(Widgets.CompositeWidgetBase):
 
         self.__state_controller = CameraControlStateController(camera_controller, document_controller.queue_task, document_controller.document_model)
 
+        # the data item states arrive for every frame; only the newest states are shown if the acquisition outpaces
+        # the user interface and the replaced frames are counted.
+        self.__hardware_source_id = camera_controller.hardware_source_id
+        self.__display_decimator = update_coalescer.DisplayDecimator(document_controller.queue_task)
+
         self.__delegate : typing.Optional[CameraPanelDelegate] = None
 
         camera_panel_delegate_type = camera_controller.features.get("camera_panel_delegate_type")
@@ -902,7 +907,7 @@ class CameraControlWidget(Widgets.CompositeWidgetBase):
         self.__state_controller.on_frame_parameters_changed = frame_parameters_changed
         self.__state_controller.on_play_button_state_changed = play_button_state_changed
         self.__state_controller.on_abort_button_state_changed = abort_button_state_changed
-        self.__state_controller.on_data_item_states_changed = lambda a: self.document_controller.queue_task(lambda: data_item_states_changed(a))
+        self.__state_controller.on_data_item_states_changed = lambda a: self.__display_decimator.submit(self.__hardware_source_id, a, data_item_states_changed)
         self.__state_controller.on_monitor_button_state_changed = monitor_button_state_changed
         self.__state_controller.on_camera_current_changed = camera_current_changed
         self.__state_controller.on_log_messages = log_messages
@@ -927,8 +932,14 @@ class CameraControlWidget(Widgets.CompositeWidgetBase):
         self.__image_display_mouse_released_event_listener= None
         self.__state_controller.close()
         self.__state_controller = None
+        self.__display_decimator.close()
         super().close()
 
+    @property
+    def display_statistics(self) -> typing.Dict[str, int]:
+        """Return the submitted, displayed and dropped counts of the per frame data item state (status text) updates."""
+        return self.__display_decimator.get_display_statistics()
+
     # this gets called from the DisplayPanelManager. pass on the message to the state controller.
     # must be called on ui thread
     def image_panel_mouse_pressed(self, display_panel: DisplayPanel.DisplayPanel, display_item: DisplayItem.DisplayItem, image_position: Geometry.FloatPoint, modifiers: CanvasItem.KeyboardModifiers) -> bool:
@@ -1036,6 +1047,10 @@ class CameraDisplayPanelController:
         # configure the hardware source state controller
         self.__state_controller = CameraControlStateController(hardware_source, display_panel.document_controller.queue_task, display_panel.document_controller.document_model)
 
+        # the data item states arrive for every frame; only the newest states are shown in the status text if the
+        # acquisition outpaces the user interface and the replaced frames are counted.
+        self.__display_decimator = update_coalescer.DisplayDecimator(display_panel.document_controller.queue_task)
+
         # configure the user interface
         self.__display_name = str()
         self.__play_button_enabled = False
@@ -1100,6 +1115,9 @@ class CameraDisplayPanelController:
                 abort_button_canvas_item.size_to_content(display_panel.image_panel_get_font_metrics)
 
         def update_status_text():
+            # the status may be queued to the main thread and run after closing.
+            if not self.__display_panel:
+                return
             map_channel_state_to_text = {"stopped": _("Stopped"), "complete": _("Acquiring"),
                 "partial": _("Acquiring"), "marked": _("Stopping")}
             for data_item_state in self.__data_item_states:
@@ -1124,10 +1142,14 @@ class CameraDisplayPanelController:
             self.__abort_button_enabled = enabled
             update_abort_button()
 
-        def data_item_states_changed(data_item_states):
+        def display_data_item_states(data_item_states):
             self.__data_item_states = data_item_states
             update_status_text()
 
+        def data_item_states_changed(data_item_states):
+            # called on the acquisition thread for every frame.
+            self.__display_decimator.submit(self.__hardware_source_id, data_item_states, display_data_item_states)
+
         def update_capture_button(visible, enabled):
             if visible:
                 capture_button.enabled = enabled
@@ -1179,6 +1201,12 @@ class CameraDisplayPanelController:
         self.__display_panel = None
         self.__state_controller.close()
         self.__state_controller = None
+        self.__display_decimator.close()
+
+    @property
+    def display_statistics(self) -> typing.Dict[str, int]:
+        """Return the submitted, displayed and dropped counts of the per frame data item state (status text) updates."""
+        return self.__display_decimator.get_display_statistics()
 
     def save(self, d):
         d["hardware_source_id"] = self.__hardware_source_id
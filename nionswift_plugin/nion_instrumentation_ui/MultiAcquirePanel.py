@@ -7,6 +7,7 @@ import logging
 
 # local libraries
 from nion.instrumentation import MultiAcquire
+from nion.instrumentation import update_coalescer
 from nion.swift.model import ImportExportManager
 from nion.ui import Dialog
 from nion.utils import Registry
@@ -141,11 +142,26 @@ class MultiAcquirePanelDelegate:
         self.parameter_column = None
         self.result_data_items = {}
         self.__result_data_items_refs = []
+        # set reducers_fn to a function returning the reducers for the energy offset of a spectrum to show their maps
+        # (for instance EELS edge maps) while a spectrum image is acquired.
+        self.reducers_fn = None
+        self.__reduced_data_items = {}
         self.__acquisition_running = False
         self.__display_queue = queue.Queue()
         self.__display_thread = None
         self.__acquisition_thread = None
         self.__data_processed_event = threading.Event()
+        # display updates of the result data items are merged per data item and flushed at a limited rate so that the
+        # ui thread does not get flooded during fast acquisitions.
+        self.__display_coalescer = update_coalescer.UpdateCoalescer(rate_hz=10.0, dispatch_fn=self.__api.queue_task)
+
+    @property
+    def display_update_rate_hz(self) -> float:
+        return self.__display_coalescer.rate_hz
+
+    @display_update_rate_hz.setter
+    def display_update_rate_hz(self, value: float) -> None:
+        self.__display_coalescer.rate_hz = value
 
     @property
     def superscan(self):
@@ -179,6 +195,7 @@ class MultiAcquirePanelDelegate:
             self.__new_data_ready_event_listener.close()
         if self.__superscan_frame_parameters_changed_event_listener:
             self.__superscan_frame_parameters_changed_event_listener.close()
+        self.__display_coalescer.close()
         self.__data_processed_event.set()
 
     def spectrum_parameters_changed(self):
@@ -279,8 +296,13 @@ class MultiAcquirePanelDelegate:
 
     def __close_data_item_refs(self):
         logging.debug('Closing data item refs')
-        for item in self.result_data_items.values():
-            item.exit_write_suspend_state()
+        # the flushed updates are queued to the ui thread; exit the write suspend states after them.
+        self.__display_coalescer.flush()
+        result_data_items = list(self.result_data_items.values())
+        def exit_write_suspend_states():
+            for item in result_data_items:
+                item.exit_write_suspend_state()
+        self.__api.queue_task(exit_write_suspend_states)
 #        for item in self.result_data_items:
 #            try:
 #                while True:
@@ -291,6 +313,7 @@ class MultiAcquirePanelDelegate:
             self.__new_data_ready_event_listener.close()
         self.__new_data_ready_event_listener = None
         self.result_data_items = {}
+        self.__reduced_data_items = {}
 
     def add_to_display_queue(self, data_dict):
         self.__display_queue.put(data_dict)
@@ -345,25 +368,54 @@ class MultiAcquirePanelDelegate:
                     self.result_data_items[data_item_key] = new_appendable_data_item
                     del new_appendable_data_item
 
-            if scan_data_dict['settings']['sum_frames'] and number_frames > 1:
-                data = self.result_data_items[data_item_key].get_data((...,))
-                data += scan_xdata.data
-                def get_and_display_data_item():
-                    data_item = self.result_data_items[data_item_key].get_full_data_item()
+            if number_frames > 1:
+                appendable_data_item = self.result_data_items[data_item_key]
+                def get_and_display_data_item(slice_tuple):
+                    data_item = appendable_data_item.get_partial_data_item(slice_tuple)
                     try:
                         self.__api.application.document_controllers[0].display_data_item(data_item)
                     except AttributeError:
                         pass
-                self.__api.queue_task(get_and_display_data_item)
-            elif number_frames > 1:
-                self.result_data_items[data_item_key].add_data((current_frame, ...), scan_xdata.data)
-                def get_and_display_data_item():
-                    data_item = self.result_data_items[data_item_key].get_partial_data_item((slice(0, current_frame+1), ...))
+                if scan_data_dict['settings']['sum_frames']:
+                    data = appendable_data_item.get_data((...,))
+                    data += scan_xdata.data
+                    slice_tuple = (...,)
+                else:
+                    appendable_data_item.add_data((current_frame, ...), scan_xdata.data)
+                    slice_tuple = (slice(0, current_frame+1), ...)
+                self.__display_coalescer.mark_dirty(data_item_key, slice_tuple, get_and_display_data_item,
+                                                    update_coalescer.merge_slices)
+
+    def process_reduced_data(self, reduced_data_dict):
+        # the maps are summed over the frames of the spectrum by the controller; each update replaces the data.
+        index = reduced_data_dict['parameters']['index']
+        number_frames = reduced_data_dict['parameters']['frames']
+        exposure_ms = reduced_data_dict['parameters']['exposure_ms']
+        for reduced_index, reduced_xdata in enumerate(reduced_data_dict['xdata_list']):
+            metadata = reduced_xdata.metadata
+            metadata['MultiAcquire.parameters'] = dict(reduced_data_dict['parameters'])
+            metadata['MultiAcquire.settings'] = dict(reduced_data_dict['settings'])
+            reduced_xdata._set_metadata(metadata)
+            data_item_key = (index, reduced_index)
+            data_item = self.__reduced_data_items.get(data_item_key)
+            if not data_item:
+                reduction_name = metadata.get('reduction', dict()).get('name', '')
+                title = 'MultiAcquire ({}) #{:d}, {:g}x{:g} ms'.format(reduction_name, index+1, number_frames, exposure_ms)
+                data_item_ready_event = threading.Event()
+                new_data_item = None
+                def create_data_item():
+                    nonlocal new_data_item
+                    new_data_item = self.__api.library.create_data_item_from_data_and_metadata(reduced_xdata, title=title)
                     try:
-                        self.__api.application.document_controllers[0].display_data_item(data_item)
+                        self.__api.application.document_controllers[0].display_data_item(new_data_item)
                     except AttributeError:
                         pass
-                self.__api.queue_task(get_and_display_data_item)
+                    data_item_ready_event.set()
+                self.__api.queue_task(create_data_item)
+                data_item_ready_event.wait()
+                self.__reduced_data_items[data_item_key] = new_data_item
+            else:
+                self.__display_coalescer.mark_dirty(data_item_key, reduced_xdata, data_item.set_data_and_metadata)
 
     def process_display_queue(self):
         while True:
@@ -377,6 +429,9 @@ class MultiAcquirePanelDelegate:
                 if data_dict.get('is_scan_data'):
                     self.process_scan_data(data_dict)
                     continue
+                if data_dict.get('is_reduced_data'):
+                    self.process_reduced_data(data_dict)
+                    continue
                 index = data_dict['parameters']['index']
                 start_ev = data_dict['parameters']['start_ev']
                 end_ev = data_dict['parameters']['end_ev']
@@ -423,26 +478,19 @@ class MultiAcquirePanelDelegate:
                 if data_dict['settings']['sum_frames']:
                     data = data_item.get_data(dest_sub_area.slice)
                     data += xdata.data
-                    def get_and_display_data_item():
-                        data_item.get_partial_data_item((slice(0, dest_sub_area.bottom_right[0]),
-                                                         slice(0, dest_sub_area.bottom_right[1])))
-
-                    self.__api.queue_task(get_and_display_data_item)
+                    slice_tuple = (slice(0, dest_sub_area.bottom_right[0]), slice(0, dest_sub_area.bottom_right[1]))
                 elif number_frames > 1:
                     data_item.add_data((current_frame,) + dest_sub_area.slice, xdata.data)
-                    def get_and_display_data_item():
-                        data_item.get_partial_data_item((slice(0, current_frame+1),
-                                                         slice(0, dest_sub_area.bottom_right[0]),
-                                                         slice(0, dest_sub_area.bottom_right[1])))
-                        #self.__api.application.document_controllers[0].display_data_item(data_item)
-                    self.__api.queue_task(get_and_display_data_item)
+                    slice_tuple = (slice(0, current_frame+1),
+                                   slice(0, dest_sub_area.bottom_right[0]),
+                                   slice(0, dest_sub_area.bottom_right[1]))
                 else:
                     data_item.add_data(dest_sub_area.slice, xdata.data)
-                    def get_and_display_data_item():
-                        data_item.get_partial_data_item((slice(0, dest_sub_area.bottom_right[0]),
-                                                         slice(0, dest_sub_area.bottom_right[1])))
-                        #self.__api.application.document_controllers[0].display_data_item(data_item)
-                    self.__api.queue_task(get_and_display_data_item)
+                    slice_tuple = (slice(0, dest_sub_area.bottom_right[0]), slice(0, dest_sub_area.bottom_right[1]))
+                # merge with any pending update of this data item; the partial data item is re-created at most once
+                # per display period.
+                self.__display_coalescer.mark_dirty(index, slice_tuple, data_item.get_partial_data_item,
+                                                    update_coalescer.merge_slices)
                 del data_dict
                 self.__display_queue.task_done()
 
@@ -480,12 +528,14 @@ class MultiAcquirePanelDelegate:
                 self.multi_acquire_controller.camera = self.camera_choice_combo_box.current_item
                 self.multi_acquire_controller.superscan = self.superscan
                 self.result_data_items = {}
+                self.__reduced_data_items = {}
                 self.__new_data_ready_event_listener = self.multi_acquire_controller.new_data_ready_event.listen(self.add_to_display_queue)
                 self.__data_processed_event.clear()
                 self.__display_thread = threading.Thread(target=self.process_display_queue)
                 self.__display_thread.start()
                 self.__acquisition_thread = threading.Thread(
-                        target=self.multi_acquire_controller.acquire_multi_eels_spectrum_image, daemon=True)
+                        target=self.multi_acquire_controller.acquire_multi_eels_spectrum_image,
+                        kwargs={'reducers_fn': self.reducers_fn}, daemon=True)
                 self.__acquisition_thread.start()
 
         def settings_button_clicked():
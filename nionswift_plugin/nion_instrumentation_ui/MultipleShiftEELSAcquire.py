@@ -1,4 +1,5 @@
 # standard libraries
+import datetime
 import functools
 import gettext
 import logging
@@ -10,7 +11,7 @@ import numpy
 # local libraries
 from nion.data import Calibration
 from nion.data import DataAndMetadata
-from nion.data import xdata_1_0 as xd
+from nion.instrumentation import registration
 from nion.swift import Panel
 from nion.swift import Workspace
 from nion.swift.model import DataItem
@@ -35,6 +36,57 @@ energy_adjust_control = "EELS_MagneticShift_Offset"
 blank_control = "C_Blank"
 
 
+def get_frame_start_time(xdata: DataAndMetadata.DataAndMetadata) -> datetime.datetime:
+    """Return the (utc) time the exposure of the frame started, using its timestamp and exposure."""
+    exposure = xdata.metadata.get("hardware_source", dict()).get("exposure", 0.0)
+    return xdata.timestamp - datetime.timedelta(seconds=exposure)
+
+
+def get_zlp_position(data: numpy.ndarray) -> int:
+    return int(numpy.argmax(numpy.sum(data, axis=0) if len(data.shape) > 1 else data))
+
+
+def grab_settled_xdata(camera, settle_time: datetime.datetime, zlp_tolerance: float = None, max_frames: int = 20) -> DataAndMetadata.DataAndMetadata:
+    """Return the first frame whose exposure started after settle_time (utc).
+
+    If zlp_tolerance is not None, additionally wait until the zero loss peak position of two consecutive settled frames
+    differs by no more than zlp_tolerance pixels. Gives up after max_frames frames and returns the last frame.
+    """
+    timeout = max(camera.get_current_frame_time() * 3, 3)
+    last_zlp_position = None
+    xdata = None
+    for frame_index in range(max_frames):
+        xdata = camera.get_next_xdatas_to_finish(timeout)[0]
+        if xdata.timestamp is None or get_frame_start_time(xdata) < settle_time:
+            continue
+        if zlp_tolerance is None:
+            return xdata
+        zlp_position = get_zlp_position(xdata.data)
+        if last_zlp_position is not None and abs(zlp_position - last_zlp_position) <= zlp_tolerance:
+            return xdata
+        last_zlp_position = zlp_position
+    logging.debug("Camera did not settle within {} frames.".format(max_frames))
+    return xdata
+
+
+def grab_afterglow_settled_xdata(camera, settle_time: datetime.datetime, max_wait_time: float, tolerance: float = 0.01) -> DataAndMetadata.DataAndMetadata:
+    """Return the first frame after settle_time (utc) once the afterglow has decayed.
+
+    The afterglow is considered gone when the total intensity of consecutive frames changes by less than tolerance
+    (relative). Gives up after max_wait_time seconds and returns the last frame.
+    """
+    start_time = time.time()
+    xdata = grab_settled_xdata(camera, settle_time)
+    last_sum = float(numpy.sum(xdata.data))
+    while time.time() - start_time < max_wait_time:
+        xdata = camera.get_next_xdatas_to_finish(max(camera.get_current_frame_time() * 3, 3))[0]
+        frame_sum = float(numpy.sum(xdata.data))
+        if abs(frame_sum - last_sum) <= tolerance * max(abs(last_sum), 1.0):
+            break
+        last_sum = frame_sum
+    return xdata
+
+
 class AcquireController(metaclass=Utility.Singleton):
 
     """
@@ -45,18 +97,53 @@ class AcquireController(metaclass=Utility.Singleton):
     def __init__(self):
         super(AcquireController, self).__init__()
         self.__acquire_thread = None
+        # dark images keyed by camera and frame settings; reused until they are older than dark_max_age seconds.
+        self.__dark_cache = dict()
+        self.dark_max_age = 600.0
+        # if not None, wait for the zero loss peak to be stable to within this many pixels after each energy step.
+        self.zlp_tolerance = None
+
+    def clear_dark_cache(self):
+        self.__dark_cache = dict()
 
     def start_threaded_acquire_and_sum(self, stem_controller, camera, number_frames, energy_offset_per_frame, sleep_time, document_controller, final_layout_fn):
         if self.__acquire_thread and self.__acquire_thread.is_alive():
             logging.debug("Already acquiring")
             return
 
-        def set_offset_energy(offset, sleep_time=1):
+        def set_offset_energy(offset, confirm_timeout=1):
             current_energy = stem_controller.GetVal(energy_adjust_control)
             # this function waits until the value is confirmed to be the desired value (or until timeout)
-            stem_controller.SetValAndConfirm(energy_adjust_control, float(current_energy) + offset, 1, int(sleep_time * 1000))
-            # sleep 1 sec to avoid double peaks and ghosting
-            time.sleep(sleep_time)
+            stem_controller.SetValAndConfirm(energy_adjust_control, float(current_energy) + offset, 1, int(confirm_timeout * 1000))
+            # frames starting after this time have the new energy offset
+            return datetime.datetime.utcnow()
+
+        def get_dark_key(xdata):
+            hardware_source_metadata = xdata.metadata.get("hardware_source", dict())
+            return (camera.hardware_source_id, hardware_source_metadata.get("exposure"),
+                    hardware_source_metadata.get("binning"), xdata.data_shape)
+
+        def acquire_dark(dark_key, number_frames, task_object=None):
+            dark_data, dark_time = self.__dark_cache.get(dark_key, (None, 0))
+            if dark_data is not None and time.time() - dark_time < self.dark_max_age:
+                logging.info("Using cached dark image.")
+                return dark_data
+            stem_controller.SetValWait(blank_control, 1.0, 200)
+            try:
+                # wait (at most sleep_time) for the afterglow to die out; then sum the following frames
+                dark_sum = numpy.array(grab_afterglow_settled_xdata(camera, datetime.datetime.utcnow(), sleep_time).data, dtype=float)
+                if task_object is not None:
+                    task_object.update_progress(_("Grabbing dark data frame {}.").format(1), (1, number_frames), None)
+                for frame_index in range(1, number_frames):
+                    dark_sum += camera.get_next_xdatas_to_finish()[0].data
+                    if task_object is not None:
+                        task_object.update_progress(_("Grabbing dark data frame {}.").format(frame_index + 1),
+                                                    (frame_index + 1, number_frames), None)
+            finally:
+                stem_controller.SetVal(blank_control, 0)
+            dark_data = dark_sum / number_frames
+            self.__dark_cache[dark_key] = (dark_data, time.time())
+            return dark_data
 
         def acquire_series(number_frames, offset_per_spectrum, task_object=None) -> DataItem.DataItem:
             logging.info("Starting image acquisition.")
@@ -68,31 +155,20 @@ class AcquireController(metaclass=Utility.Singleton):
             image_stack_data = numpy.empty((number_frames, first_data.shape[0], first_data.shape[1]), dtype=numpy.float)
 
             reference_energy = stem_controller.GetVal(energy_adjust_control)
-            for frame_index in range(number_frames):
-                set_offset_energy(offset_per_spectrum, 1)
-                # use next frame to start to make sure we're getting a frame with the new energy offset
-                image_stack_data[frame_index] = camera.get_next_xdatas_to_start()[0].data
-                if task_object is not None:
-                    task_object.update_progress(_("Grabbing EELS data frame {}.").format(frame_index + 1),
-                                                (frame_index + 1, number_frames), None)
-
-            stem_controller.SetValWait(blank_control, 1.0, 200)
-            # sleep 4 seconds to allow afterglow to die out
-            time.sleep(sleep_time)
-            dark_sum = None
-            for frame_index in range(number_frames):
-                if dark_sum is None:
-                    # use next frame to start to make sure we're getting a blanked frame
-                    dark_sum = camera.get_next_xdatas_to_start()[0].data
-                else:
-                    # but now use next frame to finish since we can know it's already blanked
-                    dark_sum += camera.get_next_xdatas_to_finish()[0].data
-                if task_object is not None:
-                    task_object.update_progress(_("Grabbing dark data frame {}.").format(frame_index + 1),
-                                                (frame_index + 1, number_frames), None)
-            stem_controller.SetVal(blank_control, 0)
-            stem_controller.SetVal(energy_adjust_control, reference_energy)
-            image_stack_data -= dark_sum / number_frames
+            try:
+                for frame_index in range(number_frames):
+                    settle_time = set_offset_energy(offset_per_spectrum)
+                    # use the first frame started after the energy offset was confirmed (and optionally has a stable
+                    # zero loss peak) to make sure we're getting a frame with the new energy offset
+                    image_stack_data[frame_index] = grab_settled_xdata(camera, settle_time, self.zlp_tolerance).data
+                    if task_object is not None:
+                        task_object.update_progress(_("Grabbing EELS data frame {}.").format(frame_index + 1),
+                                                    (frame_index + 1, number_frames), None)
+            finally:
+                stem_controller.SetVal(energy_adjust_control, reference_energy)
+
+            # darks are acquired in a separate pass and reused while they are recent enough
+            image_stack_data -= acquire_dark(get_dark_key(first_xdata), number_frames, task_object)
 
             dimension_calibration0 = first_xdata.dimensional_calibrations[0]
             dimension_calibration1 = first_xdata.dimensional_calibrations[1]
@@ -113,28 +189,21 @@ class AcquireController(metaclass=Utility.Singleton):
             number_frames = stack.shape[0]
             if task_object is not None:
                 task_object.update_progress(_("Starting image alignment."), (0, number_frames))
-            # Pre-allocate an array for the shifts we'll measure
-            shifts = numpy.zeros((number_frames, 2))
-            # initial reference slice is first slice
-            ref = stack[0][:]
-            ref_shift = numpy.array([0, 0])
-            for index, _slice in enumerate(stack):
+            # each frame is registered to the previous one; transforms are computed once per frame, in batches on a
+            # thread pool, and the shifted frames are summed in Fourier space.
+            # TODO: make interpolation factor variable (it is hard-coded to 100 here.)
+            stack_registration = registration.StackRegistration(upsample_factor=100, relative_to_previous=True)
+
+            def cross_correlation_progress(index, count):
                 if task_object is not None:
-                    task_object.update_progress(_("Cross correlating frame {}.").format(index), (index + 1, number_frames), None)
-                # TODO: make interpolation factor variable (it is hard-coded to 100 here.)
-                ref_xdata = DataAndMetadata.new_data_and_metadata(ref)
-                _slice_xdata = DataAndMetadata.new_data_and_metadata(_slice)
-                shifts[index] = ref_shift + numpy.array(xd.register_translation(ref_xdata, _slice_xdata, 100))
-                ref = _slice[:]
-                ref_shift = shifts[index]
-            # sum image needs to be big enough for shifted images
-            sum_image = numpy.zeros(ref.shape)
-            # add the images to the registered stack
-            for index, _slice in enumerate(stack):
+                    task_object.update_progress(_("Cross correlating frame {}.").format(index), (index, count), None)
+
+            def sum_progress(index, count):
                 if task_object is not None:
-                    task_object.update_progress(_("Summing frame {}.").format(index), (index + 1, number_frames), None)
-                _slice_xdata = DataAndMetadata.new_data_and_metadata(_slice)
-                sum_image += xd.shift(_slice_xdata, shifts[index]).data
+                    task_object.update_progress(_("Summing frame {}.").format(index), (index, count), None)
+
+            shifts = stack_registration.register(stack, cross_correlation_progress)
+            sum_image = stack_registration.sum_shifted(stack, shifts, sum_progress)
             return sum_image, shifts
 
         def show_in_panel(data_item, document_controller, display_panel_id):
@@ -247,7 +316,7 @@ class MultipleShiftEELSAcquireControlView(Panel.Panel):
         dialog_row2.add(self.energy_offset)
         dialog_row2.add_stretch()
         dialog_row3 = ui.create_row_widget()
-        dialog_row3.add(ui.create_label_widget(_("Sleep seconds after blank:")))
+        dialog_row3.add(ui.create_label_widget(_("Max. seconds after blank:")))
         dialog_row3.add(self.sleep_time)
         dialog_row3.add_stretch()
         dialog_row4 = ui.create_row_widget()
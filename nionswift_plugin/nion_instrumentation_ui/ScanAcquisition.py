@@ -9,16 +9,19 @@ import logging
 import math
 import numpy
 import threading
+import time
 import typing
 import uuid
 
 # local libraries
-from nion.data import Calibration
 from nion.data import DataAndMetadata
 from nion.data import xdata_1_0 as xd
 from nion.instrumentation import camera_base
+from nion.instrumentation import drift_tracker
+from nion.instrumentation import reduction
 from nion.instrumentation import scan_base
 from nion.instrumentation import stem_controller
+from nion.instrumentation import update_coalescer
 from nion.swift import Facade
 from nion.swift import HistogramPanel
 from nion.swift.model import DataItem
@@ -87,25 +90,39 @@ class ScanSpecifier:
 
 
 class CameraDataChannel:
-    def __init__(self, document_model, channel_name: str, grab_sync_info: scan_base.ScanHardwareSource.GrabSynchronizedInfo):
+    def __init__(self, document_model, channel_name: str, grab_sync_info: scan_base.ScanHardwareSource.GrabSynchronizedInfo, display_update_rate_hz: float = 10.0,
+                 storage_format: typing.Optional[reduction.StorageFormat] = None):
         self.__document_model = document_model
+        # the storage format, if any, crops, bins and converts each section before it is stored in the data item.
+        self.__storage_format = storage_format
+        self.__datum_shape = tuple(grab_sync_info.camera_readout_size_squeezed)
+        self.__data_calibrations = tuple(grab_sync_info.data_calibrations)
+        if storage_format:
+            self.__data_calibrations = storage_format.get_data_calibrations(self.__datum_shape, self.__data_calibrations)
+            self.__datum_shape = storage_format.get_datum_shape(self.__datum_shape)
+        self.__data_dtype = storage_format.dtype if storage_format else numpy.dtype(numpy.float32)
         self.__data_item = self.__create_data_item(channel_name, grab_sync_info)
         self.__data_item_transaction = None
         self.__data_and_metadata = None
+        # the rows of the current section which are valid so far, copied from the camera.
+        self.__section_buffer = None
+        self.__section_origin = None
+        self.__section_valid_rows = 0
+        # partial updates are merged per section and passed to the document model at a limited rate.
+        self.__update_coalescer = update_coalescer.UpdateCoalescer(rate_hz=display_update_rate_hz)
 
     def __create_data_item(self, channel_name: str, grab_sync_info: scan_base.ScanHardwareSource.GrabSynchronizedInfo) -> DataItem.DataItem:
         scan_calibrations = grab_sync_info.scan_calibrations
-        data_calibrations = grab_sync_info.data_calibrations
+        data_calibrations = self.__data_calibrations
         data_intensity_calibration = grab_sync_info.data_intensity_calibration
         data_item = DataItem.DataItem(large_format=True)
         data_item.title = f"{title_base} ({channel_name})"
         self.__document_model.append_data_item(data_item)
         if hasattr(data_item, "reserve_data"):
             scan_size = tuple(grab_sync_info.scan_size)
-            camera_readout_size = grab_sync_info.camera_readout_size_squeezed
-            data_shape = scan_size + camera_readout_size
+            data_shape = scan_size + self.__datum_shape
             data_descriptor = DataAndMetadata.DataDescriptor(False, 2, len(data_shape) - 2)
-            data_item.reserve_data(data_shape=data_shape, data_dtype=numpy.float32, data_descriptor=data_descriptor)
+            data_item.reserve_data(data_shape=data_shape, data_dtype=self.__data_dtype, data_descriptor=data_descriptor)
         data_item.dimensional_calibrations = scan_calibrations + data_calibrations
         data_item.intensity_calibration = data_intensity_calibration
         data_item_metadata = data_item.metadata
@@ -118,6 +135,49 @@ class CameraDataChannel:
     def data_item(self) -> DataItem.DataItem:
         return self.__data_item
 
+    def __convert(self, data_and_metadata: DataAndMetadata.DataAndMetadata) -> DataAndMetadata.DataAndMetadata:
+        # the result never shares memory with the source, which may be the section buffer of the camera.
+        data = self.__storage_format.convert(data_and_metadata.data, len(self.__datum_shape))
+        if numpy.may_share_memory(data, data_and_metadata.data):
+            data = numpy.copy(data)
+        return self.__new_storage_format_data_and_metadata(data_and_metadata, data)
+
+    def __new_storage_format_data_and_metadata(self, data_and_metadata: DataAndMetadata.DataAndMetadata, data: numpy.ndarray) -> DataAndMetadata.DataAndMetadata:
+        # return the data, already in the storage format, with the calibrations and metadata of data_and_metadata.
+        collection_rank = len(data.shape) - len(self.__datum_shape)
+        metadata = dict(data_and_metadata.metadata)
+        metadata["storage_format"] = {"dtype": str(self.__storage_format.dtype), "clipped_count": self.__storage_format.clipped_count}
+        return DataAndMetadata.new_data_and_metadata(data, data_and_metadata.intensity_calibration,
+                                                     tuple(data_and_metadata.dimensional_calibrations[:collection_rank]) + self.__data_calibrations,
+                                                     metadata=metadata,
+                                                     data_descriptor=DataAndMetadata.DataDescriptor(False, collection_rank, len(self.__datum_shape)))
+
+    def __update_section_buffer(self, data: numpy.ndarray, collection_rank: int, section_origin: Geometry.IntPoint, sub_area: Geometry.IntRect) -> numpy.ndarray:
+        # copy (or convert to the storage format) the rows of the section which became valid since the last update
+        # into the section buffer. each section gets a new buffer since the deferred update of the previous section
+        # may still read from its buffer.
+        if self.__section_buffer is None or section_origin != self.__section_origin or sub_area.bottom < self.__section_valid_rows:
+            if self.__storage_format:
+                self.__section_buffer = numpy.empty(data.shape[:collection_rank] + self.__datum_shape, self.__data_dtype)
+            else:
+                self.__section_buffer = numpy.empty(data.shape, data.dtype)
+            self.__section_origin = section_origin
+            self.__section_valid_rows = 0
+        rows = slice(max(self.__section_valid_rows, sub_area.top), sub_area.bottom)
+        if rows.stop > rows.start:
+            src_slice = (rows, slice(sub_area.left, sub_area.right))
+            if self.__storage_format:
+                self.__section_buffer[src_slice] = self.__storage_format.convert(data[src_slice], len(self.__datum_shape))
+            else:
+                self.__section_buffer[src_slice] = data[src_slice]
+            self.__section_valid_rows = sub_area.bottom
+        return self.__section_buffer
+
+    @property
+    def clipped_count(self) -> int:
+        """Return the number of values clipped by the storage format so far."""
+        return self.__storage_format.clipped_count if self.__storage_format else 0
+
     def start(self) -> None:
         self.__data_item.increment_data_ref_count()
         self.__data_item_transaction = self.__document_model.item_transaction(self.__data_item)
@@ -132,21 +192,65 @@ class CameraDataChannel:
         update_data_item_partial = getattr(self.__document_model, "update_data_item_partial", None)
         if callable(update_data_item_partial):
             collection_rank = len(tuple(scan_shape))
-            data_metadata = DataAndMetadata.DataMetadata(
-                (tuple(scan_shape) + data_and_metadata.data_shape[collection_rank:], data_and_metadata.data_dtype),
-                data_and_metadata.intensity_calibration,
-                data_and_metadata.dimensional_calibrations, metadata=data_and_metadata.metadata,
-                data_descriptor=DataAndMetadata.DataDescriptor(False, collection_rank, len(data_and_metadata.data_shape) - collection_rank))
-            src_slice = sub_area.slice + (Ellipsis,)
-            dst_slice = dest_sub_area.slice + (Ellipsis,)
-            update_data_item_partial(self.__data_item, data_metadata, data_and_metadata, src_slice, dst_slice)
+            section_origin = dest_sub_area.top_left - sub_area.top_left
+            # the data may be a view of the section buffer of the camera, which is reused for the next section before
+            # the deferred update is sent. copy (or convert) the new rows now.
+            section_data = self.__update_section_buffer(data_and_metadata.data, collection_rank, section_origin, sub_area)
+            if self.__storage_format:
+                data_and_metadata = self.__new_storage_format_data_and_metadata(data_and_metadata, section_data)
+            else:
+                data_and_metadata = DataAndMetadata.new_data_and_metadata(section_data,
+                                                                          data_and_metadata.intensity_calibration,
+                                                                          data_and_metadata.dimensional_calibrations,
+                                                                          metadata=data_and_metadata.metadata,
+                                                                          data_descriptor=data_and_metadata.data_descriptor)
+            if self.__storage_format:
+                data_metadata = DataAndMetadata.DataMetadata(
+                    (tuple(scan_shape) + self.__datum_shape, self.__data_dtype),
+                    data_and_metadata.intensity_calibration,
+                    tuple(data_and_metadata.dimensional_calibrations[:collection_rank]) + self.__data_calibrations, metadata=data_and_metadata.metadata,
+                    data_descriptor=DataAndMetadata.DataDescriptor(False, collection_rank, len(self.__datum_shape)))
+            else:
+                data_metadata = DataAndMetadata.DataMetadata(
+                    (tuple(scan_shape) + data_and_metadata.data_shape[collection_rank:], data_and_metadata.data_dtype),
+                    data_and_metadata.intensity_calibration,
+                    data_and_metadata.dimensional_calibrations, metadata=data_and_metadata.metadata,
+                    data_descriptor=DataAndMetadata.DataDescriptor(False, collection_rank, len(data_and_metadata.data_shape) - collection_rank))
+            section_key = tuple(section_origin)
+            partial_updates = {section_key: (data_metadata, data_and_metadata, sub_area, dest_sub_area)}
+            self.__update_coalescer.mark_dirty(self.__data_item, partial_updates, self.__send_partial_updates,
+                                               self.__merge_partial_updates)
+            if state == "complete":
+                self.__update_coalescer.flush()
         elif state == "complete":
             # hack for Swift 0.14
+            if self.__storage_format:
+                data_and_metadata = self.__convert(data_and_metadata)
+
             def update_data_item():
                 self.__data_item.set_data_and_metadata(data_and_metadata)
             self.__document_model.call_soon_event.fire_any(update_data_item)
 
+    @staticmethod
+    def __merge_partial_updates(partial_updates: typing.Mapping[typing.Tuple[int, int], typing.Tuple], new_partial_updates: typing.Mapping[typing.Tuple[int, int], typing.Tuple]) -> typing.Dict[typing.Tuple[int, int], typing.Tuple]:
+        # a newer update of a section replaces the older one; the areas of both are sent.
+        merged_partial_updates = dict(partial_updates)
+        for section_key, (data_metadata, data_and_metadata, sub_area, dest_sub_area) in new_partial_updates.items():
+            if section_key in merged_partial_updates:
+                sub_area = sub_area.union(merged_partial_updates[section_key][2])
+                dest_sub_area = dest_sub_area.union(merged_partial_updates[section_key][3])
+            merged_partial_updates[section_key] = data_metadata, data_and_metadata, sub_area, dest_sub_area
+        return merged_partial_updates
+
+    def __send_partial_updates(self, partial_updates: typing.Mapping[typing.Tuple[int, int], typing.Tuple]) -> None:
+        for data_metadata, data_and_metadata, sub_area, dest_sub_area in partial_updates.values():
+            self.__document_model.update_data_item_partial(self.__data_item, data_metadata, data_and_metadata,
+                                                           sub_area.slice + (Ellipsis,), dest_sub_area.slice + (Ellipsis,))
+
     def stop(self) -> None:
+        self.__update_coalescer.flush()
+        if self.clipped_count:
+            logging.warning(f"{self.clipped_count} values were clipped to the range of {self.__storage_format.dtype} when storing {self.__data_item.title}.")
         if self.__data_item_transaction:
             self.__data_item_transaction.close()
             self.__data_item_transaction = None
@@ -154,9 +258,78 @@ class CameraDataChannel:
             self.__data_item.decrement_data_ref_count()
 
 
+class ReducedDataChannel:
+    """Show the maps of a section reducer as live data items while the synchronized acquisition runs."""
+
+    def __init__(self, document_model, channel_name: str, reducer: reduction.SectionReducer, grab_sync_info: scan_base.ScanHardwareSource.GrabSynchronizedInfo, display_update_rate_hz: float = 10.0):
+        self.__document_model = document_model
+        self.__reducer = reducer
+        self.__scan_size = tuple(grab_sync_info.scan_size)
+        self.__data_items = [self.__create_data_item(f"{output_name} ({channel_name})", grab_sync_info) for output_name in reducer.output_names]
+        self.__data_item_transactions = list()
+        self.__data_changed_listener = None
+        # updated areas are merged per data item and passed to the document model at a limited rate.
+        self.__update_coalescer = update_coalescer.UpdateCoalescer(rate_hz=display_update_rate_hz)
+
+    def __create_data_item(self, title: str, grab_sync_info: scan_base.ScanHardwareSource.GrabSynchronizedInfo) -> DataItem.DataItem:
+        data_item = DataItem.DataItem(large_format=True)
+        data_item.title = title
+        self.__document_model.append_data_item(data_item)
+        if hasattr(data_item, "reserve_data"):
+            data_item.reserve_data(data_shape=self.__scan_size, data_dtype=numpy.float32, data_descriptor=DataAndMetadata.DataDescriptor(False, 0, 2))
+        data_item.dimensional_calibrations = grab_sync_info.scan_calibrations
+        data_item_metadata = data_item.metadata
+        data_item_metadata["hardware_source"] = grab_sync_info.camera_metadata
+        data_item_metadata["scan_detector"] = grab_sync_info.scan_metadata
+        data_item.metadata = data_item_metadata
+        return data_item
+
+    @property
+    def data_items(self) -> typing.List[DataItem.DataItem]:
+        return list(self.__data_items)
+
+    def start(self) -> None:
+        for data_item in self.__data_items:
+            data_item.increment_data_ref_count()
+            self.__data_item_transactions.append(self.__document_model.item_transaction(data_item))
+            self.__document_model.begin_data_item_live(data_item)
+        self.__data_changed_listener = self.__reducer.data_changed_event.listen(self.__data_changed)
+
+    def __data_changed(self, rect: Geometry.IntRect) -> None:
+        # called on the acquisition thread.
+        if callable(getattr(self.__document_model, "update_data_item_partial", None)):
+            for index, data_item in enumerate(self.__data_items):
+                self.__update_coalescer.mark_dirty(data_item, rect.slice, functools.partial(self.__send_partial_update, index),
+                                                   update_coalescer.merge_slices)
+
+    def __send_partial_update(self, index: int, dst_slice: typing.Optional[typing.Tuple[slice, ...]]) -> None:
+        rect = Geometry.IntRect.from_tlbr(dst_slice[0].start, dst_slice[1].start, dst_slice[0].stop, dst_slice[1].stop) if dst_slice else None
+        xdata = self.__reducer.get_xdata(index, rect)
+        data_metadata = DataAndMetadata.DataMetadata((self.__scan_size, numpy.float32), xdata.intensity_calibration,
+                                                     xdata.dimensional_calibrations, metadata=xdata.metadata,
+                                                     data_descriptor=DataAndMetadata.DataDescriptor(False, 0, 2))
+        self.__document_model.update_data_item_partial(self.__data_items[index], data_metadata, xdata,
+                                                       (slice(None), slice(None)), dst_slice or (slice(None), slice(None)))
+
+    def stop(self) -> None:
+        if self.__data_changed_listener:
+            self.__data_changed_listener.close()
+            self.__data_changed_listener = None
+        self.__update_coalescer.flush()
+        for data_item, data_item_transaction in zip(self.__data_items, self.__data_item_transactions):
+            data_item_transaction.close()
+            self.__document_model.end_data_item_live(data_item)
+            data_item.decrement_data_ref_count()
+        self.__data_item_transactions = list()
+
+
 class DriftCorrectionBehavior(scan_base.SynchronizedScanBehaviorInterface):
-    def __init__(self, document_model: DocumentModel.DocumentModel, scan_hardware_source: scan_base.ScanHardwareSource, scan_frame_parameters: scan_base.ScanFrameParameters):
+    def __init__(self, document_model: DocumentModel.DocumentModel, scan_hardware_source: scan_base.ScanHardwareSource, scan_frame_parameters: scan_base.ScanFrameParameters,
+                 tracker: typing.Optional[drift_tracker.DriftTracker] = None):
         # init with the frame parameters from the synchronized grab
+        # the tracker registers the drift frames against a cached reference and predicts the drift between them. if
+        # it is configured to skip drift frames, sections with a confident prediction are corrected without one.
+        self.__tracker = tracker or drift_tracker.DriftTracker()
         self.__document_model = document_model
         self.__scan_hardware_source = scan_hardware_source
         self.__scan_frame_parameters = copy.deepcopy(scan_frame_parameters)
@@ -166,29 +339,27 @@ class DriftCorrectionBehavior(scan_base.SynchronizedScanBehaviorInterface):
         self.__scan_frame_parameters.subscan_fractional_center = None
         self.__scan_frame_parameters.subscan_rotation = 0.0
         self.__scan_frame_parameters.channel_override = "drift"
-        self.__last_xdata = None
         self.__center_nm = Geometry.FloatSize()
         self.__last_offset_nm = Geometry.FloatSize()
-        self.__offset_nm_data = numpy.zeros((3, 0), numpy.float)
+        self.__drift_log = drift_tracker.DriftLog()
         data_item = next(iter(data_item for data_item in document_model.data_items if data_item.title == "Drift Log"), None)
         if data_item:
-            offset_nm_xdata = DataAndMetadata.new_data_and_metadata(self.__offset_nm_data, intensity_calibration=Calibration.Calibration(units="nm"))
-            data_item.set_data_and_metadata(offset_nm_xdata)
+            data_item.set_data_and_metadata(self.__drift_log.get_xdata())
         else:
-            data_item = DataItem.DataItem(self.__offset_nm_data)
+            data_item = DataItem.DataItem(self.__drift_log.data)
             data_item.title = f"Drift Log"
             self.__document_model.append_data_item(data_item)
             display_item = self.__document_model.get_display_item_for_data_item(data_item)
             display_item.display_type = "line_plot"
             display_layers = display_item.display_layers
-            display_layers[0]["label"] = _("x")
-            display_layers[1]["label"] = _("y")
+            display_layers[0]["label"] = _("y")
+            display_layers[1]["label"] = _("x")
             display_layers[2]["label"] = _("m")
             display_item.display_layers = display_layers
         self.__data_item = data_item
 
     def reset(self) -> None:
-        self.__last_xdata = None
+        self.__tracker.reset()
         self.__center_nm = Geometry.FloatSize()
         self.__last_offset_nm = Geometry.FloatSize()
 
@@ -208,40 +379,33 @@ class DriftCorrectionBehavior(scan_base.SynchronizedScanBehaviorInterface):
                 frame_parameters.subscan_fractional_size = drift_region.height, drift_region.width
                 frame_parameters.subscan_fractional_center = drift_region.center.y, drift_region.center.x
                 frame_parameters.subscan_rotation = drift_rotation
-                # attempt to keep drift area in roughly the same position by adding in the accumulated correction.
-                frame_parameters.center_nm = tuple(Geometry.FloatPoint.make(frame_parameters.center_nm) + self.__center_nm)
-                xdatas = self.__scan_hardware_source.record_immediate(frame_parameters, [drift_channel_index])
-                # new_offset = self.__scan_hardware_source.stem_controller.drift_offset_m
-                if self.__last_xdata:
+                timestamp = time.time()
+                if not self.__tracker.has_reference or self.__tracker.needs_measurement(timestamp):
+                    # attempt to keep drift area in roughly the same position by adding in the accumulated correction.
+                    frame_parameters.center_nm = tuple(Geometry.FloatPoint.make(frame_parameters.center_nm) + self.__center_nm)
+                    xdatas = self.__scan_hardware_source.record_immediate(frame_parameters, [drift_channel_index])
+                    if not self.__tracker.has_reference:
+                        scale = tuple(calibration.scale for calibration in xdatas[0].dimensional_calibrations)
+                        self.__tracker.set_reference(xdatas[0].data, timestamp, scale)
+                        return adjustments
                     # calculate offset. if data shifts down/right, offset will be negative (register_translation convention).
-                    # offset = Geometry.FloatPoint.make(xd.register_translation(self.__last_xdata, xdatas[0], upsample_factor=10))
-                    quality, offset = xd.register_template(self.__last_xdata, xdatas[0])
-                    offset = Geometry.FloatPoint.make(offset)
-                    offset_nm = Geometry.FloatSize(
-                        h=xdatas[0].dimensional_calibrations[0].convert_to_calibrated_size(offset.y),
-                        w=xdatas[0].dimensional_calibrations[1].convert_to_calibrated_size(offset.x))
+                    offset_nm = Geometry.FloatSize.make(tuple(self.__tracker.register(xdatas[0].data)))
                     # calculate adjustment (center_nm). if center_nm positive, data shifts up/left.
                     offset_nm -= self.__center_nm  # adjust for center_nm adjustment above
-                    delta_nm = offset_nm - self.__last_offset_nm
-                    self.__last_offset_nm = offset_nm
-                    offset_nm_xy = math.sqrt(pow(offset_nm.height, 2) + pow(offset_nm.width, 2))
-                    self.__offset_nm_data = numpy.hstack([self.__offset_nm_data, numpy.array([offset_nm.height, offset_nm.width, offset_nm_xy]).reshape(3, 1)])
-                    offset_nm_xdata = DataAndMetadata.new_data_and_metadata(self.__offset_nm_data, intensity_calibration=Calibration.Calibration(units="nm"))
-                    def update_data_item(offset_nm_xdata: DataAndMetadata.DataAndMetadata) -> None:
-                        self.__data_item.set_data_and_metadata(offset_nm_xdata)
-                    self.__scan_hardware_source._call_soon(functools.partial(update_data_item, offset_nm_xdata))
-                    # report the difference from the last time we reported, but negative since center_nm positive shifts up/left
-                    adjustments.offset_nm = -delta_nm
-                    self.__center_nm -= delta_nm
-                    # print(f"{self.__last_offset_nm} {adjustments.offset_nm} [{(new_offset - self.__last_offset) * 1E9}] {offset} {frame_parameters.fov_nm}")
-                    if False:  # if offset_nm > drift area / 10?
-                        # retake to provide reference at new offset
-                        frame_parameters.center_nm = tuple(Geometry.FloatPoint.make(frame_parameters.center_nm) + adjustments.offset_nm)
-                        self.__scan_frame_parameters.center_nm = frame_parameters.center_nm
-                        xdatas = self.__scan_hardware_source.record_immediate(frame_parameters, [drift_channel_index])
-                        new_offset = self.__scan_hardware_source.stem_controller.drift_offset_m
+                    self.__tracker.update(tuple(offset_nm), timestamp)
                 else:
-                    self.__last_xdata = xdatas[0]
+                    # the drift is predicted well enough; skip the drift frame.
+                    offset_nm = Geometry.FloatSize.make(tuple(self.__tracker.predict(timestamp)[0]))
+                delta_nm = offset_nm - self.__last_offset_nm
+                self.__last_offset_nm = offset_nm
+                self.__drift_log.append((offset_nm.height, offset_nm.width))
+                offset_nm_xdata = self.__drift_log.get_xdata()
+                def update_data_item(offset_nm_xdata: DataAndMetadata.DataAndMetadata) -> None:
+                    self.__data_item.set_data_and_metadata(offset_nm_xdata)
+                self.__scan_hardware_source._call_soon(functools.partial(update_data_item, offset_nm_xdata))
+                # report the difference from the last time we reported, but negative since center_nm positive shifts up/left
+                adjustments.offset_nm = -delta_nm
+                self.__center_nm -= delta_nm
         return adjustments
 
 
@@ -255,7 +419,10 @@ class ScanAcquisitionController:
         self.__scan_specifier = copy.deepcopy(scan_specifier)
         self.acquisition_state_changed_event = Event.Event()
 
-    def start(self, sum_frames: bool) -> None:
+    def start(self, sum_frames: bool, reducers: typing.Sequence[reduction.SectionReducer] = None,
+              storage_format: typing.Optional[reduction.StorageFormat] = None) -> None:
+        # reducers, if any, are applied to the camera data as it arrives and their maps are shown as live data items.
+        # the storage format, if any, determines the dtype, binning, and crop of the stored camera data.
 
         document_window = self.__document_controller
 
@@ -328,11 +495,21 @@ class ScanAcquisitionController:
             camera=camera_hardware_source,
             camera_frame_parameters=camera_frame_parameters)
 
-        camera_data_channel = CameraDataChannel(self.__document_controller.library._document_model, camera_hardware_source.display_name, grab_sync_info)
+        camera_data_channel = CameraDataChannel(self.__document_controller.library._document_model, camera_hardware_source.display_name, grab_sync_info,
+                                                storage_format=storage_format)
         self.__document_controller.display_data_item(Facade.DataItem(camera_data_channel.data_item))
 
         camera_data_channel.start()
 
+        reduction_stage = reduction.ReductionStage(reducers) if reducers else None
+        reduced_data_channels = list()
+        for reducer in (reducers or list()):
+            reduced_data_channel = ReducedDataChannel(self.__document_controller.library._document_model, camera_hardware_source.display_name, reducer, grab_sync_info)
+            for data_item in reduced_data_channel.data_items:
+                self.__document_controller.display_data_item(Facade.DataItem(data_item))
+            reduced_data_channel.start()
+            reduced_data_channels.append(reduced_data_channel)
+
         drift_correction_behavior : typing.Optional[DriftCorrectionBehavior] = None
         section_height = None
         if self.__scan_specifier.drift_interval_lines > 0:
@@ -347,7 +524,8 @@ class ScanAcquisitionController:
                                                                        camera_frame_parameters=camera_frame_parameters,
                                                                        camera_data_channel=camera_data_channel,
                                                                        scan_behavior=drift_correction_behavior,
-                                                                       section_height=section_height)
+                                                                       section_height=section_height,
+                                                                       reduction_stage=reduction_stage)
                 if combined_data is not None:
                     scan_data_list, camera_data_list = combined_data
 
@@ -361,6 +539,10 @@ class ScanAcquisitionController:
             finally:
                 def stop_channel():
                     camera_data_channel.stop()
+                    for reduced_data_channel in reduced_data_channels:
+                        reduced_data_channel.stop()
+                    if reduction_stage:
+                        reduction_stage.close()
 
                 document_window.queue_task(stop_channel)
                 self.acquisition_state_changed_event.fire(SequenceState.idle)
@@ -15,6 +15,7 @@ import math
 # local libraries
 from nion.instrumentation import scan_base
 from nion.instrumentation import stem_controller
+from nion.instrumentation import update_coalescer
 from nion.swift import DataItemThumbnailWidget
 from nion.swift import DisplayPanel
 from nion.swift import Panel
@@ -154,6 +155,9 @@ class ScanControlStateController:
         self.__drift_channel_id_listener = None
         self.__drift_region_listener = None
         self.__drift_settings_listener = None
+        self.__drift_log_changed_event_listener = None
+        # the drift log changes for every frame; the data item is updated with the newest log only.
+        self.__drift_log_decimator = update_coalescer.DisplayDecimator(queue_task)
         self.on_display_name_changed : typing.Optional[typing.Callable[[str], None]] = None
         self.on_subscan_state_changed : typing.Optional[typing.Callable[[stem_controller.SubscanState], None]] = None
         self.on_drift_state_changed : typing.Optional[typing.Callable[[typing.Optional[str], typing.Optional[Geometry.FloatRect], stem_controller.DriftCorrectionSettings, stem_controller.SubscanState], None]] = None
@@ -213,6 +217,10 @@ class ScanControlStateController:
         if self.__drift_settings_listener:
             self.__drift_settings_listener.close()
             self.__drift_settings_listener = None
+        if self.__drift_log_changed_event_listener:
+            self.__drift_log_changed_event_listener.close()
+            self.__drift_log_changed_event_listener = None
+        self.__drift_log_decimator.close()
         self.on_display_name_changed = None
         self.on_subscan_state_changed = None
         self.on_drift_state_changed = None
@@ -235,6 +243,27 @@ class ScanControlStateController:
         self.on_display_new_data_item = None
         self.__scan_hardware_source = None
 
+    def __drift_log_changed(self, offset_nm: Geometry.FloatSize) -> None:
+        # called from the acquisition thread.
+        self.__drift_log_decimator.submit("drift_log", self.__scan_hardware_source.drift_log, self.__update_drift_log_data_item)
+
+    def __update_drift_log_data_item(self, drift_log) -> None:
+        drift_log_xdata = drift_log.get_xdata()
+        data_item = next(iter(data_item for data_item in self.__document_model.data_items if data_item.title == "Drift Log"), None)
+        if data_item:
+            data_item.set_data_and_metadata(drift_log_xdata)
+        else:
+            data_item = DataItem.new_data_item(drift_log_xdata)
+            data_item.title = "Drift Log"
+            self.__document_model.append_data_item(data_item)
+            display_item = self.__document_model.get_display_item_for_data_item(data_item)
+            display_item.display_type = "line_plot"
+            display_layers = display_item.display_layers
+            display_layers[0]["label"] = _("y")
+            display_layers[1]["label"] = _("x")
+            display_layers[2]["label"] = _("m")
+            display_item.display_layers = display_layers
+
     def __update_scan_button_state(self):
         if self.on_scan_button_state_changed:
             is_any_channel_enabled = any(self.__channel_enabled)
@@ -317,6 +346,10 @@ class ScanControlStateController:
             self.__drift_settings_listener = stem_controller.property_changed_event.listen(drift_state_changed)
             drift_state_changed("value")
 
+            # only the control panel (not each display panel) keeps the drift log data item of drift tracking.
+            if self.__channel_id is None:
+                self.__drift_log_changed_event_listener = self.__scan_hardware_source.drift_log_changed_event.listen(self.__drift_log_changed)
+
         if self.on_display_name_changed:
             self.on_display_name_changed(self.display_name)
         if self.on_subscan_state_changed:
@@ -958,6 +991,11 @@ class ScanControlWidget(Widgets.CompositeWidgetBase):
 
         self.__state_controller = ScanControlStateController(scan_controller, document_controller.queue_task, document_controller.document_model, None)
 
+        # the data item states arrive for every frame; only the newest states are shown if the acquisition outpaces
+        # the user interface and the replaced frames are counted.
+        self.__hardware_source_id = scan_controller.hardware_source_id
+        self.__display_decimator = update_coalescer.DisplayDecimator(document_controller.queue_task)
+
         self.__shift_click_state = None
 
         ui = document_controller.ui
@@ -1446,7 +1484,7 @@ class ScanControlWidget(Widgets.CompositeWidgetBase):
         self.__state_controller.on_linked_changed = linked_changed
         self.__state_controller.on_scan_button_state_changed = scan_button_state_changed
         self.__state_controller.on_abort_button_state_changed = abort_button_state_changed
-        self.__state_controller.on_data_item_states_changed = lambda a: self.document_controller.queue_task(lambda: data_item_states_changed(a))
+        self.__state_controller.on_data_item_states_changed = lambda a: self.__display_decimator.submit(self.__hardware_source_id, a, data_item_states_changed)
         self.__state_controller.on_record_button_state_changed = record_button_state_changed
         self.__state_controller.on_record_abort_button_state_changed = record_abort_button_state_changed
         self.__state_controller.on_simulate_button_state_changed = simulate_button_state_changed
@@ -1474,8 +1512,14 @@ class ScanControlWidget(Widgets.CompositeWidgetBase):
         self.__image_display_mouse_released_event_listener= None
         self.__state_controller.close()
         self.__state_controller = None
+        self.__display_decimator.close()
         super().close()
 
+    @property
+    def display_statistics(self) -> typing.Dict[str, int]:
+        """Return the submitted, displayed and dropped counts of the per frame data item state (status text) updates."""
+        return self.__display_decimator.get_display_statistics()
+
     def periodic(self):
         self.__state_controller.handle_periodic()
         super().periodic()
@@ -1620,6 +1664,10 @@ class ScanDisplayPanelController:
         # configure the hardware source state controller
         self.__state_controller = ScanControlStateController(hardware_source, display_panel.document_controller.queue_task, display_panel.document_controller.document_model, data_channel_id)
 
+        # the data item states arrive for every frame; only the newest states are shown in the status text if the
+        # acquisition outpaces the user interface and the replaced frames are counted.
+        self.__display_decimator = update_coalescer.DisplayDecimator(display_panel.document_controller.queue_task)
+
         def update_display_name():
             new_text = "%s (%s)" % (self.__display_name, self.__channel_name)
             if hardware_source_display_name_canvas_item.text != new_text:
@@ -1688,10 +1736,13 @@ class ScanDisplayPanelController:
             self.__abort_button_enabled = enabled
             update_abort_button()
 
+        def display_data_item_states(data_item_states):
+            self.__data_item_states = data_item_states
+            update_status_text()
+
         def data_item_states_changed(data_item_states):
             # This will be called on a thread, but updating the status must occur on main thread.
-            self.__data_item_states = data_item_states
-            display_panel.document_controller.queue_task(update_status_text)
+            self.__display_decimator.submit(self.__data_channel_id, data_item_states, display_data_item_states)
 
         def data_channel_state_changed(data_channel_index: int, data_channel_id: str, channel_name: str, enabled: bool) -> None:
             if data_channel_id == self.__data_channel_id:
@@ -1750,6 +1801,12 @@ class ScanDisplayPanelController:
         self.__display_panel = None
         self.__state_controller.close()
         self.__state_controller = None
+        self.__display_decimator.close()
+
+    @property
+    def display_statistics(self) -> typing.Dict[str, int]:
+        """Return the submitted, displayed and dropped counts of the per frame data item state (status text) updates."""
+        return self.__display_decimator.get_display_statistics()
 
     def save(self, d):
         d["hardware_source_id"] = self.__hardware_source_id